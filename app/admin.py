@@ -1,6 +1,7 @@
 # app/admin.py
 from django.contrib import admin
-from .models import Profile, Doctor, Patient, Appointment, VisitNote, Document
+from .models import Profile, Doctor, Patient, Appointment, VisitNote, Document, DoctorDayAvailability, SlotHold, DoctorSchedule
+from .models import DoctorLeave, Holiday, WaitlistEntry
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -97,3 +98,45 @@ class DocumentAdmin(admin.ModelAdmin):
             return obj.file.name.split('/')[-1]
         return "No file"
     get_file_name.short_description = 'File Name'
+
+@admin.register(DoctorDayAvailability)
+class DoctorDayAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'date', 'free_count', 'updated_at')
+    list_filter = ('date',)
+    search_fields = ('doctor__profile__user__username',)
+    ordering = ('-date',)
+    date_hierarchy = 'date'
+
+@admin.register(SlotHold)
+class SlotHoldAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'patient', 'date', 'slot', 'expires_at')
+    list_filter = ('date',)
+    ordering = ('expires_at',)
+
+@admin.register(DoctorSchedule)
+class DoctorScheduleAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'weekday', 'start_time', 'end_time', 'break_start', 'break_end', 'slot_duration')
+    list_filter = ('weekday',)
+    search_fields = ('doctor__profile__user__username',)
+    ordering = ('doctor', 'weekday')
+
+@admin.register(DoctorLeave)
+class DoctorLeaveAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'start_date', 'end_date', 'reason')
+    search_fields = ('doctor__profile__user__username', 'reason')
+    ordering = ('-start_date',)
+    date_hierarchy = 'start_date'
+
+@admin.register(Holiday)
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ('name', 'start_date', 'end_date')
+    search_fields = ('name',)
+    ordering = ('-start_date',)
+    date_hierarchy = 'start_date'
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'doctor', 'specialization', 'start_date', 'end_date', 'status', 'created_at')
+    list_filter = ('status', 'auto_book')
+    search_fields = ('patient__profile__user__username', 'doctor__profile__user__username', 'specialization')
+    ordering = ('created_at',)
@@ -0,0 +1,489 @@
+# app/booking.py
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import Appointment, Doctor, Patient, SlotHold, WaitlistEntry
+from .changes import bump_user_versions, participant_user_ids
+from .events import record_appointment_events
+from .utils import (
+    SlotError, validate_slot, slot_to_minutes, get_doctor_template, get_available_mask,
+    get_available_slots, get_booked_masks, load_schedules, refresh_availability_bulk, as_date,
+    invalidate_day_slots
+)
+
+# How many alternate slots to try after the requested one is lost to a concurrent booking
+MAX_BOOKING_ATTEMPTS = 3
+
+# How long a slot stays reserved while the patient fills in the booking form
+SLOT_HOLD_TTL_SECONDS = getattr(settings, 'SLOT_HOLD_TTL_SECONDS', 300)
+
+# How long a waitlisted patient has to confirm a freed slot offered to them
+WAITLIST_OFFER_TTL_SECONDS = getattr(settings, 'WAITLIST_OFFER_TTL_SECONDS', 900)
+
+class SlotConflict(SlotError):
+    """Raised when the requested slot (and any alternates tried) was taken by someone else."""
+
+    def __init__(self, message: str, available_slots: Optional[List[str]] = None):
+        super().__init__(message)
+        self.available_slots = available_slots or []
+
+def nearest_free_slots(doctor, check_date: date, slot_str: str, limit: int, patient=None) -> List[str]:
+    """
+    Free slots for the day ordered by distance from the requested slot
+
+    Args:
+        doctor: Doctor instance or id
+        check_date: Appointment date
+        slot_str: Requested time slot in "HH:MM" format
+        limit: Maximum number of slots to return
+        patient: Patient asking; their own holds stay available to them
+
+    Returns:
+        List[str]: Up to ``limit`` free "HH:MM" slots, closest first (later wins ties)
+    """
+    requested = slot_to_minutes(slot_str)
+    free = get_available_slots(doctor, check_date, patient=patient)
+    free.sort(key=lambda label: (abs(slot_to_minutes(label) - requested), -slot_to_minutes(label)))
+    return free[:limit]
+
+def insert_appointment(patient, doctor, check_date: date, slot_str: str) -> Optional[Appointment]:
+    """
+    Try to claim a slot with a single INSERT
+
+    The (doctor, date, slot) unique constraint is the arbiter: whoever inserts
+    first wins and everyone else gets None instead of an IntegrityError.
+
+    Returns:
+        Appointment: The new appointment, or None if the slot was already taken
+    """
+    try:
+        with transaction.atomic():
+            return Appointment.objects.create(
+                doctor=doctor,
+                patient=patient,
+                date=check_date,
+                slot=slot_str,
+                status="booked"
+            )
+    except IntegrityError:
+        return None
+
+def ensure_accepting(doctor) -> None:
+    """
+    Raise SlotError if the doctor has been marked as not taking appointments
+
+    Args:
+        doctor: Doctor instance
+    """
+    if not doctor.available:
+        raise SlotError("Doctor is not accepting appointments.")
+
+def book_appointment(patient, doctor, check_date: date, slot_str: str,
+                     allow_alternate: bool = False,
+                     max_attempts: int = MAX_BOOKING_ATTEMPTS) -> Appointment:
+    """
+    Book a slot without a check-then-insert race
+
+    Args:
+        patient: Patient instance
+        doctor: Doctor instance
+        check_date: Appointment date
+        slot_str: Requested time slot in "HH:MM" format
+        allow_alternate: On conflict, retry on the nearest free slots of the same day
+        max_attempts: Total inserts to try when allow_alternate is set
+
+    Returns:
+        Appointment: The booked appointment (its slot may differ if allow_alternate was set)
+
+    Raises:
+        SlotError: If the slot is not valid for the date
+        SlotConflict: If the slot (and every alternate tried) was already taken
+    """
+    ensure_accepting(doctor)
+    validate_slot(slot_str, check_date, doctor)
+
+    holder_id = SlotHold.objects.filter(
+        doctor=doctor, date=check_date, slot=slot_str, expires_at__gt=timezone.now()
+    ).values_list('patient_id', flat=True).first()
+
+    if holder_id is None or holder_id == patient.pk:
+        appointment = insert_appointment(patient, doctor, check_date, slot_str)
+        if appointment:
+            if holder_id is not None:
+                # A waitlist offer held for this patient is now taken up
+                WaitlistEntry.objects.filter(
+                    patient=patient, status='offered', offered_doctor=doctor,
+                    offered_date=check_date, offered_slot=slot_str
+                ).update(status='assigned', appointment=appointment)
+                release_hold(patient, doctor, check_date, slot_str)
+            return appointment
+
+    if allow_alternate:
+        tried = {slot_str}
+        for _ in range(max_attempts - 1):
+            candidates = [
+                s for s in nearest_free_slots(doctor, check_date, slot_str, max_attempts, patient)
+                if s not in tried
+            ]
+            if not candidates:
+                break
+            tried.add(candidates[0])
+            appointment = insert_appointment(patient, doctor, check_date, candidates[0])
+            if appointment:
+                return appointment
+
+    raise SlotConflict(
+        "Slot is already booked by another patient" if holder_id in (None, patient.pk)
+        else "Slot is being held by another patient",
+        available_slots=get_available_slots(doctor, check_date, patient=patient)
+    )
+
+def hold_slot(patient, doctor, check_date: date, slot_str: str,
+              ttl_seconds: Optional[int] = None) -> SlotHold:
+    """
+    Reserve a free slot for a patient for a few minutes
+
+    Holding the same slot again just extends the hold. A patient keeps at most
+    one hold per doctor and day; taking a new one releases the previous one.
+
+    Args:
+        patient: Patient instance
+        doctor: Doctor instance
+        check_date: Appointment date
+        slot_str: Time slot in "HH:MM" format
+        ttl_seconds: Hold lifetime (defaults to SLOT_HOLD_TTL_SECONDS)
+
+    Returns:
+        SlotHold: The active hold
+
+    Raises:
+        SlotError: If the slot is not valid for the date
+        SlotConflict: If the slot is booked or held by someone else
+    """
+    ensure_accepting(doctor)
+    slot_time = validate_slot(slot_str, check_date, doctor)
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl_seconds or SLOT_HOLD_TTL_SECONDS)
+    bit = get_doctor_template(doctor, check_date).bit_of[slot_to_minutes(slot_time)]
+
+    with transaction.atomic():
+        # Expired holds on this day are cleaned up lazily, the sweeper handles the rest
+        SlotHold.objects.filter(doctor=doctor, date=check_date, expires_at__lte=now).delete()
+        SlotHold.objects.filter(doctor=doctor, date=check_date, patient=patient).exclude(slot=slot_time).delete()
+
+        if not get_available_mask(doctor, check_date, patient=patient) >> bit & 1:
+            raise SlotConflict(
+                "Slot is no longer available",
+                available_slots=get_available_slots(doctor, check_date, patient=patient)
+            )
+
+        updated = SlotHold.objects.filter(
+            doctor=doctor, date=check_date, slot=slot_time, patient=patient
+        ).update(expires_at=expires_at)
+        if updated:
+            # update() skips the signals, so the cached expiry is dropped here
+            invalidate_day_slots(doctor.pk, check_date)
+            return SlotHold.objects.get(doctor=doctor, date=check_date, slot=slot_time)
+
+        try:
+            with transaction.atomic():
+                return SlotHold.objects.create(
+                    doctor=doctor, patient=patient, date=check_date, slot=slot_time, expires_at=expires_at
+                )
+        except IntegrityError:
+            raise SlotConflict("Slot is being held by another patient")
+
+def release_hold(patient, doctor, check_date: date, slot_str: str) -> bool:
+    """
+    Drop a patient's hold on a slot
+
+    Releasing a slot offered from the waitlist declines the offer and passes
+    the slot on to the next waiter.
+
+    Returns:
+        bool: True if a hold was removed
+    """
+    deleted, _ = SlotHold.objects.filter(
+        doctor=doctor, date=check_date, slot=slot_str, patient=patient
+    ).delete()
+    if deleted:
+        declined = WaitlistEntry.objects.filter(
+            patient=patient, status='offered', offered_doctor=doctor,
+            offered_date=check_date, offered_slot=slot_str
+        ).update(status='declined')
+        if declined:
+            fill_freed_slot(doctor.pk, check_date, slot_str)
+    return bool(deleted)
+
+def sweep_expired_holds() -> int:
+    """
+    Delete every expired hold and pass lapsed waitlist offers on to the next waiter
+
+    Returns:
+        int: Number of holds removed
+    """
+    now = timezone.now()
+    lapsed = WaitlistEntry.objects.filter(status='offered', offer_expires_at__lte=now)
+    freed = list(lapsed.values_list('offered_doctor_id', 'offered_date', 'offered_slot'))
+    lapsed.update(status='expired')
+
+    deleted, _ = SlotHold.objects.filter(expires_at__lte=now).delete()
+    for doctor_id, check_date, slot_time in freed:
+        if doctor_id is not None:
+            fill_freed_slot(doctor_id, check_date, slot_time)
+    return deleted
+
+# -------------------------
+# WAITLIST
+# -------------------------
+
+# Waiters tried per freed slot before giving up (only concurrent matches make the first fail)
+WAITLIST_MATCH_LIMIT = 5
+
+def waiting_for(doctor, check_date: date):
+    """
+    Waiting entries a doctor's freed slot on a date can go to, first come first served
+
+    Args:
+        doctor: Doctor instance
+        check_date: Date of the freed slot
+
+    Returns:
+        QuerySet: WaitlistEntry queryset in queue order
+    """
+    return WaitlistEntry.objects.filter(
+        Q(doctor=doctor) | Q(doctor__isnull=True, specialization=doctor.specialization),
+        status='waiting',
+        start_date__lte=check_date,
+        end_date__gte=check_date,
+    ).order_by('created_at', 'id')
+
+def fill_freed_slot(doctor_id: int, check_date, slot) -> Optional[WaitlistEntry]:
+    """
+    Hand a freed slot to the first eligible waiter
+
+    Entries with auto_book get the appointment straight away; the others get a
+    hold on the slot for WAITLIST_OFFER_TTL_SECONDS to confirm it. Claiming the
+    entry and booking/holding the slot happen in one transaction, so a slot lost
+    to a concurrent booking leaves the entry waiting.
+
+    Args:
+        doctor_id: Doctor id
+        check_date: Date of the freed slot
+        slot: Slot as a time or "HH:MM" string
+
+    Returns:
+        WaitlistEntry: The entry that got the slot, or None
+    """
+    check_date = as_date(check_date)
+    slot_str = slot[:5] if isinstance(slot, str) else slot.strftime("%H:%M")
+    doctor = Doctor.objects.filter(pk=doctor_id).first()
+    if doctor is None or check_date < date.today():
+        return None
+
+    # Skip patients already seen by this doctor that day or booked elsewhere at that time
+    busy = Appointment.objects.filter(
+        Q(doctor=doctor) | Q(slot=slot_str), patient=OuterRef('patient'), date=check_date
+    ).exclude(status='cancelled')
+    candidates = waiting_for(doctor, check_date).exclude(Exists(busy)).select_related('patient')
+
+    for entry in candidates[:WAITLIST_MATCH_LIMIT]:
+        try:
+            with transaction.atomic():
+                status = 'assigned' if entry.auto_book else 'offered'
+                if not WaitlistEntry.objects.filter(pk=entry.pk, status='waiting').update(status=status):
+                    continue  # matched to another slot concurrently
+                updates = {'offered_doctor': doctor, 'offered_date': check_date, 'offered_slot': slot_str}
+                if entry.auto_book:
+                    updates['appointment'] = book_appointment(entry.patient, doctor, check_date, slot_str)
+                else:
+                    hold = hold_slot(entry.patient, doctor, check_date, slot_str,
+                                     ttl_seconds=WAITLIST_OFFER_TTL_SECONDS)
+                    updates['offer_expires_at'] = hold.expires_at
+                WaitlistEntry.objects.filter(pk=entry.pk).update(**updates)
+        except SlotError:
+            # The slot is gone or no longer bookable; nobody else can have it either
+            return None
+        entry.refresh_from_db()
+        return entry
+    return None
+
+# -------------------------
+# BULK IMPORT
+# -------------------------
+
+IMPORT_BATCH_SIZE = 500
+
+def read_appointment_rows(data, fmt: str) -> List[dict]:
+    """
+    Parse an import payload into row dicts
+
+    Args:
+        data: File contents (str or bytes)
+        fmt: 'csv' or 'json'; JSON may be a list or {"appointments": [...]}
+
+    Returns:
+        List[dict]: One dict per row
+
+    Raises:
+        ValueError: If the payload can't be parsed
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(data)))
+    if fmt == 'json':
+        rows = json.loads(data)
+        if isinstance(rows, dict):
+            rows = rows.get('appointments', [])
+        if not isinstance(rows, list):
+            raise ValueError("JSON payload must be a list of appointments")
+        return rows
+    raise ValueError(f"Unsupported format: {fmt}")
+
+def parse_import_row(row: dict) -> tuple:
+    """
+    Parse one import row without touching the database
+
+    Returns:
+        tuple: (doctor_id, patient_id, date, slot minute offset, status)
+
+    Raises:
+        SlotError: With a message suitable for the row report
+    """
+    if not isinstance(row, dict):
+        raise SlotError("Row must be an object")
+    doctor_id = row.get('doctor_id') or row.get('doctor')
+    patient_id = row.get('patient_id') or row.get('patient')
+    date_str = row.get('date')
+    slot_str = row.get('slot') or row.get('time')
+    status = (row.get('status') or 'booked').strip()
+
+    if not all([doctor_id, patient_id, date_str, slot_str]):
+        raise SlotError("doctor_id, patient_id, date and slot are required")
+    try:
+        doctor_id, patient_id = int(doctor_id), int(patient_id)
+    except (TypeError, ValueError):
+        raise SlotError("doctor_id and patient_id must be integers")
+    try:
+        check_date = datetime.strptime(str(date_str).strip(), "%Y-%m-%d").date()
+    except ValueError:
+        raise SlotError("Invalid date format. Use YYYY-MM-DD")
+    if status not in dict(Appointment.STATUS_CHOICES):
+        raise SlotError(f"Invalid status: {status}")
+
+    minute = slot_to_minutes(str(slot_str).strip())
+    if minute is None:
+        raise SlotError("Invalid time format. Use HH:MM format.")
+
+    return doctor_id, patient_id, check_date, minute, status
+
+def import_appointments(rows: List[dict], batch_size: int = IMPORT_BATCH_SIZE,
+                        dry_run: bool = False) -> List[dict]:
+    """
+    Validate and insert many appointments at once
+
+    Every row is checked in memory against the doctor's slot template, the existing
+    bookings (one range query) and the earlier rows of the same import, then
+    valid rows are written with bulk_create in batches. Cancelled rows don't
+    hold a slot, matching the partial unique constraint.
+
+    Args:
+        rows: Row dicts with doctor_id, patient_id, date, slot and optional status
+        batch_size: Rows per INSERT
+        dry_run: Validate only, write nothing
+
+    Returns:
+        List[dict]: One report entry per input row, in input order
+    """
+    report = [None] * len(rows)
+    parsed = []
+    for index, row in enumerate(rows):
+        try:
+            parsed.append((index, parse_import_row(row)))
+        except SlotError as e:
+            report[index] = {'row': index + 1, 'status': 'error', 'error': str(e)}
+
+    doctor_ids = {p[0] for _, p in parsed}
+    patient_ids = {p[1] for _, p in parsed}
+    known_doctors = set(Doctor.objects.filter(id__in=doctor_ids).values_list('id', flat=True))
+    known_patients = set(Patient.objects.filter(id__in=patient_ids).values_list('id', flat=True))
+
+    booked = {}
+    if parsed:
+        dates = [p[2] for _, p in parsed]
+        booked = get_booked_masks(known_doctors, min(dates), max(dates))
+    load_schedules(known_doctors)
+
+    accepted = []
+    for index, (doctor_id, patient_id, check_date, minute, status) in parsed:
+        if doctor_id not in known_doctors:
+            report[index] = {'row': index + 1, 'status': 'error', 'error': f"Doctor with id {doctor_id} not found"}
+            continue
+        if patient_id not in known_patients:
+            report[index] = {'row': index + 1, 'status': 'error', 'error': f"Patient with id {patient_id} not found"}
+            continue
+        template = get_doctor_template(doctor_id, check_date)
+        if template is None:
+            report[index] = {'row': index + 1, 'status': 'error', 'error': "Selected date is not a working day."}
+            continue
+        if minute not in template.bit_of:
+            report[index] = {'row': index + 1, 'status': 'error',
+                             'error': "Slot is not within working hours or is during lunch break."}
+            continue
+        if status != 'cancelled':
+            key, bit = (doctor_id, check_date), 1 << template.bit_of[minute]
+            if booked.get(key, 0) & bit:
+                report[index] = {'row': index + 1, 'status': 'error', 'error': "Slot is already booked"}
+                continue
+            booked[key] = booked.get(key, 0) | bit
+        accepted.append((index, Appointment(
+            doctor_id=doctor_id, patient_id=patient_id, date=check_date,
+            slot=time(minute // 60, minute % 60), status=status
+        )))
+
+    if dry_run:
+        for index, _ in accepted:
+            report[index] = {'row': index + 1, 'status': 'valid'}
+        return report
+
+    touched, participants = set(), set()
+    for start in range(0, len(accepted), batch_size):
+        batch = accepted[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                Appointment.objects.bulk_create([appt for _, appt in batch])
+                record_appointment_events([appt for _, appt in batch], 'created')
+            created = batch
+        except IntegrityError:
+            # Someone booked one of these slots since we read the masks; fall back to row-by-row
+            created = []
+            for index, appt in batch:
+                try:
+                    with transaction.atomic():
+                        Appointment.objects.bulk_create([appt])
+                        record_appointment_events([appt], 'created')
+                    created.append((index, appt))
+                except IntegrityError:
+                    report[index] = {'row': index + 1, 'status': 'error', 'error': "Slot is already booked"}
+        for index, appt in created:
+            report[index] = {'row': index + 1, 'status': 'created', 'id': appt.pk}
+            touched.add((appt.doctor_id, appt.date))
+            participants.add((appt.patient_id, appt.doctor_id))
+
+    # bulk_create skips signals: events were recorded with each insert above,
+    # and the materialized availability and the participants' change versions
+    # are brought up to date here in bulk
+    if touched:
+        refresh_availability_bulk(touched)
+        patient_ids, doctor_ids = zip(*participants)
+        bump_user_versions(participant_user_ids(set(patient_ids), set(doctor_ids)))
+    return report
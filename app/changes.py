@@ -0,0 +1,140 @@
+# app/changes.py
+import hashlib
+from functools import wraps
+from datetime import date, datetime, timezone as dt_timezone
+from time import time_ns
+from typing import Iterable, Set
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import Profile
+
+# -------------------------
+# CHANGE VERSIONS
+# -------------------------
+
+# Every user has a version in the "changes" cache: the time_ns() of the last
+# write to anything their dashboards and lists show. app/signals.py bumps it
+# after commit, so a GET can answer a conditional request from the version
+# alone and skip building the payload. A missing version starts at "now",
+# which only costs clients one full response.
+CHANGE_CACHE_ALIAS = 'changes'
+
+def _change_key(user_id: int) -> str:
+    return f"changes:user:{user_id}"
+
+def user_change_version(user_id: int) -> int:
+    """
+    Current change version of a user (nanoseconds since the epoch of their last change)
+
+    Args:
+        user_id: User id
+    """
+    cache = caches[CHANGE_CACHE_ALIAS]
+    key = _change_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time_ns(), timeout=None)
+        version = cache.get(key)
+    return version or time_ns()
+
+def bump_user_versions(user_ids: Iterable[int]) -> None:
+    """
+    Mark users' data as changed once the current transaction commits
+
+    Args:
+        user_ids: Ids of the users whose responses are now stale
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+
+    def bump():
+        now = time_ns()
+        caches[CHANGE_CACHE_ALIAS].set_many({_change_key(user_id): now for user_id in user_ids}, timeout=None)
+    transaction.on_commit(bump)
+
+def participant_user_ids(patient_ids: Iterable[int] = (), doctor_ids: Iterable[int] = ()) -> Set[int]:
+    """User ids behind patient and doctor ids (one query)"""
+    patient_ids = [pk for pk in patient_ids if pk is not None]
+    doctor_ids = [pk for pk in doctor_ids if pk is not None]
+    if not patient_ids and not doctor_ids:
+        return set()
+    return set(Profile.objects.filter(
+        Q(patient__id__in=patient_ids) | Q(doctor__id__in=doctor_ids)
+    ).values_list('user_id', flat=True))
+
+def care_team_user_ids(patient_id=None, doctor_id=None, user_id=None) -> Set[int]:
+    """
+    Users on the other side of someone's appointments: a patient's doctors,
+    a doctor's patients (one query)
+
+    Args:
+        patient_id: Patient whose doctors to find
+        doctor_id: Doctor whose patients to find
+        user_id: Find the counterparts of this user, whichever role they have
+    """
+    match = Q(pk__in=[])
+    if patient_id is not None:
+        match |= Q(doctor__appointment__patient_id=patient_id)
+    if doctor_id is not None:
+        match |= Q(patient__appointment__doctor_id=doctor_id)
+    if user_id is not None:
+        match |= Q(doctor__appointment__patient__profile__user_id=user_id)
+        match |= Q(patient__appointment__doctor__profile__user_id=user_id)
+    return set(Profile.objects.filter(match).values_list('user_id', flat=True).distinct())
+
+# -------------------------
+# CONDITIONAL GET
+# -------------------------
+
+def _request_version(request) -> int:
+    # Read once per request; both header functions use the same value
+    if not hasattr(request, '_change_version'):
+        request._change_version = user_change_version(request.user.pk)
+    return request._change_version
+
+def conditional_on_changes(scope: str, daily: bool = False):
+    """
+    ETag / Last-Modified for a GET that only shows the requesting user's data
+
+    The validators come from the user's change version, so a matching
+    If-None-Match (or If-Modified-Since) gets a 304 before the view runs.
+    Only successful responses carry them: an error (403, 404, ...) is never
+    answered from the client's copy. Responses are marked private and must be
+    revalidated.
+
+    Args:
+        scope: Name of the endpoint, so two endpoints never share an ETag
+        daily: The response also depends on today's date (dashboard buckets and windows)
+    """
+    def etag(request, *args, **kwargs):
+        parts = [scope, str(request.user.pk), str(_request_version(request)), request.get_full_path()]
+        if daily:
+            parts.append(date.today().isoformat())
+        return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        changed = datetime.fromtimestamp(_request_version(request) / 1e9, tz=dt_timezone.utc)
+        if daily:
+            midnight = datetime.combine(date.today(), datetime.min.time(), tzinfo=dt_timezone.utc)
+            changed = max(changed, midnight)
+        return changed
+
+    def decorator(view_func):
+        conditional = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                del response['ETag']
+                del response['Last-Modified']
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
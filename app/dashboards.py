@@ -0,0 +1,201 @@
+# app/dashboards.py
+from datetime import date, time, timedelta
+from typing import Dict, List, Optional
+
+from django.db.models import Q
+
+from .models import Appointment, Document, VisitNote
+from .pagination import encode_cursor
+
+# How far back the dashboards' "past" bucket reaches; older visits are paged via /api/appointments/
+DASHBOARD_PAST_DAYS = 90
+DASHBOARD_MAX_PAST_DAYS = 365
+
+def display_name(user) -> str:
+    """Full name, falling back to the username."""
+    return user.get_full_name() or user.username
+
+def past_window_start(past_days=None, today: Optional[date] = None) -> date:
+    """
+    First day of the dashboards' "past" window
+    
+    Args:
+        past_days: Requested window in days (query string value); invalid values use the default
+        today: Date the window ends on (defaults to today)
+    """
+    try:
+        days = int(past_days) if past_days not in (None, '') else DASHBOARD_PAST_DAYS
+    except (TypeError, ValueError):
+        days = DASHBOARD_PAST_DAYS
+    days = max(0, min(days, DASHBOARD_MAX_PAST_DAYS))
+    return (today or date.today()) - timedelta(days=days)
+
+def older_than_cursor(since: date) -> str:
+    """
+    Keyset cursor for every appointment before `since`, to continue past the dashboard window
+    
+    Costs no query: the cursor sits before the first slot of `since`, so the
+    next page starts at whatever visit precedes the window (or is empty).
+    """
+    return encode_cursor({'date': since, 'slot': time.min, 'id': 0})
+
+def load_patient_records(patient, with_documents: bool = True, since: Optional[date] = None) -> tuple:
+    """
+    Fetch everything a patient's dashboard shows in (at most) three queries
+    
+    Args:
+        patient: Patient instance
+        with_documents: Also fetch the patient's documents
+        since: Only read appointments (and their notes) from this date on; None reads all history
+        
+    Returns:
+        tuple: (appointments ordered by date, slot and id, visit notes, documents newest first),
+            each with the doctor/appointment rows they display already joined in
+    """
+    appointments = Appointment.objects.filter(patient=patient)
+    notes = VisitNote.objects.filter(patient=patient)
+    if since is not None:
+        appointments = appointments.filter(date__gte=since)
+        notes = notes.filter(
+            Q(appointment__date__gte=since) | Q(appointment__isnull=True, visit_date__date__gte=since)
+        )
+    appointments = list(
+        appointments.select_related('doctor__profile__user').order_by('date', 'slot', 'id')
+    )
+    notes = list(
+        notes.select_related('doctor__profile__user', 'appointment').order_by('visit_date', 'id')
+    )
+    documents = list(
+        Document.objects.filter(patient=patient)
+        .select_related('patient__profile__user', 'appointment__doctor__profile__user')
+        .order_by('-uploaded_at')
+    ) if with_documents else []
+    return appointments, notes, documents
+
+def load_prescription_records(patient, before: date) -> tuple:
+    """
+    Fetch the records from before a dashboard's window that still carry a prescription (two queries)
+    
+    The window only limits the "past" bucket; together with the records
+    load_patient_records(since=before) returns, these give prescription_entries()
+    the patient's full history.
+    
+    Args:
+        patient: Patient instance
+        before: First day of the window; only appointments (and their notes) before it are read
+        
+    Returns:
+        tuple: (appointments with prescription text, visit notes with text or a file),
+            joined like load_patient_records()
+    """
+    appointments = list(
+        Appointment.objects.filter(patient=patient, date__lt=before)
+        .exclude(prescription__isnull=True).exclude(prescription='')
+        .select_related('doctor__profile__user')
+    )
+    notes = list(
+        VisitNote.objects.filter(patient=patient)
+        .filter(Q(appointment__date__lt=before) | Q(appointment__isnull=True, visit_date__date__lt=before))
+        .exclude(Q(notes=''), Q(prescription__isnull=True) | Q(prescription=''))
+        .select_related('doctor__profile__user', 'appointment')
+    )
+    return appointments, notes
+
+def latest_note_text(notes) -> Dict[int, str]:
+    """
+    Latest non-empty visit note text per appointment id
+    
+    Args:
+        notes: Visit notes in visit order
+    """
+    latest = {}
+    for note in notes:
+        if note.appointment_id is not None and note.notes:
+            latest[note.appointment_id] = note.notes
+    return latest
+
+def appointment_buckets(appointments, notes, today: Optional[date] = None) -> tuple:
+    """
+    Split appointments into today / upcoming / past dashboard rows
+    
+    Args:
+        appointments: Appointments with doctor__profile__user joined, in date order
+        notes: The patient's visit notes, in visit order
+        today: Date to split on (defaults to today)
+        
+    Returns:
+        tuple: (today rows, upcoming rows, past rows newest first)
+    """
+    today = today or date.today()
+    prescriptions = latest_note_text(notes)
+    today_appts, upcoming, past = [], [], []
+    
+    for appt in appointments:
+        item = {
+            "id": appt.id,
+            "date": appt.date.strftime("%Y-%m-%d"),
+            "time": appt.slot.strftime("%H:%M"),
+            "doctor_name": display_name(appt.doctor.profile.user),
+            "specialization": appt.doctor.specialization,
+            "status": appt.status,
+            "prescription": prescriptions.get(appt.id) or appt.prescription or ""
+        }
+        
+        if appt.date == today:
+            today_appts.append(item)
+        elif appt.date > today:
+            upcoming.append(item)
+        else:
+            past.append(item)
+    
+    past.reverse()
+    return today_appts, upcoming, past
+
+def prescription_entries(appointments, notes) -> List[dict]:
+    """
+    Prescriptions written on appointments and in visit notes (text and file), newest first
+    
+    Args:
+        appointments: Appointments with doctor__profile__user joined
+        notes: Visit notes with doctor__profile__user and appointment joined
+    """
+    prescriptions = []
+    
+    for apt in appointments:
+        if apt.prescription:
+            prescriptions.append({
+                'id': f'apt_{apt.id}',
+                'type': 'prescription',
+                'content': apt.prescription,
+                'date': apt.date,
+                'doctor_name': display_name(apt.doctor.profile.user),
+                'appointment_id': apt.id,
+                'created_at': apt.created_at
+            })
+    
+    for note in notes:
+        doctor_name = display_name(note.doctor.profile.user)
+        appointment_date = note.appointment.date if note.appointment else None
+        if note.notes:
+            prescriptions.append({
+                'id': f'note_{note.id}',
+                'type': 'visit_note',
+                'content': note.notes,
+                'date': appointment_date,
+                'doctor_name': doctor_name,
+                'appointment_id': note.appointment_id,
+                'created_at': note.visit_date
+            })
+        if note.prescription:  # File prescription
+            prescriptions.append({
+                'id': f'file_{note.id}',
+                'type': 'prescription_file',
+                'file_url': note.prescription.url,
+                'date': appointment_date,
+                'doctor_name': doctor_name,
+                'appointment_id': note.appointment_id,
+                'created_at': note.visit_date
+            })
+    
+    prescriptions.sort(key=lambda x: x['created_at'], reverse=True)
+    return prescriptions
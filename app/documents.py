@@ -0,0 +1,123 @@
+# app/documents.py
+import hashlib
+import mimetypes
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+# Document.file_size, content_type and checksum are computed from the bytes
+# as the upload is parsed (DocumentMetadataUploadHandler sees every chunk on
+# its way to the temporary file), so reading a document list never has to
+# stat or open the stored file. `manage.py backfill_document_metadata` covers
+# documents uploaded before these fields existed.
+
+# Leading bytes kept to recognise the format (DICOM's marker sits after a 128-byte preamble)
+SNIFF_BYTES = 132
+
+MAGIC_TYPES = (
+    (b'%PDF-', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'DICM', 'application/dicom'),
+)
+
+def detect_content_type(head: bytes, name: str) -> str:
+    """
+    MIME type of a file from its first bytes, or its extension for formats without a signature
+
+    Args:
+        head: First SNIFF_BYTES bytes of the file
+        name: File name
+    """
+    for magic, content_type in MAGIC_TYPES:
+        if head.startswith(magic):
+            return content_type
+    if head[128:132] == b'DICM':
+        return 'application/dicom'
+    guessed, _ = mimetypes.guess_type(name or '')
+    return guessed or 'application/octet-stream'
+
+class FileDigest:
+    """Size, sha256 and leading bytes of a file, fed chunk by chunk"""
+
+    def __init__(self):
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.head = b''
+
+    def update(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self.sha256.update(chunk)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += chunk[:SNIFF_BYTES - len(self.head)]
+
+    def metadata(self, name: str) -> dict:
+        """Document field values for the bytes seen so far"""
+        return {
+            'file_size': self.size,
+            'content_type': detect_content_type(self.head, name),
+            'checksum': self.sha256.hexdigest(),
+        }
+
+def file_metadata(file) -> dict:
+    """
+    Read a file once and return its Document metadata fields
+
+    Args:
+        file: Django File (uploaded or opened from storage)
+    """
+    digest = FileDigest()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.metadata(file.name)
+
+# -------------------------
+# UPLOADS
+# -------------------------
+
+class DocumentMetadataUploadHandler(FileUploadHandler):
+    """
+    Upload handler that digests each file while the request body streams in and
+    passes the data on unchanged to the regular handlers
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = FileDigest()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_metadata'):
+            self.request.upload_metadata = {}
+        self.request.upload_metadata[self.field_name] = self.digest.metadata(self.file_name)
+        # The next handler builds the UploadedFile
+        return None
+
+def track_upload_metadata(request) -> None:
+    """
+    Digest this request's uploads as they are parsed (call before touching request.FILES)
+
+    Args:
+        request: Django HttpRequest
+    """
+    request.upload_handlers.insert(0, DocumentMetadataUploadHandler(request))
+
+def uploaded_file_metadata(request, field_name: str, uploaded_file) -> dict:
+    """
+    Metadata recorded for an uploaded file, reading the file only if no handler saw it
+
+    Args:
+        request: Django HttpRequest passed to track_upload_metadata()
+        field_name: Form field the file came from
+        uploaded_file: The UploadedFile
+    """
+    metadata = getattr(request, 'upload_metadata', {}).get(field_name)
+    if metadata is None:
+        metadata = file_metadata(uploaded_file)
+    return metadata
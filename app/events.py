@@ -0,0 +1,245 @@
+# app/events.py
+import asyncio
+import json
+import logging
+import secrets
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AppointmentEvent, StreamTicket
+
+logger = logging.getLogger(__name__)
+
+# Appointment changes are written to AppointmentEvent by app/signals.py in the
+# same transaction as the change (so no event is lost or announced for a
+# rolled-back write). Each ASGI worker runs one EventHub: a single poller reads
+# new rows for all of its connections, and writes made in the worker itself
+# are pushed right after commit without waiting for the poll.
+
+EVENT_POLL_SECONDS = getattr(settings, 'EVENT_POLL_SECONDS', 2)
+EVENT_RETENTION_HOURS = getattr(settings, 'EVENT_RETENTION_HOURS', 24)
+EVENT_HEARTBEAT_SECONDS = 20
+# Each poll re-reads this far back for rows whose transaction committed late
+EVENT_SETTLE_SECONDS = 5
+EVENT_QUEUE_SIZE = 100
+EVENT_REPLAY_LIMIT = 200
+# Retry delay sent to EventSource clients, in milliseconds
+EVENT_RETRY_MS = 5000
+# How long a stream ticket can be redeemed; clients fetch one right before connecting
+STREAM_TICKET_SECONDS = 30
+
+# -------------------------
+# RECORDING
+# -------------------------
+
+def appointment_event_kind(appointment, created: bool, loaded_slot: tuple) -> Optional[str]:
+    """
+    Which event an appointment save is, if any
+
+    Args:
+        appointment: Saved Appointment
+        created: Whether the row was inserted
+        loaded_slot: (doctor_id, date, slot, status) the instance was loaded with
+
+    Returns:
+        Optional[str]: One of AppointmentEvent.KIND_CHOICES, or None for other edits
+    """
+    if created:
+        return 'created'
+    old_doctor_id, old_date, old_slot, old_status = loaded_slot
+    if old_status is None:
+        return None
+    if appointment.status != old_status:
+        if appointment.status in ('cancelled', 'completed'):
+            return appointment.status
+        return 'created'  # a cancelled booking made active again
+    moved = (old_doctor_id, str(old_date), str(old_slot)[:5]) != (
+        appointment.doctor_id, str(appointment.date), str(appointment.slot)[:5]
+    )
+    return 'rescheduled' if moved else None
+
+def _event_row(appointment, kind: str) -> AppointmentEvent:
+    return AppointmentEvent(
+        kind=kind,
+        appointment_id=appointment.pk,
+        doctor_id=appointment.doctor_id,
+        patient_id=appointment.patient_id,
+        payload={
+            'id': appointment.pk,
+            'date': str(appointment.date),
+            'slot': str(appointment.slot)[:5],
+            'status': appointment.status,
+            'doctor_id': appointment.doctor_id,
+            'patient_id': appointment.patient_id,
+        },
+    )
+
+def record_appointment_events(appointments: Iterable, kind: str) -> None:
+    """
+    Write events for appointments in the current transaction and push them
+    to this worker's connections once it commits
+
+    Args:
+        appointments: Saved Appointment instances
+        kind: Event kind
+    """
+    events = AppointmentEvent.objects.bulk_create([_event_row(appt, kind) for appt in appointments])
+    if events:
+        transaction.on_commit(lambda: hub.publish([serialize_event(event) for event in events]))
+
+def serialize_event(event: AppointmentEvent) -> dict:
+    return {
+        'id': event.id,
+        'type': f"appointment.{event.kind}",
+        'doctor_id': event.doctor_id,
+        'patient_id': event.patient_id,
+        'appointment': event.payload,
+        'at': event.created_at.isoformat(),
+    }
+
+def format_sse(event: dict) -> str:
+    """One server-sent events message"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+# -------------------------
+# READING
+# -------------------------
+
+def subscription_filter(doctor_id=None, patient_id=None) -> dict:
+    return {'doctor_id': doctor_id} if doctor_id is not None else {'patient_id': patient_id}
+
+def events_after(last_event_id: int, doctor_id=None, patient_id=None) -> List[dict]:
+    """
+    A reconnecting client's missed events (newest EVENT_REPLAY_LIMIT within retention)
+    """
+    since = timezone.now() - timedelta(hours=EVENT_RETENTION_HOURS)
+    events = AppointmentEvent.objects.filter(
+        id__gt=last_event_id, created_at__gte=since, **subscription_filter(doctor_id, patient_id)
+    ).order_by('-id')[:EVENT_REPLAY_LIMIT]
+    return [serialize_event(event) for event in reversed(events)]
+
+def latest_event_id() -> int:
+    return AppointmentEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+def recent_events(since) -> List[dict]:
+    return [serialize_event(event) for event in AppointmentEvent.objects.filter(created_at__gte=since)]
+
+def prune_events() -> int:
+    """Delete events older than EVENT_RETENTION_HOURS"""
+    cutoff = timezone.now() - timedelta(hours=EVENT_RETENTION_HOURS)
+    deleted, _ = AppointmentEvent.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+# -------------------------
+# STREAM TICKETS
+# -------------------------
+
+def issue_stream_ticket(user) -> StreamTicket:
+    """
+    A short-lived ticket that opens one event stream for a user (and a sweep of expired ones)
+
+    Args:
+        user: Authenticated user the stream belongs to
+    """
+    now = timezone.now()
+    StreamTicket.objects.filter(expires_at__lte=now).delete()
+    return StreamTicket.objects.create(
+        key=secrets.token_urlsafe(32), user=user, expires_at=now + timedelta(seconds=STREAM_TICKET_SECONDS)
+    )
+
+async def redeem_stream_ticket(key: str):
+    """
+    The user of an unexpired ticket, or None; the ticket is used up either way
+
+    Deleting the row is what redeems it, so of two requests racing with one
+    ticket only the one whose delete removed the row gets the stream.
+    """
+    ticket = await StreamTicket.objects.select_related('user__profile').filter(key=key).afirst()
+    if ticket is None:
+        return None
+    deleted, _ = await StreamTicket.objects.filter(pk=ticket.pk).adelete()
+    if not deleted or ticket.expires_at <= timezone.now():
+        return None
+    return ticket.user
+
+# -------------------------
+# FAN-OUT
+# -------------------------
+
+class EventHub:
+    """
+    Per-process fan-out of appointment events to open streams
+
+    Streams subscribe with keys ('doctor', id) / ('patient', id) and get an
+    asyncio.Queue. Idle streams cost a queue and a parked coroutine, no
+    thread, so one worker holds thousands of them.
+    """
+    SEEN_LIMIT = 10000
+
+    def __init__(self):
+        self._subscribers = {}
+        self._seen = OrderedDict()
+        self._loop = None
+        self._poller = None
+
+    def subscribe(self, key: tuple) -> asyncio.Queue:
+        """Open a queue for a key; starts the poller (call from the event loop)"""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self._subscribers.setdefault(key, set()).add(queue)
+        if self._poller is None or self._poller.done():
+            self._poller = self._loop.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, key: tuple, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(key)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[key]
+
+    def publish(self, events: List[dict]) -> None:
+        """Hand events to the hub from any thread (signals run outside the event loop)"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self.dispatch, events)
+
+    def dispatch(self, events: List[dict]) -> None:
+        """Deliver events not delivered before (call from the event loop)"""
+        for event in events:
+            if event['id'] in self._seen:
+                continue
+            self._seen[event['id']] = True
+            if len(self._seen) > self.SEEN_LIMIT:
+                self._seen.popitem(last=False)
+            for key in (('doctor', event['doctor_id']), ('patient', event['patient_id'])):
+                for queue in self._subscribers.get(key, ()):
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        # A stalled client; it catches up with Last-Event-ID when it reconnects
+                        pass
+
+    async def _poll(self) -> None:
+        mark = timezone.now()
+        next_prune = mark
+        while self._subscribers:
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+            started = timezone.now()
+            try:
+                self.dispatch(await sync_to_async(recent_events)(mark - timedelta(seconds=EVENT_SETTLE_SECONDS)))
+                mark = started
+                if started >= next_prune:
+                    await sync_to_async(prune_events)()
+                    next_prune = started + timedelta(hours=1)
+            except Exception as e:
+                logger.error(f"Error polling appointment events: {e}")
+
+hub = EventHub()
@@ -0,0 +1,162 @@
+# app/heatmap.py
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from .models import Doctor, DoctorDayAvailability
+from .utils import current_minute, get_doctor_week, get_holiday_index, load_schedules, MAX_DAY_SLOTS
+
+# Longest window the capacity heatmap covers
+HEATMAP_MAX_DAYS = 90
+
+# Bits in a stored free mask (schedules are validated to fit MAX_DAY_SLOTS of them)
+MASK_BITS = MAX_DAY_SLOTS + 1
+
+def occupancy_tensor(doctor_ids, start_date: date, days: int, days_queryset=None) -> tuple:
+    """
+    Lay out capacity and bookings of many doctors as doctor x day x slot boolean tensors
+    
+    Each doctor's week maps weekdays to a handful of distinct day templates,
+    which are broadcast over the window by weekday; holidays and leave are
+    cleared as whole day ranges, and the bookings of the window are read with
+    one query and scattered in with a single fancy-indexed assignment.
+    
+    Args:
+        doctor_ids: Doctor ids, in the order of the first axis
+        start_date: First day of the window
+        days: Number of days in the window
+        days_queryset: DoctorDayAvailability queryset to read bookings from
+            (defaults to the rows of these doctors)
+        
+    Returns:
+        tuple: (slot minute offsets for the last axis, capacity tensor, booked tensor);
+            booked only marks slots that are also in capacity
+    """
+    doctor_ids = list(doctor_ids)
+    end_date = start_date + timedelta(days=days - 1)
+    load_schedules(doctor_ids)
+    calendars = [get_doctor_week(doctor_id) for doctor_id in doctor_ids]
+    
+    # The slot axis is the union of every doctor's slot times
+    columns = np.array(sorted({
+        minute for week, _ in calendars for template in week if template for minute in template.minutes
+    }), dtype=np.int32)
+    n_doctors, n_slots = len(doctor_ids), len(columns)
+    
+    # Distinct day templates are numbered once; template_of[doctor, weekday] points
+    # at one of them, or at the empty last entry for days off
+    templates = list({template for week, _ in calendars for template in week if template is not None})
+    number = {template: t for t, template in enumerate(templates)}
+    template_of = np.array(
+        [[number.get(template, len(templates)) for template in week] for week, _ in calendars],
+        dtype=np.intp
+    ).reshape(n_doctors, 7)
+    day_patterns = np.zeros((len(templates) + 1, n_slots), dtype=bool)
+    for t, template in enumerate(templates):
+        day_patterns[t, np.searchsorted(columns, template.minutes)] = True
+    
+    weekdays = (np.arange(days) + start_date.weekday()) % 7
+    capacity = day_patterns[template_of[:, weekdays]]
+    
+    for first, last in get_holiday_index().overlapping(start_date, end_date):
+        capacity[:, (first - start_date).days:(last - start_date).days + 1, :] = False
+    for i, (_, leave) in enumerate(calendars):
+        for first, last in leave.overlapping(start_date, end_date) if leave else ():
+            capacity[i, (first - start_date).days:(last - start_date).days + 1, :] = False
+    if start_date == date.today() and n_slots:
+        # Slots earlier today can no longer be booked
+        capacity[:, 0, columns <= current_minute()] = False
+    
+    # Bookings are read through the materialized per-day free masks, which the
+    # Appointment signals keep in step: one row per booked doctor/day instead of
+    # one per appointment. Dates come back as text for NumPy to parse in bulk.
+    if days_queryset is None:
+        days_queryset = DoctorDayAvailability.objects.filter(doctor_id__in=doctor_ids)
+    rows = list(zip(*days_queryset.filter(date__range=(start_date, end_date)).annotate(
+        day_text=Cast('date', CharField())
+    ).values_list('doctor_id', 'day_text', 'free_mask')))
+    
+    booked = np.zeros_like(capacity)
+    if rows and n_slots:
+        ids, day_text, free_masks = rows
+        ids = np.array(ids, dtype=np.int64)
+        known = np.array(doctor_ids, dtype=np.int64)
+        order = np.argsort(known)
+        found = order[np.minimum(np.searchsorted(known[order], ids), n_doctors - 1)]
+        day_index = (np.array(day_text, dtype='datetime64[D]') - np.datetime64(start_date, 'D')).astype(np.intp)
+        keep = known[found] == ids
+        doctor_index, day_index = found[keep], day_index[keep]
+        free_masks = np.array(free_masks, dtype=np.int64)[keep].astype(np.uint64)
+        
+        # Bit b of a mask is slot b of the doctor's template for that weekday
+        bit_columns = np.full((len(templates) + 1, MASK_BITS), -1, dtype=np.intp)
+        for t, template in enumerate(templates):
+            bit_columns[t, :len(template.minutes)] = np.searchsorted(columns, template.minutes[:MASK_BITS])
+        template_index = template_of[doctor_index, weekdays[day_index]]
+        
+        bits = (free_masks[:, None] >> np.arange(MASK_BITS, dtype=np.uint64)) & np.uint64(1)
+        row, bit = np.nonzero((bits == 0) & (bit_columns[template_index] >= 0))
+        booked[doctor_index[row], day_index[row], bit_columns[template_index[row], bit]] = True
+        booked &= capacity
+    
+    return columns, capacity, booked
+
+def specialization_heatmap(start_date: date, days: int = HEATMAP_MAX_DAYS,
+                           specialization: Optional[str] = None) -> dict:
+    """
+    Open and total slots per specialization per day over a window
+    
+    Only doctors accepting appointments count. Short-lived slot holds are not
+    subtracted: the heatmap is for capacity planning, not booking.
+    
+    Args:
+        start_date: First day of the window
+        days: Number of days (at most HEATMAP_MAX_DAYS)
+        specialization: Limit to one specialization (all when omitted)
+        
+    Returns:
+        dict: Days, slot labels and per specialization the doctor count, open and
+            capacity per day, and open slots per time of day over the window
+    """
+    days = max(1, min(days, HEATMAP_MAX_DAYS))
+    doctors = Doctor.objects.filter(available=True)
+    if specialization:
+        doctors = doctors.filter(specialization__iexact=specialization)
+    rows = list(doctors.order_by('specialization', 'id').values_list('id', 'specialization'))
+    
+    doctor_ids = [doctor_id for doctor_id, _ in rows]
+    columns, capacity, booked = occupancy_tensor(
+        doctor_ids, start_date, days, days_queryset=DoctorDayAvailability.objects.filter(doctor__in=doctors)
+    )
+    open_slots = capacity & ~booked
+    
+    groups = []
+    if rows:
+        # Doctors are sorted by specialization, so each group is a contiguous run of rows
+        names = np.array([name for _, name in rows])
+        starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+        sizes = np.diff(np.r_[starts, len(rows)])
+        open_by_day = np.add.reduceat(open_slots.sum(axis=2), starts, axis=0)
+        capacity_by_day = np.add.reduceat(capacity.sum(axis=2), starts, axis=0)
+        open_by_slot = np.add.reduceat(open_slots.sum(axis=1), starts, axis=0)
+        for g, first in enumerate(starts):
+            groups.append({
+                'specialization': str(names[first]),
+                'doctors': int(sizes[g]),
+                'open': open_by_day[g].tolist(),
+                'capacity': capacity_by_day[g].tolist(),
+                'open_by_slot': open_by_slot[g].tolist(),
+                'total_open': int(open_by_day[g].sum()),
+                'total_capacity': int(capacity_by_day[g].sum()),
+            })
+    
+    return {
+        'start': start_date.strftime("%Y-%m-%d"),
+        'end': (start_date + timedelta(days=days - 1)).strftime("%Y-%m-%d"),
+        'days': [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)],
+        'slots': [f"{m // 60:02d}:{m % 60:02d}" for m in columns.tolist()],
+        'specializations': groups,
+    }
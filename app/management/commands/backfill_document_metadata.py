@@ -0,0 +1,46 @@
+# app/management/commands/backfill_document_metadata.py
+from django.core.management.base import BaseCommand
+
+from app.documents import file_metadata
+from app.models import Document
+
+METADATA_FIELDS = ['file_size', 'content_type', 'checksum']
+
+
+class Command(BaseCommand):
+    help = "Record size, MIME type and checksum for documents uploaded before they were stored"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Recompute every document, not just the ones missing metadata")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        documents = Document.objects.only('id', 'file').order_by('id')
+        if not options['all']:
+            documents = documents.filter(file_size__isnull=True)
+
+        batch, updated, missing = [], 0, 0
+        for document in documents.iterator(chunk_size=options['batch_size']):
+            try:
+                with document.file.open('rb') as handle:
+                    metadata = file_metadata(handle)
+            except (FileNotFoundError, ValueError, OSError):
+                missing += 1
+                self.stderr.write(f"document={document.id}: file {document.file.name!r} not found")
+                continue
+
+            for field, value in metadata.items():
+                setattr(document, field, value)
+            batch.append(document)
+            if len(batch) >= options['batch_size']:
+                # bulk_update leaves updated_at alone; the document itself didn't change
+                Document.objects.bulk_update(batch, METADATA_FIELDS)
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Document.objects.bulk_update(batch, METADATA_FIELDS)
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Recorded metadata for {updated} document(s), {missing} missing file(s)"))
@@ -0,0 +1,111 @@
+# app/management/commands/bench_booking.py
+import os
+import random
+import tempfile
+import threading
+import time as timer
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Count
+
+from app.booking import book_appointment, SlotConflict
+from app.models import Appointment, Doctor, Patient
+from app.utils import get_slot_template, is_working_day
+
+
+class Command(BaseCommand):
+    help = ("Hammer one doctor's schedule with concurrent bookings on a throwaway database and "
+            "report successful bookings per second and double-bookings")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=200, help="Booking attempts per thread")
+        parser.add_argument('--days', type=int, default=20, help="Working days open for booking")
+        parser.add_argument('--alternate', action='store_true', help="Retry onto alternate slots on conflict")
+
+    def handle(self, *args, **options):
+        # File-backed SQLite so the worker threads really contend on one database
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run(self, options):
+        doctor_user = User.objects.create_user(username='bench_doctor', password='bench-pass')
+        doctor_user.profile.role = 'doctor'
+        doctor_user.profile.save()
+        doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='General')
+
+        patients = []
+        for i in range(options['threads']):
+            user = User.objects.create_user(username=f'bench_patient_{i}', password='bench-pass')
+            patients.append(Patient.objects.create(profile=user.profile))
+
+        days = []
+        day = date.today() + timedelta(days=1)
+        while len(days) < options['days']:
+            if is_working_day(day):
+                days.append(day)
+            day += timedelta(days=1)
+        labels = get_slot_template().labels
+
+        counts = {'booked': 0, 'conflict': 0, 'error': 0}
+        lock = threading.Lock()
+        start_gate = threading.Barrier(options['threads'])
+
+        def worker(index):
+            rng = random.Random(index)
+            local = {'booked': 0, 'conflict': 0, 'error': 0}
+            start_gate.wait()
+            try:
+                for _ in range(options['attempts']):
+                    try:
+                        book_appointment(patients[index], doctor, rng.choice(days), rng.choice(labels),
+                                         allow_alternate=options['alternate'])
+                        local['booked'] += 1
+                    except SlotConflict:
+                        local['conflict'] += 1
+                    except Exception as e:
+                        local['error'] += 1
+                        self.stderr.write(f"thread {index}: {e}")
+            finally:
+                connections.close_all()
+            with lock:
+                for key, value in local.items():
+                    counts[key] += value
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = timer.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = timer.perf_counter() - started
+
+        rows = Appointment.objects.exclude(status='cancelled').count()
+        doubles = Appointment.objects.exclude(status='cancelled').values(
+            'doctor', 'date', 'slot'
+        ).annotate(n=Count('id')).filter(n__gt=1).count()
+
+        self.stdout.write(
+            f"{options['threads']} threads x {options['attempts']} attempts over "
+            f"{len(days)} days ({len(days) * len(labels)} slots) in {elapsed:.2f}s"
+        )
+        self.stdout.write(
+            f"booked={counts['booked']} conflicts={counts['conflict']} errors={counts['error']} "
+            f"-> {counts['booked'] / elapsed:.1f} successful bookings/s, "
+            f"{sum(counts.values()) / elapsed:.1f} attempts/s"
+        )
+        style = self.style.SUCCESS if doubles == 0 and rows == counts['booked'] else self.style.ERROR
+        self.stdout.write(style(f"appointment rows={rows}, double-booked slots={doubles}"))
@@ -0,0 +1,105 @@
+# app/management/commands/bench_heatmap.py
+import os
+import random
+import tempfile
+import time as timer
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from app.heatmap import specialization_heatmap
+from app.models import Appointment, Doctor, Patient, Profile
+from app.utils import get_available_slots, get_doctor_template, refresh_availability_bulk
+
+SPECIALIZATIONS = ['Cardiology', 'Dermatology', 'Neurology', 'Orthopedics', 'Pediatrics', 'General']
+
+
+class Command(BaseCommand):
+    help = ("Time the vectorized specialization heatmap on a throwaway database filled with "
+            "synthetic doctors and bookings, and cross-check it against the per-doctor slot engine")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=300)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--fill', type=float, default=0.5, help="Share of slots booked")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        settings.DATABASES['default'].setdefault('TEST', {})['NAME'] = path
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        start = date.today() + timedelta(days=1)
+
+        # Bulk-created users skip the profile signal, so profiles are created here too
+        users = User.objects.bulk_create([
+            User(username=f'bench_doctor_{i}') for i in range(options['doctors'])
+        ] + [User(username='bench_patient')])
+        profiles = Profile.objects.bulk_create([
+            Profile(user=user, role='doctor' if user.username != 'bench_patient' else 'patient') for user in users
+        ])
+        patient = Patient.objects.create(profile=profiles[-1])
+        doctors = Doctor.objects.bulk_create([
+            Doctor(profile=profile, specialization=rng.choice(SPECIALIZATIONS)) for profile in profiles[:-1]
+        ])
+
+        appointments = []
+        for doctor in doctors:
+            for offset in range(options['days']):
+                day = start + timedelta(days=offset)
+                template = get_doctor_template(doctor.id, day)
+                if template is None:
+                    continue
+                for label in template.labels:
+                    if rng.random() < options['fill']:
+                        appointments.append(Appointment(doctor=doctor, patient=patient, date=day, slot=label))
+        Appointment.objects.bulk_create(appointments, batch_size=2000)
+        refresh_availability_bulk({(appt.doctor_id, appt.date) for appt in appointments})
+
+        best = float('inf')
+        for _ in range(options['repeat']):
+            started = timer.perf_counter()
+            heatmap = specialization_heatmap(start, options['days'])
+            best = min(best, timer.perf_counter() - started)
+
+        # Cross-check one specialization on a few days with the per-doctor engine
+        group = heatmap['specializations'][0]
+        members = [doc for doc in doctors if doc.specialization == group['specialization']]
+        for offset in (0, options['days'] // 2, options['days'] - 1):
+            day = start + timedelta(days=offset)
+            expected = sum(len(get_available_slots(doc, day)) for doc in members)
+            if expected != group['open'][offset]:
+                self.stderr.write(self.style.ERROR(
+                    f"{group['specialization']} {day}: heatmap={group['open'][offset]} engine={expected}"
+                ))
+                return
+
+        started = timer.perf_counter()
+        for doc in members:
+            for offset in range(options['days']):
+                get_available_slots(doc, start + timedelta(days=offset))
+        loop = timer.perf_counter() - started
+
+        self.stdout.write(
+            f"{options['doctors']} doctors x {options['days']} days, {len(appointments)} bookings, "
+            f"{len(heatmap['specializations'])} specializations"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"heatmap: {best * 1000:.1f} ms for all specializations; "
+            f"per-doctor loop: {loop * 1000:.0f} ms for {group['specialization']} alone "
+            f"({len(members)} doctors); spot checks match"
+        ))
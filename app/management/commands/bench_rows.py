@@ -0,0 +1,101 @@
+# app/management/commands/bench_rows.py
+import time as timer
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from app.models import Appointment, Doctor, Document, Patient, VisitNote
+from app.rows import appointment_rows, appointment_values, document_rows, visit_note_rows
+from app.serializers import AppointmentSerializer, DocumentSerializer, VisitNoteSerializer
+
+
+class Command(BaseCommand):
+    help = ("Compare the serializer and values() list paths on a throwaway database: "
+            "time to query and render appointments, visit notes and documents, and whether the JSON matches")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Appointments, visit notes and documents each")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def populate(self, rows):
+        doctors, patients = [], []
+        for i in range(10):
+            user = User.objects.create_user(username=f'bench_doctor_{i}', first_name='Doc', last_name=str(i))
+            doctors.append(Doctor.objects.create(profile=user.profile, specialization='General'))
+            user = User.objects.create_user(username=f'bench_patient_{i}')
+            patients.append(Patient.objects.create(profile=user.profile))
+
+        start = date.today() - timedelta(days=rows // 100)
+        appointments = Appointment.objects.bulk_create([
+            Appointment(doctor=doctors[i % 10], patient=patients[(i // 10) % 10],
+                        date=start + timedelta(days=i // 100), slot=time(9 + (i // 10) % 10, 0),
+                        status=('booked', 'completed', 'cancelled')[i % 3], prescription="Legacy" if i % 4 == 0 else None)
+            for i in range(rows)
+        ], batch_size=1000)
+        VisitNote.objects.bulk_create([
+            VisitNote(appointment=appt, patient_id=appt.patient_id, doctor_id=appt.doctor_id, notes=f"Note {appt.pk}",
+                      prescription=f"prescriptions/rx_{appt.pk}.pdf" if i % 2 else None)
+            for i, appt in enumerate(appointments)
+        ], batch_size=1000)
+        Document.objects.bulk_create([
+            Document(patient_id=appt.patient_id, appointment=appt if i % 2 else None,
+                     file=f"documents/report_{appt.pk}.pdf", doc_type='lab', file_size=1024,
+                     content_type='application/pdf', checksum='0' * 64)
+            for i, appt in enumerate(appointments)
+        ], batch_size=1000)
+
+    def run(self, options):
+        self.populate(options['rows'])
+        request = APIRequestFactory().get('/api/appointments/')
+        request.user = User.objects.get(username='bench_patient_0')
+        context = {'request': request}
+        render = JSONRenderer().render
+
+        appointments = Appointment.objects.order_by('-date', '-slot', '-id')
+        notes = VisitNote.objects.order_by('id')
+        documents = Document.objects.order_by('id')
+        cases = (
+            ('appointments',
+             lambda: render(AppointmentSerializer(AppointmentSerializer.setup_eager_loading(appointments),
+                                                  many=True, context=context).data),
+             lambda: render(appointment_rows(appointment_values(appointments), request))),
+            ('visit notes',
+             lambda: render(VisitNoteSerializer(notes.select_related('doctor__profile__user', 'patient__profile__user',
+                                                                     'appointment'), many=True, context=context).data),
+             lambda: render(visit_note_rows(notes, request))),
+            ('documents',
+             lambda: render(DocumentSerializer(documents.select_related('patient__profile__user',
+                                                                        'appointment__doctor__profile__user'),
+                                               many=True, context=context).data),
+             lambda: render(document_rows(documents, request))),
+        )
+
+        for name, serializer_path, rows_path in cases:
+            results = {}
+            for label, fn in (('serializer', serializer_path), ('values', rows_path)):
+                best = float('inf')
+                for _ in range(options['repeat']):
+                    started = timer.perf_counter()
+                    body = fn()
+                    best = min(best, timer.perf_counter() - started)
+                results[label] = (best, body)
+            if results['serializer'][1] != results['values'][1]:
+                raise CommandError(f"{name}: the two paths rendered different JSON")
+            serializer_time, values_time = results['serializer'][0], results['values'][0]
+            self.stdout.write(
+                f"{name:>12}: serializer {serializer_time * 1000:8.1f} ms, values {values_time * 1000:8.1f} ms "
+                f"-> {serializer_time / values_time:.1f}x over {options['rows']} rows "
+                f"({len(results['values'][1]) / 1e6:.1f} MB, identical)"
+            )
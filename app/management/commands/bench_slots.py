@@ -0,0 +1,68 @@
+# app/management/commands/bench_slots.py
+import random
+import time as timer
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+
+from app.utils import get_slot_template, LUNCH_START, LUNCH_END
+
+
+def legacy_available(booked, current_time):
+    """The old list-scan + strptime filter, kept here only for comparison."""
+    template = get_slot_template()
+    all_slots = list(template.labels)
+    available = [slot for slot in all_slots if slot not in booked]
+    return [slot for slot in available if datetime.strptime(slot, "%H:%M").time() > current_time]
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the slot availability engine against the legacy list scan (no DB access)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        template = get_slot_template()
+        labels = template.labels
+        now_time = time(12, 15)
+        now_minute = 12 * 60 + 15
+
+        # Synthetic booked slots: each doctor has a random share of the day booked
+        booked_labels = [
+            rng.sample(labels, rng.randint(0, len(labels)))
+            for _ in range(options['doctors'])
+        ]
+        booked_times = [
+            [datetime.strptime(label, "%H:%M").time() for label in day]
+            for day in booked_labels
+        ]
+
+        def run_engine():
+            after = template.mask_after(now_minute)
+            full = template.full_mask
+            for day in booked_times:
+                template.labels_for(full & ~template.mask_for(day) & after)
+
+        def run_legacy():
+            for day in booked_labels:
+                legacy_available(day, now_time)
+
+        results = {}
+        for name, fn in (('engine', run_engine), ('legacy', run_legacy)):
+            best = float('inf')
+            for _ in range(options['repeat']):
+                started = timer.perf_counter()
+                fn()
+                best = min(best, timer.perf_counter() - started)
+            results[name] = best
+            self.stdout.write(
+                f"{name:>7}: {best * 1000:8.1f} ms total, "
+                f"{best / options['doctors'] * 1e6:6.2f} us/call over {options['doctors']} doctors"
+            )
+
+        self.stdout.write(f"speedup: {results['legacy'] / results['engine']:.1f}x "
+                          f"(template: {len(labels)} slots, lunch {LUNCH_START:%H:%M}-{LUNCH_END:%H:%M})")
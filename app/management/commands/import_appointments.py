@@ -0,0 +1,47 @@
+# app/management/commands/import_appointments.py
+import json
+import time as timer
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.booking import IMPORT_BATCH_SIZE, import_appointments, read_appointment_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk import appointments from a CSV or JSON file (doctor_id, patient_id, date, slot[, status])"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, write nothing")
+        parser.add_argument('--report', help="Write the per-row report to this JSON file")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or path.suffix.lstrip('.').lower()
+
+        try:
+            rows = read_appointment_rows(path.read_bytes(), fmt)
+        except ValueError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        started = timer.perf_counter()
+        report = import_appointments(rows, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        elapsed = timer.perf_counter() - started
+
+        if options['report']:
+            Path(options['report']).write_text(json.dumps(report, indent=2))
+
+        for entry in report:
+            if entry['status'] == 'error':
+                self.stdout.write(f"row {entry['row']}: {entry['error']}")
+
+        ok = sum(1 for entry in report if entry['status'] in ('created', 'valid'))
+        verb = "validated" if options['dry_run'] else "imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{ok}/{len(report)} rows {verb} in {elapsed:.2f}s ({len(report) / max(elapsed, 1e-9):.0f} rows/s)"
+        ))
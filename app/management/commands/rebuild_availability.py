@@ -0,0 +1,73 @@
+# app/management/commands/rebuild_availability.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.models import Appointment, DoctorDayAvailability
+from app.utils import compute_day_availability, get_booked_masks, invalidate_day_slots
+
+
+class Command(BaseCommand):
+    help = "Rebuild (or, with --verify, check) the DoctorDayAvailability table from appointments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="Only compare the table with the appointments; exit non-zero on drift")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def expected_rows(self):
+        """(doctor_id, date) -> (free_mask, free_count) for every day that has bookings."""
+        days = Appointment.objects.exclude(status='cancelled').values_list('doctor_id', 'date').distinct()
+        if not days:
+            return {}
+        doctor_ids = {doctor_id for doctor_id, _ in days}
+        start = min(day for _, day in days)
+        end = max(day for _, day in days)
+        booked = get_booked_masks(doctor_ids, start, end)
+        return {
+            (doctor_id, day): compute_day_availability(doctor_id, booked.get((doctor_id, day), 0), day)
+            for doctor_id, day in days
+        }
+
+    def stored_rows(self):
+        """(doctor_id, date) -> (free_mask, free_count) as the table has it."""
+        return {
+            (doctor_id, day): (free_mask, free_count)
+            for doctor_id, day, free_mask, free_count in DoctorDayAvailability.objects.values_list(
+                'doctor_id', 'date', 'free_mask', 'free_count'
+            )
+        }
+
+    def handle(self, *args, **options):
+        expected = self.expected_rows()
+
+        if options['verify']:
+            stored = self.stored_rows()
+            mismatches = 0
+            for key in sorted(set(expected) | set(stored)):
+                # A row for a day without bookings is only valid if it says the day is fully free
+                want = expected.get(key) or compute_day_availability(key[0], 0, key[1])
+                if stored.get(key, want) != want:
+                    mismatches += 1
+                    self.stdout.write(f"doctor={key[0]} date={key[1]}: stored={stored.get(key)} expected={want}")
+            if mismatches:
+                raise CommandError(f"{mismatches} availability row(s) out of date; run without --verify to rebuild")
+            self.stdout.write(self.style.SUCCESS(f"Availability table OK ({len(stored)} rows checked)"))
+            return
+
+        with transaction.atomic():
+            stored = self.stored_rows()
+            DoctorDayAvailability.objects.all().delete()
+            DoctorDayAvailability.objects.bulk_create(
+                [
+                    DoctorDayAvailability(doctor_id=doctor_id, date=day, free_mask=free_mask, free_count=free_count)
+                    for (doctor_id, day), (free_mask, free_count) in expected.items()
+                ],
+                batch_size=options['batch_size']
+            )
+            # The slot cache holds the rows it read; drop the days whose row changed once this commits
+            changed = [key for key in set(stored) | set(expected) if stored.get(key) != expected.get(key)]
+            for doctor_id, day in changed:
+                invalidate_day_slots(doctor_id, day)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(expected)} availability rows ({len(changed)} changed, their cached slots invalidated)"
+        ))
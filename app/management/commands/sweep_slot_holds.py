@@ -0,0 +1,12 @@
+# app/management/commands/sweep_slot_holds.py
+from django.core.management.base import BaseCommand
+
+from app.booking import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Delete expired slot holds (run periodically, e.g. from cron)"
+
+    def handle(self, *args, **options):
+        removed = sweep_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired slot hold(s)"))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:29
+
+from datetime import date
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The hospital-wide day when this table was added: 30-minute slots from 9:00 to
+# 18:00 without the 13:00-14:00 lunch, Monday to Friday. Frozen here so later
+# changes to app.utils can't change what this migration writes.
+DAY_MINUTES = [m for m in range(9 * 60, 18 * 60, 30) if not 13 * 60 <= m < 14 * 60]
+
+
+def backfill_day_availability(apps, schema_editor):
+    """
+    Materialize every doctor/day from today on that already has bookings, so
+    full days are known before the signals start keeping rows current.
+    """
+    Appointment = apps.get_model('app', 'Appointment')
+    DoctorDayAvailability = apps.get_model('app', 'DoctorDayAvailability')
+    bit_of = {minute: bit for bit, minute in enumerate(DAY_MINUTES)}
+    full_mask = (1 << len(DAY_MINUTES)) - 1
+
+    booked = {}
+    appointments = Appointment.objects.filter(date__gte=date.today()).exclude(status='cancelled')
+    for doctor_id, day, slot in appointments.values_list('doctor_id', 'date', 'slot').iterator():
+        bit = bit_of.get(slot.hour * 60 + slot.minute)
+        mask = booked.get((doctor_id, day), 0)
+        booked[(doctor_id, day)] = mask | (1 << bit) if bit is not None else mask
+
+    rows = []
+    for (doctor_id, day), mask in booked.items():
+        free_mask = full_mask & ~mask if day.weekday() < 5 else 0
+        rows.append(DoctorDayAvailability(
+            doctor_id=doctor_id, date=day, free_mask=free_mask, free_count=bin(free_mask).count('1')
+        ))
+    DoctorDayAvailability.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_alter_document_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDayAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('free_mask', models.BigIntegerField()),
+                ('free_count', models.PositiveSmallIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_availability', to='app.doctor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'free_count'], name='app_dayavail_date_free_idx')],
+                'unique_together': {('doctor', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_day_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def cancel_duplicate_active_bookings(apps, schema_editor):
+    """
+    The old unique_together covered every status, so existing data can't hold
+    two active bookings for one slot. Guard anyway: if any slipped in, keep the
+    earliest booking and mark the rest cancelled so the new constraint applies.
+    """
+    Appointment = apps.get_model("app", "Appointment")
+    duplicates = (
+        Appointment.objects.exclude(status="cancelled")
+        .values("doctor_id", "date", "slot")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+    )
+    for dup in duplicates:
+        ids = list(
+            Appointment.objects.filter(
+                doctor_id=dup["doctor_id"], date=dup["date"], slot=dup["slot"]
+            )
+            .exclude(status="cancelled")
+            .order_by("created_at", "id")
+            .values_list("id", flat=True)
+        )
+        Appointment.objects.filter(id__in=ids[1:]).update(status="cancelled")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0005_doctordayavailability"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="appointment",
+            unique_together=set(),
+        ),
+        migrations.RunPython(
+            cancel_duplicate_active_bookings, migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "date", "status", "slot"],
+                name="app_appt_doc_date_status_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="appointment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "cancelled"), _negated=True),
+                fields=("doctor", "date", "slot"),
+                name="app_appointment_unique_active_slot",
+            ),
+        ),
+    ]
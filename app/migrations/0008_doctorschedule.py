@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0007_slothold"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DoctorSchedule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "weekday",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (0, "Monday"),
+                            (1, "Tuesday"),
+                            (2, "Wednesday"),
+                            (3, "Thursday"),
+                            (4, "Friday"),
+                            (5, "Saturday"),
+                            (6, "Sunday"),
+                        ]
+                    ),
+                ),
+                ("start_time", models.TimeField()),
+                ("end_time", models.TimeField()),
+                ("break_start", models.TimeField(blank=True, null=True)),
+                ("break_end", models.TimeField(blank=True, null=True)),
+                ("slot_duration", models.PositiveSmallIntegerField(default=30)),
+                (
+                    "doctor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="schedules",
+                        to="app.doctor",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["doctor", "weekday"],
+                "unique_together": {("doctor", "weekday")},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0010_waitlistentry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "date", "slot"], name="app_appt_doc_date_slot_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["patient", "date", "slot"], name="app_appt_pat_date_slot_idx"
+            ),
+        ),
+    ]
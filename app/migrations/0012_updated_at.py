@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:02
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    """
+    Existing rows got the migration time; their creation time is the best
+    known last change and keeps a first sync ordered by history.
+    """
+    apps.get_model("app", "Appointment").objects.update(updated_at=F("created_at"))
+    apps.get_model("app", "VisitNote").objects.update(updated_at=F("visit_date"))
+    apps.get_model("app", "Document").objects.update(updated_at=F("uploaded_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0011_appointment_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="appointment",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="visitnote",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "updated_at"], name="app_appt_doc_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["patient", "updated_at"], name="app_appt_pat_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="document",
+            index=models.Index(
+                fields=["patient", "updated_at"], name="app_doc_pat_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="visitnote",
+            index=models.Index(
+                fields=["doctor", "updated_at"], name="app_note_doc_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="visitnote",
+            index=models.Index(
+                fields=["patient", "updated_at"], name="app_note_pat_updated_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0013_appointmentevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="checksum",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="content_type",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="file_size",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0014_document_file_metadata"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("appointments", "Appointment"),
+                            ("visit_notes", "Visit note"),
+                            ("documents", "Document"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("patient_id", models.BigIntegerField(blank=True, null=True)),
+                ("doctor_id", models.BigIntegerField(blank=True, null=True)),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["doctor_id", "deleted_at"], name="app_deleted_doc_idx"
+                    ),
+                    models.Index(
+                        fields=["patient_id", "deleted_at"], name="app_deleted_pat_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
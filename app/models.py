@@ -48,9 +48,27 @@ class Appointment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='booked')
     prescription = models.TextField(blank=True, null=True)  # Added for backward compatibility
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ('doctor', 'date', 'slot')
+        constraints = [
+            # Cancelled rows don't hold the slot, so it can be booked again
+            models.UniqueConstraint(
+                fields=['doctor', 'date', 'slot'],
+                condition=~models.Q(status='cancelled'),
+                name='app_appointment_unique_active_slot',
+            ),
+        ]
+        indexes = [
+            # Covers the booked-slot lookups in app/utils.py without touching the table
+            models.Index(fields=['doctor', 'date', 'status', 'slot'], name='app_appt_doc_date_status_idx'),
+            # Keyset pagination walks these in (date, slot, id) order; id rides along as the rowid
+            models.Index(fields=['doctor', 'date', 'slot'], name='app_appt_doc_date_slot_idx'),
+            models.Index(fields=['patient', 'date', 'slot'], name='app_appt_pat_date_slot_idx'),
+            # /api/changes/ reads a doctor's or patient's rows changed since a cursor
+            models.Index(fields=['doctor', 'updated_at'], name='app_appt_doc_updated_idx'),
+            models.Index(fields=['patient', 'updated_at'], name='app_appt_pat_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.date} {self.slot} - {self.patient} with {self.doctor}"
@@ -61,9 +79,16 @@ class VisitNote(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     visit_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     notes = models.TextField()
     prescription = models.FileField(upload_to='prescriptions/', null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'updated_at'], name='app_note_doc_updated_idx'),
+            models.Index(fields=['patient', 'updated_at'], name='app_note_pat_updated_idx'),
+        ]
+
     def __str__(self):
         return f"Note for {self.patient} by {self.doctor} on {self.visit_date}"
 
@@ -81,10 +106,219 @@ class Document(models.Model):
     file = models.FileField(upload_to='documents/')
     doc_type = models.CharField(max_length=20, choices=DOC_TYPE_CHOICES, default='other')
     description = models.CharField(max_length=255, blank=True, null=True)  # Added description field
+    # Recorded at upload (app/documents.py) so lists never stat the file; null/blank until backfilled
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    checksum = models.CharField(max_length=64, blank=True)  # sha256 hex digest
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.doc_type} for {self.patient}"
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['patient', 'updated_at'], name='app_doc_pat_updated_idx'),
+        ]
+
+# Materialized free-slot mask per doctor and day (kept current by app/signals.py)
+class DoctorDayAvailability(models.Model):
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='day_availability')
+    date = models.DateField()
+    free_mask = models.BigIntegerField()  # bit i set = slot i of the day template is free
+    free_count = models.PositiveSmallIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('doctor', 'date')
+        indexes = [
+            models.Index(fields=['date', 'free_count'], name='app_dayavail_date_free_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} on {self.date}: {self.free_count} free"
+
+# Short-lived reservation of a slot while a patient completes the booking form
+class SlotHold(models.Model):
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
+    date = models.DateField()
+    slot = models.TimeField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('doctor', 'date', 'slot')
+        indexes = [
+            models.Index(fields=['expires_at'], name='app_slothold_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"Hold {self.date} {self.slot} with {self.doctor} for {self.patient} until {self.expires_at}"
+
+# Weekly working hours per doctor; a doctor without rows works the default 9-6, Mon-Fri day
+class DoctorSchedule(models.Model):
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='schedules')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    break_start = models.TimeField(null=True, blank=True)
+    break_end = models.TimeField(null=True, blank=True)
+    slot_duration = models.PositiveSmallIntegerField(default=30)  # minutes
+
+    class Meta:
+        unique_together = ('doctor', 'weekday')
+        ordering = ['doctor', 'weekday']
+
+    def __str__(self):
+        return f"{self.doctor} {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
+class Holiday(models.Model):
+    name = models.CharField(max_length=100)
+    start_date = models.DateField()
+    end_date = models.DateField()  # inclusive; same as start_date for a one-day holiday
+
+    class Meta:
+        ordering = ['start_date']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(end_date__gte=models.F('start_date')),
+                name='app_holiday_end_after_start',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.start_date} - {self.end_date})"
+
+class DoctorLeave(models.Model):
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='leaves')
+    start_date = models.DateField()
+    end_date = models.DateField()  # inclusive
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['doctor', 'start_date']
+        indexes = [models.Index(fields=['doctor', 'end_date'])]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(end_date__gte=models.F('start_date')),
+                name='app_doctorleave_end_after_start',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} off {self.start_date} - {self.end_date}"
+
+class WaitlistEntry(models.Model):
+    STATUS_CHOICES = [
+        ('waiting', 'Waiting'),
+        ('offered', 'Offered'),
+        ('assigned', 'Assigned'),
+        ('declined', 'Declined'),
+        ('expired', 'Expired'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='waitlist_entries')
+    # Either a specific doctor, or any doctor of a specialization
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, null=True, blank=True, related_name='waitlist_entries')
+    specialization = models.CharField(max_length=120, blank=True)
+    start_date = models.DateField()
+    end_date = models.DateField()  # inclusive
+    auto_book = models.BooleanField(default=True)  # book a freed slot outright instead of holding it as an offer
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
+
+    # The slot given to the patient, once matched
+    offered_doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    offered_date = models.DateField(null=True, blank=True)
+    offered_slot = models.TimeField(null=True, blank=True)
+    offer_expires_at = models.DateTimeField(null=True, blank=True)
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # Matcher lookups: waiting entries for a doctor / a specialization covering a date
+            models.Index(fields=['status', 'doctor', 'start_date'], name='app_waitlist_doctor_idx'),
+            models.Index(fields=['status', 'specialization', 'start_date'], name='app_waitlist_spec_idx'),
+            models.Index(fields=['status', 'offer_expires_at'], name='app_waitlist_offer_idx'),
+        ]
+
+    def __str__(self):
+        target = self.doctor or self.specialization
+        return f"{self.patient} waiting for {target} ({self.start_date} - {self.end_date})"
+
+# Appointment changes for the /api/events/ push stream, written in the same
+# transaction as the change and read by every ASGI worker (see app/events.py)
+class AppointmentEvent(models.Model):
+    KIND_CHOICES = [
+        ('created', 'Created'),
+        ('cancelled', 'Cancelled'),
+        ('completed', 'Completed'),
+        ('rescheduled', 'Rescheduled'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    appointment_id = models.BigIntegerField()  # plain id: the event outlives a deleted appointment
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='+')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='+')
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Appointment {self.appointment_id} {self.kind} at {self.created_at}"
+
+
+# Deleted appointments, visit notes and documents for the /api/changes/ sync
+# (see app/sync.py). Plain ids: the rows they describe, and possibly their
+# doctor or patient, are gone.
+class DeletedRecord(models.Model):
+    KIND_CHOICES = [
+        ('appointments', 'Appointment'),
+        ('visit_notes', 'Visit note'),
+        ('documents', 'Document'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # Who stops seeing the row; a document tombstone with a doctor and no
+    # patient only hides it from a doctor who no longer treats the patient
+    patient_id = models.BigIntegerField(null=True, blank=True)
+    doctor_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor_id', 'deleted_at'], name='app_deleted_doc_idx'),
+            models.Index(fields=['patient_id', 'deleted_at'], name='app_deleted_pat_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted at {self.deleted_at}"
+
+
+# Single-use tickets that open one /api/events/ stream. EventSource can't send
+# headers, so a ticket goes in the URL instead of the user's API token.
+class StreamTicket(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Stream ticket for {self.user} until {self.expires_at}"
@@ -0,0 +1,99 @@
+# app/pagination.py
+import base64
+from datetime import date, datetime, time
+from typing import Optional
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Appointments newest first; id breaks ties so every row has a unique position
+KEYSET_ORDERING = ('-date', '-slot', '-id')
+
+def _field(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+def encode_cursor(row) -> str:
+    """
+    Opaque cursor pointing just after an appointment row
+    
+    Args:
+        row: Appointment instance or values() dict with date, slot and id
+    """
+    row_date, row_slot = _field(row, 'date'), _field(row, 'slot')
+    if isinstance(row_date, str):
+        row_date = datetime.strptime(row_date, "%Y-%m-%d").date()
+    if isinstance(row_slot, str):
+        row_slot = time.fromisoformat(row_slot)
+    raw = f"{row_date.isoformat()}|{row_slot.strftime('%H:%M:%S')}|{_field(row, 'id')}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Turn a cursor back into (date, slot, id)
+    
+    Raises:
+        NotFound: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        row_date, row_slot, row_id = raw.split('|')
+        return date.fromisoformat(row_date), time.fromisoformat(row_slot), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound("Invalid cursor")
+
+def after_cursor(queryset, cursor: Optional[str]):
+    """
+    Restrict an appointment queryset to the rows after a cursor, newest first
+    
+    The predicate is written as a range on date plus a tie-break, so the
+    database can seek straight to the position through the (…, date, slot)
+    indexes instead of skipping over an offset.
+    """
+    queryset = queryset.order_by(*KEYSET_ORDERING)
+    if not cursor:
+        return queryset
+    row_date, row_slot, row_id = decode_cursor(cursor)
+    return queryset.filter(
+        Q(date__lte=row_date),
+        Q(date__lt=row_date) | Q(slot__lt=row_slot) | Q(slot=row_slot, id__lt=row_id),
+    )
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over appointments on (date, slot, id), newest first.
+    Every page is an index seek from the last row of the previous one, so deep
+    pages cost the same as the first.
+    """
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        rows = list(after_cursor(queryset, request.query_params.get(self.cursor_query_param))[:size + 1])
+        self.next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+        return rows[:size]
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "next_cursor": self.next_cursor,
+            "results": data,
+        })
@@ -0,0 +1,122 @@
+# app/renderers.py
+from collections.abc import Iterator
+from typing import Iterable
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional: without it the renderers fall back to DRF's encoder
+    orjson = None
+
+# Rows encoded per chunk of a streamed array
+STREAM_CHUNK_ROWS = 500
+
+_LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    DRF's JSONRenderer on orjson when it is installed
+
+    Dates, times, datetimes and anything orjson doesn't know natively go
+    through DRF's encoder, so values come out as they do with the stock
+    renderer. Indented output (the browsable API, `; indent=` in Accept) keeps
+    the stock path.
+    """
+    _default = JSONEncoder().default
+
+    def dumps(self, data) -> bytes:
+        """Compact JSON bytes for data"""
+        if orjson is None:
+            return super().render(data)
+        ret = orjson.dumps(
+            data, default=self._default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # Like the stock renderer: these are valid JSON but end a line in JavaScript
+        for raw, escaped in _LINE_SEPARATORS:
+            if raw in ret:
+                ret = ret.replace(raw, escaped)
+        return ret
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return self.dumps(data)
+
+def is_stream(value) -> bool:
+    """Whether a value is a one-shot iterator (generator, map, queryset iterator) to stream"""
+    return isinstance(value, Iterator) and not isinstance(value, (str, bytes, dict))
+
+class StreamingJSONRenderer(FastJSONRenderer):
+    """
+    Encodes a response in chunks: iterators in the data (the top level, or
+    values of a top-level dict) become JSON arrays written STREAM_CHUNK_ROWS
+    rows at a time, so only one chunk of rows is in memory at once.
+    """
+
+    def stream(self, data) -> Iterable[bytes]:
+        """
+        JSON for data as a sequence of byte chunks
+
+        Args:
+            data: JSON-able data; iterators in it are consumed lazily
+        """
+        if is_stream(data):
+            yield from self.stream_array(data)
+        elif isinstance(data, dict) and any(is_stream(value) for value in data.values()):
+            yield b'{'
+            for index, (key, value) in enumerate(data.items()):
+                prefix = (b',' if index else b'') + self.dumps(str(key)) + b':'
+                if is_stream(value):
+                    yield prefix
+                    yield from self.stream_array(value)
+                else:
+                    yield prefix + self.dumps(value)
+            yield b'}'
+        else:
+            yield self.dumps(data)
+
+    def stream_array(self, rows) -> Iterable[bytes]:
+        yield b'['
+        first, batch = True, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= STREAM_CHUNK_ROWS:
+                yield (b'' if first else b',') + self.dumps(batch)[1:-1]
+                first, batch = False, []
+        if batch:
+            yield (b'' if first else b',') + self.dumps(batch)[1:-1]
+        yield b']'
+
+async def _async_chunks(chunks):
+    # The request's own sync thread, where its database connection (and any open cursor) lives
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    """
+    application/json response streamed through StreamingJSONRenderer
+
+    Args:
+        data: Response data; iterators in it are streamed (see StreamingJSONRenderer)
+        request: Current request; under ASGI chunks are produced on the request's
+            sync thread without collecting the whole body first
+        status: HTTP status
+    """
+
+    def __init__(self, data, request=None, status=200, **kwargs):
+        chunks = StreamingJSONRenderer().stream(data)
+        if isinstance(getattr(request, '_request', request), ASGIRequest):
+            chunks = _async_chunks(chunks)
+        super().__init__(chunks, status=status, content_type='application/json', **kwargs)
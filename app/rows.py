@@ -0,0 +1,387 @@
+# app/rows.py
+from collections import defaultdict
+from datetime import date
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from rest_framework import serializers
+
+from .models import Appointment, Document, VisitNote
+
+# Read-only list path for the AppointmentSerializer, DocumentSerializer and
+# VisitNoteSerializer output shapes. Rows come from .values() (no model
+# instances, no per-field serializer machinery) and go through a row-to-dict
+# function built once per request. The dicts match the serializers key for key
+# and value for value, so the rendered JSON is byte-identical; app/tests.py
+# checks that and `manage.py bench_rows` compares the speed of both paths.
+# Writes and single objects keep using the serializers.
+#
+# Appointments and documents honour sparse fieldsets (SparseFieldsMixin's
+# selected_fields()): each output field has its own getter and the columns it
+# reads, so fields left out are neither computed nor selected, and the visit
+# notes query only runs when a field built from the notes is requested.
+
+# DRF's own representations, so dates and timestamps come out exactly as the serializers render them
+_date = serializers.DateField().to_representation
+_time = serializers.TimeField().to_representation
+_datetime = serializers.DateTimeField().to_representation
+
+def _full_name(first_name: str, last_name: str, username: str) -> str:
+    # User.get_full_name() or username
+    return f"{first_name} {last_name}".strip() or username
+
+def _name_getter(prefix: str) -> Callable[[dict], str]:
+    first, last, username = (f"{prefix}__first_name", f"{prefix}__last_name", f"{prefix}__username")
+    return lambda row: _full_name(row[first], row[last], row[username])
+
+def _name_columns(prefix: str) -> tuple:
+    return (f"{prefix}__first_name", f"{prefix}__last_name", f"{prefix}__username")
+
+def _compile(getters: Dict[str, Callable[[dict], object]], fields: Optional[Sequence[str]]) -> Callable[[dict], dict]:
+    """Row function returning the chosen fields (all, in getter order, for None)"""
+    selected = [(name, getters[name]) for name in (getters if fields is None else fields) if name in getters]
+
+    def to_dict(row):
+        return {name: get(row) for name, get in selected}
+    return to_dict
+
+def _columns(field_columns: Dict[str, tuple], fields: Optional[Sequence[str]], always: tuple = ()) -> List[str]:
+    """values() columns the chosen fields read"""
+    columns = dict.fromkeys(always)
+    for name in (field_columns if fields is None else fields):
+        columns.update(dict.fromkeys(field_columns.get(name, ())))
+    return list(columns)
+
+def _url_builder(field, request) -> Callable[[Optional[str]], Optional[str]]:
+    """File name -> URL as DRF's FileField renders it (absolute when there is a request)"""
+    storage = field.storage
+
+    def url(name):
+        if not name:
+            return None
+        location = storage.url(name)
+        return request.build_absolute_uri(location) if request is not None else location
+    return url
+
+# -------------------------
+# VISIT NOTES
+# -------------------------
+
+VISIT_NOTE_COLUMNS = (
+    'id', 'appointment_id', 'patient_id', 'doctor_id', 'visit_date', 'updated_at', 'notes', 'prescription',
+    'patient__profile__user__first_name', 'patient__profile__user__last_name', 'patient__profile__user__username',
+    'doctor__profile__user__first_name', 'doctor__profile__user__last_name', 'doctor__profile__user__username',
+    'appointment__date', 'appointment__slot', 'appointment__status',
+)
+
+def visit_note_row_function(request=None) -> Callable[[dict], dict]:
+    """
+    Compile a VisitNoteSerializer-shaped row function
+
+    Args:
+        request: Current request (file URLs are made absolute with it)
+
+    Returns:
+        Callable[[dict], dict]: Maps a VISIT_NOTE_COLUMNS values() row to the serializer's dict
+    """
+    file_url = _url_builder(VisitNote._meta.get_field('prescription'), request)
+
+    def to_dict(row):
+        visit_date = row['visit_date']
+        prescription = file_url(row['prescription'])
+        appointment_id = row['appointment_id']
+        return {
+            'id': row['id'],
+            'appointment': appointment_id,
+            'patient': row['patient_id'],
+            'patient_name': _full_name(row['patient__profile__user__first_name'],
+                                       row['patient__profile__user__last_name'],
+                                       row['patient__profile__user__username']),
+            'doctor': row['doctor_id'],
+            'doctor_name': _full_name(row['doctor__profile__user__first_name'],
+                                      row['doctor__profile__user__last_name'],
+                                      row['doctor__profile__user__username']),
+            'visit_date': _datetime(visit_date),
+            'updated_at': _datetime(row['updated_at']),
+            'formatted_visit_date': visit_date.strftime("%B %d, %Y at %I:%M %p") if visit_date else None,
+            'notes': row['notes'],
+            'prescription': prescription,
+            'prescription_file_url': prescription,
+            'appointment_details': {
+                'id': appointment_id,
+                'date': row['appointment__date'],
+                'slot': row['appointment__slot'],
+                'status': row['appointment__status'],
+            } if appointment_id is not None else None,
+        }
+    return to_dict
+
+def visit_note_rows(queryset, request=None) -> List[dict]:
+    """VisitNoteSerializer(queryset, many=True).data, read through .values()"""
+    to_dict = visit_note_row_function(request)
+    return [to_dict(row) for row in queryset.values(*VISIT_NOTE_COLUMNS)]
+
+# -------------------------
+# APPOINTMENTS
+# -------------------------
+
+_PATIENT = 'patient__profile__user'
+_DOCTOR = 'doctor__profile__user'
+
+# Columns each AppointmentSerializer field reads, in the serializer's field order
+APPOINTMENT_FIELD_COLUMNS = {
+    'id': ('id',),
+    'patient': ('patient_id',),
+    'patient_name': _name_columns(_PATIENT),
+    'patient_username': (f"{_PATIENT}__username",),
+    'doctor': ('doctor_id',),
+    'doctor_name': _name_columns(_DOCTOR),
+    'doctor_username': (f"{_DOCTOR}__username",),
+    'specialization': ('doctor__specialization',),
+    'date': ('date',),
+    'formatted_date': ('date',),
+    'slot': ('slot',),
+    'formatted_time': ('slot',),
+    'formatted_datetime': ('date', 'slot'),
+    'status': ('status',),
+    'prescription': ('prescription',),
+    'prescription_file': (),
+    'has_prescription': ('prescription',),
+    'created_at': ('created_at',),
+    'updated_at': ('updated_at',),
+    'can_cancel': ('status', 'date'),
+    'can_update': ('status', 'date'),
+    'visit_notes': (),
+}
+# Fields built from the appointment's visit notes
+APPOINTMENT_NOTE_FIELDS = {'prescription', 'prescription_file', 'has_prescription', 'visit_notes'}
+
+def appointment_values(queryset, fields: Optional[Sequence[str]] = None):
+    """
+    The columns appointment_rows() needs, as a values() queryset (paginate this one)
+
+    Args:
+        queryset: Appointment queryset
+        fields: Output fields (None for all); date, slot and id are always read for the keyset cursor
+    """
+    return queryset.values(*_columns(APPOINTMENT_FIELD_COLUMNS, fields, always=('id', 'date', 'slot')))
+
+def notes_by_appointment(appointment_ids: Iterable[int], request=None) -> Dict[int, List[dict]]:
+    """Serialized visit notes of some appointments, newest first (one query)"""
+    to_dict = visit_note_row_function(request)
+    notes = defaultdict(list)
+    rows = VisitNote.objects.filter(appointment_id__in=list(appointment_ids)).values(*VISIT_NOTE_COLUMNS)
+    for row in sorted(rows, key=lambda row: (row['visit_date'], row['id']), reverse=True):
+        notes[row['appointment_id']].append(to_dict(row))
+    return notes
+
+def _formatted_date(row):
+    return row['date'].strftime("%B %d, %Y") if row['date'] else None
+
+def _formatted_time(row):
+    return row['slot'].strftime("%I:%M %p") if row['slot'] else None
+
+def _latest_note(row):
+    notes = row['visit_notes']
+    return notes[0] if notes else None
+
+def appointment_row_function(request=None, fields: Optional[Sequence[str]] = None) -> Callable[[dict], dict]:
+    """
+    Compile an AppointmentSerializer-shaped row function
+
+    Args:
+        request: Current request
+        fields: Output fields (None for all)
+
+    Returns:
+        Callable[[dict], dict]: Maps an appointment_values() row, with its serialized
+        visit notes (newest first) under 'visit_notes', to the serializer's dict
+    """
+    today = date.today()
+
+    def prescription(row):
+        latest = _latest_note(row)
+        return latest['notes'] if latest and latest['notes'] else (row['prescription'] or None)
+
+    def prescription_file(row):
+        latest = _latest_note(row)
+        return latest['prescription_file_url'] if latest else None
+
+    def has_prescription(row):
+        latest = _latest_note(row)
+        return True if latest and (latest['notes'] or latest['prescription']) else bool(row['prescription'])
+
+    def open_booking(row):
+        return row['status'] == 'booked' and row['date'] >= today
+
+    def formatted_datetime(row):
+        return f"{_formatted_date(row)} at {_formatted_time(row)}" if row['date'] and row['slot'] else None
+
+    return _compile({
+        'id': itemgetter('id'),
+        'patient': itemgetter('patient_id'),
+        'patient_name': _name_getter(_PATIENT),
+        'patient_username': itemgetter(f"{_PATIENT}__username"),
+        'doctor': itemgetter('doctor_id'),
+        'doctor_name': _name_getter(_DOCTOR),
+        'doctor_username': itemgetter(f"{_DOCTOR}__username"),
+        'specialization': itemgetter('doctor__specialization'),
+        'date': lambda row: _date(row['date']),
+        'formatted_date': _formatted_date,
+        'slot': lambda row: _time(row['slot']),
+        'formatted_time': _formatted_time,
+        'formatted_datetime': formatted_datetime,
+        'status': itemgetter('status'),
+        'prescription': prescription,
+        'prescription_file': prescription_file,
+        'has_prescription': has_prescription,
+        'created_at': lambda row: _datetime(row['created_at']),
+        'updated_at': lambda row: _datetime(row['updated_at']),
+        'can_cancel': open_booking,
+        'can_update': open_booking,
+        'visit_notes': itemgetter('visit_notes'),
+    }, fields)
+
+def appointment_rows(rows: Iterable[dict], request=None, fields: Optional[Sequence[str]] = None) -> List[dict]:
+    """
+    AppointmentSerializer(..., many=True).data for appointment_values() rows
+
+    Args:
+        rows: appointment_values() queryset or a page of its rows
+        request: Current request
+        fields: Output fields, as given to appointment_values() (None for all)
+    """
+    rows = list(rows)
+    if fields is None or APPOINTMENT_NOTE_FIELDS.intersection(fields):
+        notes = notes_by_appointment([row['id'] for row in rows], request)
+        for row in rows:
+            row['visit_notes'] = notes.get(row['id'], [])
+    to_dict = appointment_row_function(request, fields)
+    return [to_dict(row) for row in rows]
+
+# -------------------------
+# DOCUMENTS
+# -------------------------
+
+_OWNER = 'patient__profile__user'
+_APPOINTMENT_DOCTOR = 'appointment__doctor__profile__user'
+
+# Columns each DocumentSerializer field reads, in the serializer's field order
+DOCUMENT_FIELD_COLUMNS = {
+    'id': ('id',),
+    'patient': ('patient_id',),
+    'patient_name': _name_columns(_OWNER),
+    'patient_username': (f"{_OWNER}__username",),
+    'appointment': ('appointment_id',),
+    'appointment_info': ('appointment_id', 'appointment__date', 'appointment__slot', 'appointment__status')
+                        + _name_columns(_APPOINTMENT_DOCTOR),
+    'doctor_name': ('appointment_id',) + _name_columns(_APPOINTMENT_DOCTOR),
+    'file': ('file',),
+    'file_url': ('file',),
+    'file_name': ('file',),
+    'file_size': ('file', 'file_size'),
+    'file_type': ('file',),
+    'content_type': ('content_type',),
+    'checksum': ('checksum',),
+    'doc_type': ('doc_type',),
+    'doc_type_display': ('doc_type',),
+    'description': ('description',),
+    'uploaded_at': ('uploaded_at',),
+    'updated_at': ('updated_at',),
+    'formatted_upload_date': ('uploaded_at',),
+    'can_delete': (f"{_OWNER}_id",),
+}
+
+def document_row_function(request=None, include_file_size: bool = True,
+                          fields: Optional[Sequence[str]] = None) -> Callable[[dict], dict]:
+    """
+    Compile a DocumentSerializer-shaped row function
+
+    Args:
+        request: Current request (file URLs and can_delete depend on it)
+        include_file_size: Stat files whose size isn't stored yet (the serializer's context flag)
+        fields: Output fields (None for all)
+
+    Returns:
+        Callable[[dict], dict]: Maps a document values() row to the serializer's dict
+    """
+    file_field = Document._meta.get_field('file')
+    file_url = _url_builder(file_field, request)
+    doc_types = dict(Document.DOC_TYPE_CHOICES)
+    doctor_name = _name_getter(_APPOINTMENT_DOCTOR)
+
+    user = getattr(request, 'user', None)
+    authenticated = user is not None and user.is_authenticated
+    user_id = user.pk if authenticated else None
+    privileged = authenticated and (user.is_staff or user.is_superuser)
+
+    def file_size(row):
+        if row['file_size'] is not None:
+            return row['file_size']
+        if row['file'] and include_file_size:
+            try:
+                return file_field.storage.size(row['file'])
+            except (ValueError, OSError):
+                return None
+        return None
+
+    def appointment_info(row):
+        if row['appointment_id'] is None:
+            return None
+        return {
+            'id': row['appointment_id'],
+            'date': row['appointment__date'],
+            'slot': row['appointment__slot'],
+            'status': row['appointment__status'],
+            'doctor_name': doctor_name(row),
+        }
+
+    def file_type(row):
+        name = row['file']
+        return (name.split('.')[-1].upper() if '.' in name else 'Unknown') if name else None
+
+    def formatted_upload_date(row):
+        return row['uploaded_at'].strftime("%B %d, %Y at %I:%M %p") if row['uploaded_at'] else None
+
+    def url(row):
+        return file_url(row['file'])
+
+    return _compile({
+        'id': itemgetter('id'),
+        'patient': itemgetter('patient_id'),
+        'patient_name': _name_getter(_OWNER),
+        'patient_username': itemgetter(f"{_OWNER}__username"),
+        'appointment': itemgetter('appointment_id'),
+        'appointment_info': appointment_info,
+        'doctor_name': lambda row: doctor_name(row) if row['appointment_id'] is not None else None,
+        'file': url,
+        'file_url': url,
+        'file_name': lambda row: row['file'].split('/')[-1] if row['file'] else None,
+        'file_size': file_size,
+        'file_type': file_type,
+        'content_type': itemgetter('content_type'),
+        'checksum': itemgetter('checksum'),
+        'doc_type': itemgetter('doc_type'),
+        'doc_type_display': lambda row: doc_types.get(row['doc_type'], row['doc_type']),
+        'description': itemgetter('description'),
+        'uploaded_at': lambda row: _datetime(row['uploaded_at']),
+        'updated_at': lambda row: _datetime(row['updated_at']),
+        'formatted_upload_date': formatted_upload_date,
+        'can_delete': lambda row: authenticated and (row[f"{_OWNER}_id"] == user_id or privileged),
+    }, fields)
+
+def document_values(queryset, fields: Optional[Sequence[str]] = None):
+    """The columns document rows need for some output fields (None for all), as a values() queryset"""
+    return queryset.values(*_columns(DOCUMENT_FIELD_COLUMNS, fields))
+
+def document_rows(queryset, request=None, include_file_size: bool = True,
+                  fields: Optional[Sequence[str]] = None) -> List[dict]:
+    """DocumentSerializer(queryset, many=True).data, read through .values()"""
+    to_dict = document_row_function(request, include_file_size, fields)
+    return [to_dict(row) for row in document_values(queryset, fields)]
+
+def iter_document_rows(queryset, request=None, include_file_size: bool = True,
+                       fields: Optional[Sequence[str]] = None, chunk_size: int = 2000) -> Iterator[dict]:
+    """document_rows() one at a time, fetched from the database in chunks (for streamed responses)"""
+    to_dict = document_row_function(request, include_file_size, fields)
+    return map(to_dict, document_values(queryset, fields).iterator(chunk_size=chunk_size))
@@ -1,7 +1,58 @@
 # app/serializers.py
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Profile, Doctor, Patient, Appointment, VisitNote, Document
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Profile, Doctor, Patient, Appointment, VisitNote, Document, DoctorSchedule, DoctorLeave, Holiday
+from .models import WaitlistEntry
+from datetime import date, timedelta
+from typing import Iterable, List, Optional
+
+# -------------------------
+# SPARSE FIELDSETS
+# -------------------------
+
+def _field_names(value) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return [name.strip() for name in value if name.strip()]
+
+class SparseFieldsMixin:
+    """
+    Lets readers choose the output fields, with `fields=` / `exclude=` keyword
+    arguments or `?fields=a,b` / `?exclude=c` on the GET request in the context.
+    Fields left out are dropped before serialization, so their
+    SerializerMethodFields never run. Unknown names are ignored; serializers
+    given `data=` keep every field.
+    """
+
+    @classmethod
+    def selected_fields(cls, request=None, fields: Optional[Iterable[str]] = None,
+                        exclude: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Output fields for explicit lists or a request's query string, in Meta.fields order
+
+        Args:
+            request: Current request (read when neither list is given)
+            fields: Only these fields
+            exclude: Not these fields
+        """
+        if fields is None and exclude is None and request is not None and request.method == 'GET':
+            params = getattr(request, 'query_params', request.GET)
+            fields, exclude = params.get('fields'), params.get('exclude')
+        fields, exclude = _field_names(fields), set(_field_names(exclude) or ())
+        return [name for name in cls.Meta.fields if (fields is None or name in fields) and name not in exclude]
+
+    def __init__(self, *args, fields=None, exclude=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'data' in kwargs:
+            return
+        keep = set(self.selected_fields(self.context.get('request'), fields, exclude))
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
 
 # -------------------------
 # USER & PROFILE SERIALIZERS
@@ -79,11 +130,80 @@ class ProfileSerializer(serializers.ModelSerializer):
 
         return instance
 
+# -------------------------
+# STATISTICS ANNOTATIONS
+# -------------------------
+
+# Serializer fields read from the profile or its user
+PROFILE_FIELDS = {'name', 'full_name', 'username', 'email', 'phone', 'role', 'user_id'}
+
+def _only(annotations: dict, fields: Optional[Iterable[str]]) -> dict:
+    return annotations if fields is None else {name: value for name, value in annotations.items() if name in fields}
+
+def annotate_doctor_stats(queryset, fields: Optional[Iterable[str]] = None):
+    """
+    Appointment counts per doctor in the listing query itself, one join with
+    conditional counts instead of a COUNT query per doctor and statistic
+
+    Args:
+        queryset: Doctor queryset
+        fields: Serializer fields that will be output (None for all); only their joins and counts are added
+    """
+    today = date.today()
+    if fields is None or PROFILE_FIELDS & set(fields):
+        queryset = queryset.select_related('profile__user')
+    return queryset.annotate(**_only({
+        'total_appointments': Count('appointment'),
+        'today_appointments': Count('appointment', filter=Q(appointment__date=today)),
+        'completed_appointments': Count('appointment', filter=Q(appointment__status='completed')),
+        'total_patients': Count('appointment__patient', distinct=True),
+    }, fields))
+
+def annotate_patient_stats(queryset, with_last_appointment=False, fields: Optional[Iterable[str]] = None):
+    """
+    Appointment and document counts per patient in the listing query itself.
+    Documents are counted in a subquery so the two relations don't multiply rows.
+    
+    Args:
+        queryset: Patient queryset
+        with_last_appointment: Also annotate the latest past appointment's date, status and doctor
+        fields: Serializer fields that will be output (None for all); only their joins and counts are added
+    """
+    today = date.today()
+    documents = Document.objects.filter(patient=OuterRef('pk')).order_by().values('patient').annotate(
+        n=Count('id')
+    ).values('n')
+    if fields is None or PROFILE_FIELDS & set(fields):
+        queryset = queryset.select_related('profile__user')
+    queryset = queryset.annotate(**_only({
+        'total_appointments': Count('appointment'),
+        'upcoming_appointments': Count('appointment', filter=Q(appointment__date__gte=today)),
+        'completed_appointments': Count('appointment', filter=Q(appointment__status='completed')),
+        'total_documents': Coalesce(Subquery(documents, output_field=IntegerField()), Value(0)),
+    }, fields))
+    if with_last_appointment and (fields is None or 'last_appointment' in fields):
+        last = Appointment.objects.filter(patient=OuterRef('pk'), date__lt=today).order_by('-date', '-slot')
+        queryset = queryset.annotate(**{
+            f'last_appointment_{name}': Subquery(last.values(field)[:1])
+            for name, field in (
+                ('date', 'date'), ('status', 'status'),
+                ('doctor_first_name', 'doctor__profile__user__first_name'),
+                ('doctor_last_name', 'doctor__profile__user__last_name'),
+                ('doctor_username', 'doctor__profile__user__username'),
+            )
+        })
+    return queryset
+
+def annotated(obj, name, fallback):
+    """A statistic annotated by annotate_*_stats(), or its fallback query for a plain instance"""
+    value = getattr(obj, name, None)
+    return fallback() if value is None else value
+
 # -------------------------
 # DOCTOR & PATIENT SERIALIZERS
 # -------------------------
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     name = serializers.SerializerMethodField()
     full_name = serializers.SerializerMethodField()
     username = serializers.CharField(source='profile.user.username', read_only=True)
@@ -106,6 +226,10 @@ class DoctorSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
 
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None):
+        return annotate_doctor_stats(queryset, fields)
+
     def get_name(self, obj):
         return obj.profile.user.get_full_name() or obj.profile.user.username
 
@@ -113,16 +237,15 @@ class DoctorSerializer(serializers.ModelSerializer):
         return obj.profile.user.get_full_name() or obj.profile.user.username
 
     def get_total_appointments(self, obj):
-        return obj.appointment_set.count()
+        return annotated(obj, 'total_appointments', obj.appointment_set.count)
 
     def get_today_appointments(self, obj):
-        from datetime import date
-        return obj.appointment_set.filter(date=date.today()).count()
+        return annotated(obj, 'today_appointments', obj.appointment_set.filter(date=date.today()).count)
 
     def get_total_patients(self, obj):
-        return obj.appointment_set.values('patient').distinct().count()
+        return annotated(obj, 'total_patients', obj.appointment_set.values('patient').distinct().count)
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     name = serializers.SerializerMethodField()
     full_name = serializers.SerializerMethodField()
     username = serializers.CharField(source='profile.user.username', read_only=True)
@@ -144,6 +267,10 @@ class PatientSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
 
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None):
+        return annotate_patient_stats(queryset, fields=fields)
+
     def get_name(self, obj):
         return obj.profile.user.get_full_name() or obj.profile.user.username
 
@@ -151,20 +278,121 @@ class PatientSerializer(serializers.ModelSerializer):
         return obj.profile.user.get_full_name() or obj.profile.user.username
 
     def get_total_appointments(self, obj):
-        return obj.appointment_set.count()
+        return annotated(obj, 'total_appointments', obj.appointment_set.count)
 
     def get_upcoming_appointments(self, obj):
-        from datetime import date
-        return obj.appointment_set.filter(date__gte=date.today()).count()
+        return annotated(obj, 'upcoming_appointments', obj.appointment_set.filter(date__gte=date.today()).count)
 
     def get_total_documents(self, obj):
-        return obj.document_set.count()
+        return annotated(obj, 'total_documents', obj.document_set.count)
+
+class DoctorScheduleSerializer(serializers.ModelSerializer):
+    weekday_display = serializers.CharField(source='get_weekday_display', read_only=True)
+
+    class Meta:
+        model = DoctorSchedule
+        fields = ['weekday', 'weekday_display', 'start_time', 'end_time', 'break_start', 'break_end', 'slot_duration']
+
+    def validate(self, data):
+        """
+        Validate working hours for one weekday
+        """
+        start, end = data.get('start_time'), data.get('end_time')
+        break_start, break_end = data.get('break_start'), data.get('break_end')
+
+        if start and end and start >= end:
+            raise serializers.ValidationError("end_time must be after start_time")
+        if (break_start is None) != (break_end is None):
+            raise serializers.ValidationError("break_start and break_end must be given together")
+        if break_start and break_end:
+            if break_start >= break_end:
+                raise serializers.ValidationError("break_end must be after break_start")
+            if break_start < start or break_end > end:
+                raise serializers.ValidationError("Break must fall within working hours")
+        if not 5 <= data.get('slot_duration', 30) <= 240:
+            raise serializers.ValidationError("slot_duration must be between 5 and 240 minutes")
+        if start and end:
+            from .utils import get_slot_template, MAX_DAY_SLOTS, NO_BREAK
+            template = get_slot_template(start, end, break_start or NO_BREAK, break_end or NO_BREAK,
+                                         data.get('slot_duration', 30))
+            if len(template.minutes) > MAX_DAY_SLOTS:
+                raise serializers.ValidationError(
+                    f"A day can have at most {MAX_DAY_SLOTS} slots; this one has {len(template.minutes)}. "
+                    "Use longer slots or shorter hours."
+                )
+        return data
+
+class DoctorLeaveSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DoctorLeave
+        fields = ['id', 'start_date', 'end_date', 'reason', 'created_at']
+        read_only_fields = ['created_at']
+
+    def validate(self, data):
+        """
+        Validate the leave date range
+        """
+        if data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        return data
+
+class HolidaySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Holiday
+        fields = ['id', 'name', 'start_date', 'end_date']
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    doctor_id = serializers.PrimaryKeyRelatedField(
+        source='doctor', queryset=Doctor.objects.all(), required=False, allow_null=True
+    )
+    offered_doctor_id = serializers.PrimaryKeyRelatedField(source='offered_doctor', read_only=True)
+    appointment_id = serializers.PrimaryKeyRelatedField(source='appointment', read_only=True)
+
+    # Longest date window a patient can wait for
+    MAX_WINDOW_DAYS = 90
+
+    class Meta:
+        model = WaitlistEntry
+        fields = [
+            'id', 'doctor_id', 'specialization', 'start_date', 'end_date', 'auto_book', 'status',
+            'offered_doctor_id', 'offered_date', 'offered_slot', 'offer_expires_at', 'appointment_id', 'created_at'
+        ]
+        read_only_fields = ['status', 'offered_date', 'offered_slot', 'offer_expires_at', 'created_at']
+
+    def validate(self, data):
+        """
+        Validate the waitlist target and date window
+        """
+        doctor = data.get('doctor')
+        specialization = data.get('specialization', '').strip()
+        if doctor is None and not specialization:
+            raise serializers.ValidationError("doctor_id or specialization required")
+        if doctor is not None:
+            # A specific doctor takes precedence over the specialization
+            data['specialization'] = ''
+        else:
+            # Store the specialization exactly as doctors have it so the matcher can use the index
+            match = Doctor.objects.filter(specialization__iexact=specialization).values_list(
+                'specialization', flat=True
+            ).first()
+            if match is None:
+                raise serializers.ValidationError("No doctors with this specialization")
+            data['specialization'] = match
+
+        start, end = data['start_date'], data['end_date']
+        if start < date.today():
+            raise serializers.ValidationError("start_date cannot be in the past")
+        if end < start:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        if end - start > timedelta(days=self.MAX_WINDOW_DAYS):
+            raise serializers.ValidationError(f"Date window cannot exceed {self.MAX_WINDOW_DAYS} days")
+        return data
 
 # -------------------------
 # APPOINTMENT SERIALIZER
 # -------------------------
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     doctor_name = serializers.SerializerMethodField()
     doctor_username = serializers.CharField(source='doctor.profile.user.username', read_only=True)
     patient_name = serializers.SerializerMethodField()
@@ -195,9 +423,9 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'doctor', 'doctor_name', 'doctor_username', 'specialization',
             'date', 'formatted_date', 'slot', 'formatted_time', 'formatted_datetime',
             'status', 'prescription', 'prescription_file', 'has_prescription',
-            'created_at', 'can_cancel', 'can_update', 'visit_notes'
+            'created_at', 'updated_at', 'can_cancel', 'can_update', 'visit_notes'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
 
     def get_doctor_name(self, obj):
         return obj.doctor.profile.user.get_full_name() or obj.doctor.profile.user.username
@@ -205,47 +433,88 @@ class AppointmentSerializer(serializers.ModelSerializer):
     def get_patient_name(self, obj):
         return obj.patient.profile.user.get_full_name() or obj.patient.profile.user.username
 
+    # Fields computed from the appointment's visit notes
+    NOTE_FIELDS = {'prescription', 'prescription_file', 'has_prescription', 'visit_notes'}
+
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None):
+        """
+        Join and prefetch everything the serializer reads, so serializing a
+        list costs the same few queries however long it is
+
+        Args:
+            queryset: Appointment queryset
+            fields: Fields that will be output (None for all); joins and prefetches
+                only they need are left out
+        """
+        fields = set(AppointmentSerializer.Meta.fields if fields is None else fields)
+        related = []
+        if fields & {'doctor_name', 'doctor_username'}:
+            related.append('doctor__profile__user')
+        elif 'specialization' in fields:
+            related.append('doctor')
+        if fields & {'patient_name', 'patient_username'}:
+            related.append('patient__profile__user')
+        if related:
+            queryset = queryset.select_related(*related)
+        if fields & AppointmentSerializer.NOTE_FIELDS:
+            queryset = queryset.prefetch_related(
+                Prefetch('visitnote_set', queryset=VisitNote.objects.select_related(
+                    'doctor__profile__user', 'patient__profile__user'
+                ))
+            )
+        return queryset
+
+    def _notes(self, obj):
+        """
+        The appointment's visit notes, newest first, read once per object
+        (from the prefetched visitnote_set when the view used setup_eager_loading)
+        """
+        notes = getattr(obj, '_notes_newest_first', None)
+        if notes is None:
+            if 'visitnote_set' in getattr(obj, '_prefetched_objects_cache', {}):
+                notes = obj.visitnote_set.all()
+            else:
+                notes = obj.visitnote_set.select_related('doctor__profile__user', 'patient__profile__user')
+            notes = sorted(notes, key=lambda note: (note.visit_date, note.id), reverse=True)
+            obj._notes_newest_first = notes
+        return notes
+
+    def _latest_note(self, obj):
+        notes = self._notes(obj)
+        return notes[0] if notes else None
+
     def get_prescription(self, obj):
         """
         Return the prescription text from the related VisitNote or appointment field
         """
-        try:
-            # First, try to get from visit note
-            latest_note = obj.visitnote_set.order_by('-visit_date').first()
-            if latest_note and latest_note.notes:
-                return latest_note.notes
-            
-            # Fallback to appointment prescription field
-            return obj.prescription if obj.prescription else None
-        except Exception:
-            return obj.prescription if obj.prescription else None
+        latest_note = self._latest_note(obj)
+        if latest_note and latest_note.notes:
+            return latest_note.notes
+        
+        # Fallback to appointment prescription field
+        return obj.prescription if obj.prescription else None
 
     def get_prescription_file(self, obj):
         """
         Return the prescription file URL if available
         """
-        try:
-            latest_note = obj.visitnote_set.order_by('-visit_date').first()
-            if latest_note and latest_note.prescription:
-                request = self.context.get('request')
-                if request and hasattr(latest_note.prescription, 'url'):
-                    return request.build_absolute_uri(latest_note.prescription.url)
-                return latest_note.prescription.url if hasattr(latest_note.prescription, 'url') else str(latest_note.prescription)
-            return None
-        except Exception:
-            return None
+        latest_note = self._latest_note(obj)
+        if latest_note and latest_note.prescription:
+            request = self.context.get('request')
+            if request and hasattr(latest_note.prescription, 'url'):
+                return request.build_absolute_uri(latest_note.prescription.url)
+            return latest_note.prescription.url if hasattr(latest_note.prescription, 'url') else str(latest_note.prescription)
+        return None
 
     def get_has_prescription(self, obj):
         """
         Check if appointment has any prescription (text or file)
         """
-        try:
-            latest_note = obj.visitnote_set.order_by('-visit_date').first()
-            if latest_note and (latest_note.notes or latest_note.prescription):
-                return True
-            return bool(obj.prescription)
-        except Exception:
-            return bool(obj.prescription)
+        latest_note = self._latest_note(obj)
+        if latest_note and (latest_note.notes or latest_note.prescription):
+            return True
+        return bool(obj.prescription)
 
     def get_formatted_date(self, obj):
         if obj.date:
@@ -287,11 +556,7 @@ class AppointmentSerializer(serializers.ModelSerializer):
         """
         Get all visit notes for this appointment
         """
-        try:
-            notes = obj.visitnote_set.all().order_by('-visit_date')
-            return VisitNoteSerializer(notes, many=True, context=self.context).data
-        except Exception:
-            return []
+        return VisitNoteSerializer(self._notes(obj), many=True, context=self.context).data
 
     def validate(self, data):
         """
@@ -318,7 +583,7 @@ class AppointmentSerializer(serializers.ModelSerializer):
         if appointment_date and slot and doctor:
             try:
                 from .utils import validate_slot, is_slot_available
-                validate_slot(str(slot), appointment_date)
+                validate_slot(str(slot), appointment_date, doctor)
                 if not is_slot_available(doctor, appointment_date, str(slot)):
                     raise serializers.ValidationError("Selected time slot is not available")
             except Exception as e:
@@ -341,10 +606,10 @@ class VisitNoteSerializer(serializers.ModelSerializer):
         model = VisitNote
         fields = [
             'id', 'appointment', 'patient', 'patient_name', 
-            'doctor', 'doctor_name', 'visit_date', 'formatted_visit_date',
+            'doctor', 'doctor_name', 'visit_date', 'updated_at', 'formatted_visit_date',
             'notes', 'prescription', 'prescription_file_url', 'appointment_details'
         ]
-        read_only_fields = ['id', 'visit_date']
+        read_only_fields = ['id', 'visit_date', 'updated_at']
 
     def get_doctor_name(self, obj):
         return obj.doctor.profile.user.get_full_name() or obj.doctor.profile.user.username
@@ -379,7 +644,7 @@ class VisitNoteSerializer(serializers.ModelSerializer):
 # DOCUMENT SERIALIZER
 # -------------------------
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     patient_name = serializers.SerializerMethodField()
     patient_username = serializers.CharField(source='patient.profile.user.username', read_only=True)
     file_url = serializers.SerializerMethodField()
@@ -403,11 +668,11 @@ class DocumentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'patient', 'patient_name', 'patient_username', 
             'appointment', 'appointment_info', 'doctor_name',
-            'file', 'file_url', 'file_name', 'file_size', 'file_type',
+            'file', 'file_url', 'file_name', 'file_size', 'file_type', 'content_type', 'checksum',
             'doc_type', 'doc_type_display', 'description', 
-            'uploaded_at', 'formatted_upload_date', 'can_delete'
+            'uploaded_at', 'updated_at', 'formatted_upload_date', 'can_delete'
         ]
-        read_only_fields = ['id', 'uploaded_at']
+        read_only_fields = ['id', 'content_type', 'checksum', 'uploaded_at', 'updated_at']
 
     def get_patient_name(self, obj):
         return obj.patient.profile.user.get_full_name() or obj.patient.profile.user.username
@@ -426,7 +691,10 @@ class DocumentSerializer(serializers.ModelSerializer):
         return None
 
     def get_file_size(self, obj):
-        if obj.file:
+        if obj.file_size is not None:
+            return obj.file_size
+        # Not backfilled yet: reading the size stats the file, list views that don't show it can opt out
+        if obj.file and self.context.get('include_file_size', True):
             try:
                 return obj.file.size
             except (ValueError, OSError):
@@ -517,21 +785,24 @@ class DoctorStatsSerializer(serializers.ModelSerializer):
             'completed_appointments', 'total_patients'
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return annotate_doctor_stats(queryset)
+
     def get_name(self, obj):
         return obj.profile.user.get_full_name() or obj.profile.user.username
 
     def get_total_appointments(self, obj):
-        return obj.appointment_set.count()
+        return annotated(obj, 'total_appointments', obj.appointment_set.count)
 
     def get_today_appointments(self, obj):
-        from datetime import date
-        return obj.appointment_set.filter(date=date.today()).count()
+        return annotated(obj, 'today_appointments', obj.appointment_set.filter(date=date.today()).count)
 
     def get_completed_appointments(self, obj):
-        return obj.appointment_set.filter(status='completed').count()
+        return annotated(obj, 'completed_appointments', obj.appointment_set.filter(status='completed').count)
 
     def get_total_patients(self, obj):
-        return obj.appointment_set.values('patient').distinct().count()
+        return annotated(obj, 'total_patients', obj.appointment_set.values('patient').distinct().count)
 
 class PatientStatsSerializer(serializers.ModelSerializer):
     """Serializer for patient statistics"""
@@ -549,24 +820,36 @@ class PatientStatsSerializer(serializers.ModelSerializer):
             'completed_appointments', 'total_documents', 'last_appointment'
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return annotate_patient_stats(queryset, with_last_appointment=True)
+
     def get_name(self, obj):
         return obj.profile.user.get_full_name() or obj.profile.user.username
 
     def get_total_appointments(self, obj):
-        return obj.appointment_set.count()
+        return annotated(obj, 'total_appointments', obj.appointment_set.count)
 
     def get_upcoming_appointments(self, obj):
-        from datetime import date
-        return obj.appointment_set.filter(date__gte=date.today()).count()
+        return annotated(obj, 'upcoming_appointments', obj.appointment_set.filter(date__gte=date.today()).count)
 
     def get_completed_appointments(self, obj):
-        return obj.appointment_set.filter(status='completed').count()
+        return annotated(obj, 'completed_appointments', obj.appointment_set.filter(status='completed').count)
 
     def get_total_documents(self, obj):
-        return obj.document_set.count()
+        return annotated(obj, 'total_documents', obj.document_set.count)
 
     def get_last_appointment(self, obj):
-        from datetime import date
+        if hasattr(obj, 'last_appointment_date'):
+            if obj.last_appointment_date is None:
+                return None
+            full_name = f"{obj.last_appointment_doctor_first_name} {obj.last_appointment_doctor_last_name}".strip()
+            return {
+                'date': obj.last_appointment_date,
+                'doctor': full_name or obj.last_appointment_doctor_username,
+                'status': obj.last_appointment_status
+            }
+
         last_appt = obj.appointment_set.filter(date__lt=date.today()).order_by('-date', '-slot').first()
         if last_appt:
             return {
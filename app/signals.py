@@ -1,8 +1,21 @@
 # app/signals.py
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile, Doctor, Patient, Appointment, VisitNote
+from datetime import date
+from .models import (
+    Profile, Doctor, Patient, Appointment, VisitNote, Document, DoctorSchedule, DoctorDayAvailability, DoctorLeave,
+    Holiday, SlotHold
+)
+from .booking import fill_freed_slot
+from .changes import bump_user_versions, participant_user_ids, care_team_user_ids
+from .events import appointment_event_kind, record_appointment_events
+from .sync import record_deletion, care_team_joined, care_team_left
+from .utils import (
+    refresh_day_availability, refresh_availability_bulk, invalidate_schedule, invalidate_holidays, invalidate_day_slots,
+    as_date
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,6 +56,204 @@ def appointment_status_changed(sender, instance, created, **kwargs):
                 )
                 logger.info(f"Visit note created for completed appointment: {instance.id}")
 
+@receiver(post_init, sender=Appointment)
+def remember_appointment_day(sender, instance, **kwargs):
+    """
+    Remember which doctor/day/slot the appointment was loaded with, so a
+    reschedule can refresh the day it moved away from and a cancellation can
+    offer the slot to the waitlist. Reads __dict__ to avoid loading deferred fields.
+    """
+    instance._loaded_day = (instance.__dict__.get('doctor_id'), instance.__dict__.get('date'))
+    instance._loaded_slot = instance._loaded_day + (instance.__dict__.get('slot'), instance.__dict__.get('status'))
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=VisitNote)
+@receiver(post_delete, sender=VisitNote)
+def appointment_records_changed(sender, instance, **kwargs):
+    """
+    Appointments and visit notes show on both the patient's and the doctor's
+    dashboards; a rescheduled appointment also leaves the old doctor's.
+    Registered before the handlers below, which move _loaded_day forward.
+    """
+    doctor_ids = {instance.doctor_id}
+    if sender is Appointment:
+        doctor_ids.add(getattr(instance, '_loaded_day', (None, None))[0])
+    bump_user_versions(participant_user_ids([instance.patient_id], doctor_ids))
+
+@receiver(post_save, sender=Appointment)
+def sync_care_team(sender, instance, created, **kwargs):
+    """
+    A doctor's first appointment with a patient shares the patient's documents
+    with them; an appointment moved to another doctor leaves the old doctor's
+    /api/changes/ sync, with the documents if it was their last one.
+    Registered before the handlers that move _loaded_day forward.
+    """
+    old_doctor_id = getattr(instance, '_loaded_day', (None, None))[0]
+    if created or old_doctor_id != instance.doctor_id:
+        care_team_joined(instance.doctor_id, instance.patient_id)
+    if not created and old_doctor_id not in (None, instance.doctor_id):
+        record_deletion('appointments', instance.pk, doctor_id=old_doctor_id)
+        care_team_left(old_doctor_id, instance.patient_id)
+
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=VisitNote)
+@receiver(post_delete, sender=Document)
+def record_sync_deletion(sender, instance, **kwargs):
+    """
+    Tombstone deleted rows for the /api/changes/ sync of their doctor and patient
+    """
+    if sender is Document:
+        record_deletion('documents', instance.pk, patient_id=instance.patient_id)
+        return
+    kind = 'appointments' if sender is Appointment else 'visit_notes'
+    record_deletion(kind, instance.pk, patient_id=instance.patient_id, doctor_id=instance.doctor_id)
+    if sender is Appointment:
+        care_team_left(instance.doctor_id, instance.patient_id)
+
+@receiver(post_save, sender=Appointment)
+def publish_appointment_event(sender, instance, created, **kwargs):
+    """
+    Record booking, cancellation, completion and reschedule events for the
+    /api/events/ stream of the appointment's doctor and patient
+    """
+    kind = appointment_event_kind(instance, created, getattr(instance, '_loaded_slot', (None, None, None, None)))
+    if kind is not None:
+        record_appointment_events([instance], kind)
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def document_changed(sender, instance, **kwargs):
+    """
+    Documents are listed to the patient and to every doctor who treated them
+    """
+    bump_user_versions(participant_user_ids([instance.patient_id]) | care_team_user_ids(patient_id=instance.patient_id))
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    Names show on the dashboards of the other side of the user's appointments.
+    Logins only touch last_login, which no response shows.
+    """
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_user_versions({instance.pk} | care_team_user_ids(user_id=instance.pk))
+
+@receiver(post_save, sender=Doctor)
+def doctor_changed(sender, instance, **kwargs):
+    """
+    The specialization shows on the doctor's patients' dashboards
+    """
+    bump_user_versions(participant_user_ids(doctor_ids=[instance.pk]) | care_team_user_ids(doctor_id=instance.pk))
+
+@receiver(post_save, sender=Appointment)
+def refresh_availability_on_save(sender, instance, **kwargs):
+    """
+    Keep DoctorDayAvailability and the slot cache current on booking, cancellation
+    and reschedule
+    """
+    days = {(instance.doctor_id, instance.date)}
+    old_doctor_id, old_date = getattr(instance, '_loaded_day', (None, None))
+    if old_doctor_id is not None and old_date is not None:
+        days.add((old_doctor_id, old_date))
+
+    # A consistent order, so two reschedules between the same days can't lock each other's rows
+    for doctor_id, day in sorted((doctor_id, as_date(day)) for doctor_id, day in days):
+        refresh_day_availability(doctor_id, day)
+        invalidate_day_slots(doctor_id, day)
+
+    instance._loaded_day = (instance.doctor_id, instance.date)
+
+@receiver(post_delete, sender=Appointment)
+def refresh_availability_on_delete(sender, instance, **kwargs):
+    """
+    Free the slot in DoctorDayAvailability when an appointment is deleted
+    """
+    refresh_day_availability(instance.doctor_id, instance.date, create=False)
+    invalidate_day_slots(instance.doctor_id, instance.date)
+
+@receiver(post_save, sender=SlotHold)
+@receiver(post_delete, sender=SlotHold)
+def slot_hold_changed(sender, instance, **kwargs):
+    """
+    Held slots are hidden from other patients, so taking or releasing a hold
+    invalidates the cached slots of that day
+    """
+    invalidate_day_slots(instance.doctor_id, instance.date)
+
+def offer_freed_slot(doctor_id, check_date, slot):
+    """
+    Run the waitlist matcher for a freed slot once the freeing transaction commits
+    """
+    def match():
+        try:
+            entry = fill_freed_slot(doctor_id, check_date, slot)
+            if entry is not None:
+                logger.info(f"Freed slot {check_date} {slot} of doctor {doctor_id} {entry.status} to waitlist entry {entry.id}")
+        except Exception as e:
+            logger.error(f"Error matching waitlist for doctor {doctor_id} on {check_date} {slot}: {e}")
+    transaction.on_commit(match)
+
+@receiver(post_save, sender=Appointment)
+def match_waitlist_on_save(sender, instance, created, **kwargs):
+    """
+    Offer the slot to the waitlist when an appointment is cancelled or moved away
+    """
+    old_doctor_id, old_date, old_slot, old_status = getattr(instance, '_loaded_slot', (None, None, None, None))
+    instance._loaded_slot = (instance.doctor_id, instance.date, instance.slot, instance.status)
+    if created or old_slot is None or old_status == 'cancelled':
+        return
+
+    if instance.status == 'cancelled':
+        offer_freed_slot(old_doctor_id, old_date, old_slot)
+    elif (old_doctor_id, str(old_date), str(old_slot)[:5]) != (instance.doctor_id, str(instance.date), str(instance.slot)[:5]):
+        offer_freed_slot(old_doctor_id, old_date, old_slot)
+
+@receiver(post_delete, sender=Appointment)
+def match_waitlist_on_delete(sender, instance, **kwargs):
+    """
+    Offer the slot of a deleted active appointment to the waitlist
+    """
+    if instance.status != 'cancelled':
+        offer_freed_slot(instance.doctor_id, instance.date, instance.slot)
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def schedule_changed(sender, instance, **kwargs):
+    """
+    Recompile the doctor's slot templates and re-map their upcoming
+    materialized availability onto the new hours
+    """
+    invalidate_schedule(instance.doctor_id)
+    upcoming = DoctorDayAvailability.objects.filter(
+        doctor_id=instance.doctor_id, date__gte=date.today()
+    ).values_list('doctor_id', 'date')
+    refresh_availability_bulk(upcoming)
+
+@receiver(post_save, sender=DoctorLeave)
+@receiver(post_delete, sender=DoctorLeave)
+def leave_changed(sender, instance, **kwargs):
+    """
+    Reload the doctor's leave ranges and zero (or restore) the materialized
+    availability of the upcoming days they cover
+    """
+    invalidate_schedule(instance.doctor_id)
+    upcoming = DoctorDayAvailability.objects.filter(
+        doctor_id=instance.doctor_id, date__gte=date.today()
+    ).values_list('doctor_id', 'date')
+    refresh_availability_bulk(upcoming)
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def holiday_changed(sender, instance, **kwargs):
+    """
+    Reload the holiday index and re-map every doctor's upcoming materialized
+    availability (an edit may have moved the holiday off other days)
+    """
+    invalidate_holidays()
+    upcoming = DoctorDayAvailability.objects.filter(date__gte=date.today()).values_list('doctor_id', 'date')
+    refresh_availability_bulk(upcoming)
+
 @receiver(post_delete, sender=Appointment)
 def cleanup_orphaned_visit_notes(sender, instance, **kwargs):
     """
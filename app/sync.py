@@ -0,0 +1,169 @@
+# app/sync.py
+import base64
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Appointment, DeletedRecord, Document, VisitNote
+
+# Rows returned per kind and request; a full page sets has_more and the cursor resumes inside it
+CHANGES_PAGE_SIZE = 200
+
+# Rows are stamped when saved but only become visible when their transaction
+# commits, so the cursor handed out trails the clock by this much: a write
+# still open during one sync is picked up by the next instead of skipped.
+CHANGES_SETTLE_SECONDS = 5
+
+def encode_since(position: tuple) -> str:
+    """
+    Opaque /api/changes/ cursor for a sync position
+
+    Args:
+        position: (moment, {kind: last id sent at that moment}) as returned by collect_changes()
+    """
+    moment, after_ids = position
+    raw = moment.isoformat() + ''.join(f"|{name}={row_id}" for name, row_id in after_ids.items() if row_id)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_since(cursor: str) -> tuple:
+    """
+    Turn a /api/changes/ cursor back into (aware datetime, {kind: last id sent})
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    moment, *ties = raw.split('|')
+    moment = datetime.fromisoformat(moment)
+    after_ids = {}
+    for tie in ties:
+        name, _, row_id = tie.partition('=')
+        after_ids[name] = int(row_id)
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment), after_ids
+
+def change_querysets(doctor=None, patient=None) -> Dict[str, object]:
+    """
+    The appointments, visit notes and documents a doctor or patient can see, and
+    the tombstones of those deleted
+
+    Args:
+        doctor: Doctor whose rows to sync (documents of the patients they treated)
+        patient: Patient whose rows to sync
+
+    Returns:
+        Dict[str, QuerySet]: Keyed by the names used in the /api/changes/ response
+    """
+    if doctor is not None:
+        patient_ids = Appointment.objects.filter(doctor=doctor).values('patient_id')
+        appointments = Appointment.objects.filter(doctor=doctor)
+        notes = VisitNote.objects.filter(doctor=doctor)
+        documents = Document.objects.filter(patient_id__in=patient_ids)
+        deleted = DeletedRecord.objects.filter(
+            Q(doctor_id=doctor.pk) | Q(kind='documents', doctor_id__isnull=True, patient_id__in=patient_ids)
+        )
+    else:
+        appointments = Appointment.objects.filter(patient=patient)
+        notes = VisitNote.objects.filter(patient=patient)
+        documents = Document.objects.filter(patient=patient)
+        deleted = DeletedRecord.objects.filter(patient_id=patient.pk)
+
+    return {
+        'appointments': appointments.select_related('doctor__profile__user', 'patient__profile__user'),
+        'visit_notes': notes.select_related('doctor__profile__user', 'patient__profile__user', 'appointment'),
+        'documents': documents.select_related('patient__profile__user', 'appointment__doctor__profile__user'),
+        # Paged like the other kinds, on the deletion time
+        'deleted': deleted.annotate(updated_at=F('deleted_at')),
+    }
+
+def collect_changes(querysets: Dict[str, object], since: Optional[tuple] = None,
+                    page_size: int = CHANGES_PAGE_SIZE) -> tuple:
+    """
+    Rows changed after a sync position, oldest change first
+
+    Each kind is read through its (owner, updated_at) index as a keyset on
+    (updated_at, id), like app/pagination.py, so a page that ends inside a run
+    of rows sharing one updated_at resumes after its last id instead of
+    starting the run over. Rows stamped exactly at the cursor moment whose kind
+    has no id there are sent again, so clients should upsert by id.
+
+    Args:
+        querysets: Result of change_querysets()
+        since: (moment, {kind: last id sent at moment}) from decode_since(); None
+            starts from the beginning of history
+        page_size: Rows per kind
+
+    Returns:
+        tuple: (dict of row lists keyed like querysets, next position, has_more)
+    """
+    next_since = timezone.now() - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    since_moment, since_ids = since if since is not None else (None, {})
+    rows, last_rows = {}, {}
+
+    for name, queryset in querysets.items():
+        if since_moment is not None:
+            queryset = queryset.filter(updated_at__gte=since_moment)
+            if since_ids.get(name):
+                queryset = queryset.filter(Q(updated_at__gt=since_moment) | Q(id__gt=since_ids[name]))
+        page = list(queryset.order_by('updated_at', 'id')[:page_size + 1])
+        if len(page) > page_size:
+            # Resume after the last row returned; everything after it comes next time
+            page = page[:page_size]
+            last_rows[name] = page[-1]
+            next_since = min(next_since, page[-1].updated_at)
+        rows[name] = page
+
+    if since_moment is not None and next_since <= since_moment:
+        next_since, after_ids = since_moment, dict(since_ids)
+    else:
+        after_ids = {}
+    # Kinds whose full page stops at the new moment continue after their last id
+    for name, last in last_rows.items():
+        if last.updated_at == next_since:
+            after_ids[name] = last.id
+    return rows, (next_since, after_ids), bool(last_rows)
+
+# -------------------------
+# DELETIONS AND CARE TEAMS
+# -------------------------
+
+def record_deletion(kind: str, object_id: int, patient_id=None, doctor_id=None) -> None:
+    """
+    Leave a tombstone so the next sync of a doctor and/or patient removes a row
+
+    Args:
+        kind: Name of the row's list in the /api/changes/ response
+        object_id: Id of the row
+        patient_id: Patient who no longer sees it
+        doctor_id: Doctor who no longer sees it
+    """
+    DeletedRecord.objects.create(kind=kind, object_id=object_id, patient_id=patient_id, doctor_id=doctor_id)
+
+def care_team_joined(doctor_id, patient_id) -> None:
+    """
+    Send a patient's documents to a doctor who just got their first appointment with them
+
+    The documents are older than the doctor's cursor, so they are re-stamped
+    to come up in the next sync (their other readers just upsert them again).
+    """
+    if doctor_id is None or patient_id is None:
+        return
+    if Appointment.objects.filter(doctor_id=doctor_id, patient_id=patient_id).count() == 1:
+        Document.objects.filter(patient_id=patient_id).update(updated_at=timezone.now())
+
+def care_team_left(doctor_id, patient_id) -> None:
+    """
+    Remove a patient's documents from the sync of a doctor who no longer has any appointment with them
+    """
+    if doctor_id is None or patient_id is None:
+        return
+    if Appointment.objects.filter(doctor_id=doctor_id, patient_id=patient_id).exists():
+        return
+    DeletedRecord.objects.bulk_create([
+        DeletedRecord(kind='documents', object_id=document_id, doctor_id=doctor_id)
+        for document_id in Document.objects.filter(patient_id=patient_id).values_list('id', flat=True)
+    ])
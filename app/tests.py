@@ -1,3 +1,1358 @@
-from django.test import TestCase
+import hashlib
+import json
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .booking import SlotConflict, book_appointment, hold_slot, import_appointments, sweep_expired_holds
+from .models import (
+    Appointment, AppointmentEvent, Doctor, DoctorDayAvailability, DoctorLeave, DoctorSchedule, Document, Holiday,
+    Patient, SlotHold, StreamTicket, VisitNote, WaitlistEntry
+)
+from .renderers import FastJSONRenderer, StreamingJSONRenderer
+from .rows import appointment_rows, appointment_values, document_rows, visit_note_rows
+from .serializers import AppointmentSerializer, DocumentSerializer, PatientStatsSerializer, VisitNoteSerializer
+from .sync import change_querysets, collect_changes, decode_since, encode_since
+from .utils import (
+    SLOT_CACHE_ALIAS, SlotError, _schedule_cache, doctors_with_free_slots, find_first_available, generate_daily_slots,
+    get_available_slots, get_cached_available_slots, invalidate_holidays, refresh_day_availability, slot_cache_stats
+)
+
+
+def read_json(response):
+    """Parsed body of a regular or streamed response (a stream is drained once)"""
+    if not response.streaming:
+        return response.json()
+    if not hasattr(response, 'streamed_body'):
+        response.streamed_body = b''.join(response.streaming_content)
+    return json.loads(response.streamed_body)
+
+
+def next_working_day(after=None):
+    """First Monday-Friday date after `after` (default today)"""
+    day = (after or date.today()) + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+class SlotTestCase(TestCase):
+    """
+    Base for availability tests: one doctor and patient, and no compiled
+    schedules, holidays or cached slots left over from another test.
+    """
+
+    def setUp(self):
+        _schedule_cache.clear()
+        invalidate_holidays()
+        caches[SLOT_CACHE_ALIAS].clear()
+        self.doctor = self.create_doctor('slot_doctor')
+        self.patient, self.patient_user = self.create_patient('slot_patient')
+        self.day = next_working_day()
+
+    def create_doctor(self, username, specialization='General'):
+        user = User.objects.create_user(username=username, password='slot-pass-123')
+        user.profile.role = 'doctor'
+        user.profile.save()
+        return Doctor.objects.create(profile=user.profile, specialization=specialization)
+
+    def create_patient(self, username):
+        user = User.objects.create_user(username=username, password='slot-pass-123')
+        user.profile.role = 'patient'
+        user.profile.save()
+        return Patient.objects.create(profile=user.profile), user
+
+    def book(self, slot, day=None, patient=None, status='booked'):
+        return Appointment.objects.create(doctor=self.doctor, patient=patient or self.patient,
+                                          date=day or self.day, slot=slot, status=status)
+
+
+def legacy_available_slots(doctor, check_date):
+    """Free slots as the list-based engine computed them before the bitmask rewrite"""
+    if check_date.weekday() >= 5:
+        return []
+    slots, current = [], datetime.combine(check_date, time(9, 0))
+    while current < datetime.combine(check_date, time(18, 0)):
+        if not time(13, 0) <= current.time() < time(14, 0):
+            slots.append(current.strftime("%H:%M"))
+        current += timedelta(minutes=30)
+    booked = [slot.strftime("%H:%M") for slot in Appointment.objects.filter(
+        doctor=doctor, date=check_date).exclude(status='cancelled').values_list('slot', flat=True)]
+    available = [slot for slot in slots if slot not in booked]
+    if check_date == date.today():
+        available = [slot for slot in available if datetime.strptime(slot, "%H:%M").time() > timezone.now().time()]
+    return available
+
+
+class SlotEngineTests(SlotTestCase):
+    """The bitmask engine offers exactly the slots the list-based one did."""
+
+    def test_matches_legacy_engine(self):
+        self.book(time(9, 0))
+        self.book(time(12, 30))
+        self.book(time(17, 30))
+        self.book(time(10, 0), status='cancelled')
+        self.book(time(9, 30), day=self.day + timedelta(days=1), status='completed')
+
+        for offset in range(8):
+            check_date = date.today() + timedelta(days=offset)
+            with self.subTest(date=check_date):
+                self.assertEqual(get_available_slots(self.doctor, check_date),
+                                 legacy_available_slots(self.doctor, check_date))
+
+    def test_slots_endpoint(self):
+        self.book(time(11, 0))
+        client = APIClient()
+        client.force_authenticate(self.patient_user)
+        response = client.get('/api/slots/', {'doctor_id': self.doctor.id, 'date': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), legacy_available_slots(self.doctor, self.day))
+        self.assertNotIn('11:00', response.json())
+
+
+class AvailabilityGridTests(SlotTestCase):
+    """/api/slots/grid/ agrees with the per-day slot lists."""
+
+    def test_grid_matches_slot_lists(self):
+        other = self.create_doctor('grid_doctor')
+        self.book(time(9, 0))
+        Appointment.objects.create(doctor=other, patient=self.patient, date=self.day, slot=time(15, 0))
+        client = APIClient()
+        client.force_authenticate(self.patient_user)
+
+        response = client.get('/api/slots/grid/', {
+            'doctor_ids': f'{self.doctor.id},{other.id}', 'start': self.day.isoformat(), 'days': 7,
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        for row in data['doctors']:
+            for offset, cells in enumerate(row['availability']):
+                free = get_available_slots(row['id'], self.day + timedelta(days=offset))
+                self.assertEqual([slot for slot, cell in zip(data['slots'], cells) if cell == '1'], free)
+
+    def test_unavailable_doctors_are_left_out(self):
+        other = self.create_doctor('grid_away', specialization='General')
+        other.available = False
+        other.save()
+        client = APIClient()
+        client.force_authenticate(self.patient_user)
+
+        response = client.get('/api/slots/grid/', {'specialization': 'General', 'start': self.day.isoformat()})
+        self.assertEqual([row['id'] for row in response.json()['doctors']], [self.doctor.id])
+
+
+class NextAvailableSlotTests(SlotTestCase):
+    """/api/slots/next/ skips full days and picks the earliest doctor."""
+
+    def test_skips_fully_booked_day(self):
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=self.day, slot=slot)
+            for slot in get_available_slots(self.doctor, self.day)
+        ])
+        client = APIClient()
+        client.force_authenticate(self.patient_user)
+
+        response = client.get('/api/slots/next/', {'doctor_id': self.doctor.id, 'start': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['date'], next_working_day(self.day).isoformat())
+        self.assertEqual(response.json()['slot'], '09:00')
+
+    def test_earliest_doctor_of_specialization(self):
+        other = self.create_doctor('next_doctor', specialization='Cardiology')
+        self.doctor.specialization = 'Cardiology'
+        self.doctor.save()
+        self.book(time(9, 0))
+        client = APIClient()
+        client.force_authenticate(self.patient_user)
+
+        response = client.get('/api/slots/next/', {'specialization': 'Cardiology', 'start': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['doctor_id'], response.json()['slot']), (other.id, '09:00'))
+
+
+class DayAvailabilityTests(SlotTestCase):
+    """DoctorDayAvailability follows bookings, cancellations, reschedules and deletes."""
+
+    def availability(self, day=None):
+        row = DoctorDayAvailability.objects.get(doctor=self.doctor, date=day or self.day)
+        return row.free_count, get_available_slots(self.doctor, day or self.day)
+
+    def test_kept_current_by_signals(self):
+        appointment = self.book(time(9, 0))
+        free_count, free = self.availability()
+        self.assertEqual(free_count, 15)
+        self.assertEqual(len(free), 15)
+        self.assertNotIn('09:00', free)
+
+        appointment.slot = time(10, 0)
+        appointment.save()
+        self.assertEqual(self.availability()[1][:2], ['09:00', '09:30'])
+
+        later = next_working_day(self.day)
+        appointment.date = later
+        appointment.save()
+        self.assertEqual(self.availability()[0], 16)
+        self.assertEqual(self.availability(later)[0], 15)
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertEqual(self.availability(later)[0], 16)
+
+        booked = self.book(time(9, 0), day=later)
+        booked.delete()
+        self.assertEqual(self.availability(later)[0], 16)
+
+    def test_full_days_drop_out_of_search(self):
+        Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=self.day, slot=slot)
+            for slot in get_available_slots(self.doctor, self.day)
+        ])
+        self.assertIn(self.doctor, doctors_with_free_slots(self.day))
+        refresh_day_availability(self.doctor.id, self.day)
+        self.assertEqual(self.availability(), (0, []))
+        self.assertNotIn(self.doctor, doctors_with_free_slots(self.day))
+
+    def test_missing_row_reads_appointments(self):
+        self.book(time(9, 0))
+        DoctorDayAvailability.objects.all().delete()
+        self.assertNotIn('09:00', get_available_slots(self.doctor, self.day))
+        self.assertNotIn('09:00', get_cached_available_slots(self.doctor, self.day))
+
+    def test_migration_backfills_booked_days(self):
+        self.book(time(9, 0))
+        self.book(time(9, 30), day=self.day - timedelta(days=7))
+        DoctorDayAvailability.objects.all().delete()
+        migration = import_module('app.migrations.0005_doctordayavailability')
+        migration.backfill_day_availability(django_apps, None)
+        self.assertEqual(list(DoctorDayAvailability.objects.values_list('date', 'free_count')), [(self.day, 15)])
+
+
+class BookingTests(SlotTestCase):
+    """Booking is one INSERT: a taken slot is a 409, optionally retried on the nearest free slots."""
+
+    def setUp(self):
+        super().setUp()
+        self.other_patient, other_user = self.create_patient('booking_rival')
+        self.client = APIClient()
+        self.client.force_authenticate(other_user)
+
+    def post(self, slot, **extra):
+        return self.client.post('/api/appointments/', {
+            'doctor_id': self.doctor.id, 'date': self.day.isoformat(), 'slot': slot, **extra
+        }, format='json')
+
+    def test_taken_slot_is_a_conflict(self):
+        self.book(time(10, 0))
+        response = self.post('10:00')
+        self.assertEqual(response.status_code, 409)
+        self.assertNotIn('10:00', response.json()['available_slots'])
+        self.assertEqual(Appointment.objects.filter(date=self.day, slot=time(10, 0)).count(), 1)
+
+    def test_alternate_slot_is_booked_on_conflict(self):
+        self.book(time(10, 0))
+        response = self.post('10:00', allow_alternate=True)
+        self.assertEqual(response.status_code, 201)
+        # 09:30 and 10:30 are equally close; the later one wins
+        appointment = Appointment.objects.get(pk=response.json()['appointment']['id'])
+        self.assertEqual((appointment.patient, appointment.slot), (self.other_patient, time(10, 30)))
+
+    def test_lost_race_is_retried(self):
+        # The free slots were read before a concurrent booking took the nearest one
+        self.book(time(10, 0))
+        with mock.patch('app.booking.nearest_free_slots', return_value=['10:30', '09:30', '11:00']):
+            self.book(time(10, 30))
+            appointment = book_appointment(self.other_patient, self.doctor, self.day, '10:00', allow_alternate=True)
+        self.assertEqual(str(appointment.slot), '09:30')
+
+    def test_conflict_when_every_attempt_is_taken(self):
+        for slot in (time(10, 0), time(9, 30), time(10, 30)):
+            self.book(slot)
+        with mock.patch('app.booking.nearest_free_slots', return_value=['09:30', '10:30']):
+            with self.assertRaises(SlotConflict):
+                book_appointment(self.other_patient, self.doctor, self.day, '10:00', allow_alternate=True)
+
+
+class ActiveSlotConstraintTests(SlotTestCase):
+    """Only active appointments hold a slot in the partial unique constraint."""
+
+    def test_cancelled_slot_can_be_rebooked(self):
+        first = self.book(time(9, 0))
+        first.status = 'cancelled'
+        first.save()
+        rival, _ = self.create_patient('constraint_rival')
+
+        rebooked = book_appointment(rival, self.doctor, self.day, '09:00')
+        self.assertEqual(rebooked.patient, rival)
+
+        # And cancelled again, with two cancelled rows for the slot
+        rebooked.status = 'cancelled'
+        rebooked.save()
+        self.assertEqual(book_appointment(self.patient, self.doctor, self.day, '09:00').status, 'booked')
+
+    def test_second_active_booking_is_rejected(self):
+        self.book(time(9, 0))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(time(9, 0))
+        self.book(time(9, 0), status='cancelled')
+
+
+class SlotHoldTests(SlotTestCase):
+    """A hold hides its slot from other patients but not from the holder."""
+
+    def setUp(self):
+        super().setUp()
+        self.rival, rival_user = self.create_patient('hold_rival')
+        self.holder_client, self.rival_client = APIClient(), APIClient()
+        self.holder_client.force_authenticate(self.patient_user)
+        self.rival_client.force_authenticate(rival_user)
+        self.request = {'doctor_id': self.doctor.id, 'date': self.day.isoformat(), 'slot': '11:00'}
+
+    def slots(self, client):
+        return client.get('/api/slots/', {'doctor_id': self.doctor.id, 'date': self.day.isoformat()}).json()
+
+    def test_hold_hides_slot_from_others(self):
+        self.assertEqual(self.holder_client.post('/api/slots/hold/', self.request, format='json').status_code, 201)
+
+        self.assertIn('11:00', self.slots(self.holder_client))
+        self.assertNotIn('11:00', self.slots(self.rival_client))
+        self.assertEqual(self.rival_client.post('/api/slots/hold/', self.request, format='json').status_code, 409)
+        booking = self.rival_client.post('/api/appointments/', self.request, format='json')
+        self.assertEqual(booking.status_code, 409)
+        self.assertEqual(booking.json()['error'], "Slot is being held by another patient")
+
+        self.assertEqual(self.holder_client.post('/api/appointments/', self.request, format='json').status_code, 201)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_released_and_expired_holds_free_the_slot(self):
+        hold_slot(self.patient, self.doctor, self.day, '11:00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.holder_client.delete('/api/slots/hold/', self.request, format='json')
+        self.assertIn('11:00', self.slots(self.rival_client))
+
+        hold_slot(self.patient, self.doctor, self.day, '11:00', ttl_seconds=60)
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIn('11:00', get_available_slots(self.doctor, self.day, patient=self.rival))
+        self.assertEqual(sweep_expired_holds(), 1)
+
+
+class BulkImportTests(SlotTestCase):
+    """The bulk import reports every conflicting row and inserts the rest."""
+
+    def setUp(self):
+        super().setUp()
+        staff = User.objects.create_user(username='import_staff', password='import-pass-123', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(staff)
+        self.book(time(9, 0))
+
+    def row(self, slot, day=None, **extra):
+        return {'doctor_id': self.doctor.id, 'patient_id': self.patient.id,
+                'date': (day or self.day).isoformat(), 'slot': slot, **extra}
+
+    def test_conflicts_are_reported(self):
+        saturday = self.day + timedelta(days=5 - self.day.weekday())
+        rows = [
+            self.row('09:30'),
+            self.row('09:30'),                        # taken earlier in the same import
+            self.row('09:00'),                        # already booked
+            self.row('09:00', status='cancelled'),    # cancelled rows don't hold the slot
+            self.row('13:00'),                        # lunch break
+            self.row('10:00', day=saturday),
+            {**self.row('10:00'), 'doctor_id': 0},
+            self.row('25:00'),
+        ]
+        response = self.client.post('/api/appointments/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['created'], data['failed']), (2, 6))
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['created', 'error', 'error', 'created', 'error', 'error', 'error', 'error'])
+        self.assertEqual(data['results'][1]['error'], "Slot is already booked")
+        self.assertEqual(data['results'][2]['error'], "Slot is already booked")
+        self.assertEqual(DoctorDayAvailability.objects.get(doctor=self.doctor, date=self.day).free_count, 14)
+
+    def test_dry_run_and_csv_upload(self):
+        upload = SimpleUploadedFile('appointments.csv', (
+            "doctor_id,patient_id,date,slot\n"
+            f"{self.doctor.id},{self.patient.id},{self.day.isoformat()},10:00\n"
+            f"{self.doctor.id},{self.patient.id},{self.day.isoformat()},09:00\n"
+        ).encode(), content_type='text/csv')
+        response = self.client.post('/api/appointments/bulk/?dry_run=true', {'file': upload}, format='multipart')
+        self.assertEqual([r['status'] for r in response.json()['results']], ['valid', 'error'])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class DoctorScheduleTests(SlotTestCase):
+    """Weekly schedules replace the default hours and must fit the 63-bit free_mask."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.profile.user)
+
+    def put_week(self, start, end, slot_duration):
+        schedule = [{'weekday': weekday, 'start_time': start, 'end_time': end, 'slot_duration': slot_duration}
+                    for weekday in range(7)]
+        return self.client.put('/api/doctor/schedule/', {'schedule': schedule}, format='json')
+
+    def test_too_many_slots_are_rejected(self):
+        # 08:00-19:00 in 10-minute slots is 66 slots
+        response = self.put_week('08:00', '19:00', 10)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.doctor.schedules.exists())
+
+    def test_largest_day_can_be_booked(self):
+        # 08:00-18:30 in 10-minute slots is exactly 63 slots
+        self.assertEqual(self.put_week('08:00', '18:30', 10).status_code, 200)
+        tomorrow = date.today() + timedelta(days=1)
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=tomorrow, slot=time(18, 20))
+
+        availability = DoctorDayAvailability.objects.get(doctor=self.doctor, date=tomorrow)
+        self.assertEqual(availability.free_count, 62)
+        self.assertEqual(availability.free_mask, (1 << 62) - 1)
+
+    def test_schedule_changes_availability(self):
+        self.book(time(10, 0))
+        schedule = [{'weekday': self.day.weekday(), 'start_time': '10:00', 'end_time': '12:00',
+                     'break_start': '11:00', 'break_end': '11:20', 'slot_duration': 20}]
+        self.assertEqual(self.client.put('/api/doctor/schedule/', schedule, format='json').status_code, 200)
+
+        self.assertEqual(get_available_slots(self.doctor, self.day), ['10:20', '10:40', '11:20', '11:40'])
+        self.assertEqual(DoctorDayAvailability.objects.get(doctor=self.doctor, date=self.day).free_count, 4)
+        self.assertEqual(get_available_slots(self.doctor, next_working_day(self.day)), [])
+        with self.assertRaises(SlotError):
+            book_appointment(self.patient, self.doctor, self.day, '10:30')
+
+        # An empty schedule restores the default week
+        self.assertEqual(self.client.put('/api/doctor/schedule/', [], format='json').status_code, 200)
+        self.assertEqual(len(get_available_slots(self.doctor, self.day)), 15)
+
+
+class CalendarTests(SlotTestCase):
+    """Doctor leave and hospital holidays close days for booking and search."""
+
+    def free_count(self, day):
+        return DoctorDayAvailability.objects.get(doctor=self.doctor, date=day).free_count
+
+    def test_leave_closes_the_doctor(self):
+        appointment = self.book(time(9, 0))
+        client = APIClient()
+        client.force_authenticate(self.doctor.profile.user)
+        response = client.post('/api/doctor/leave/', {
+            'start_date': self.day.isoformat(), 'end_date': self.day.isoformat(), 'reason': "Conference"
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['affected_appointments'], [appointment.id])
+
+        self.assertEqual(get_available_slots(self.doctor, self.day), [])
+        self.assertEqual(self.free_count(self.day), 0)
+        with self.assertRaisesMessage(SlotError, "Doctor is on leave"):
+            book_appointment(self.patient, self.doctor, self.day, '10:00')
+        found = find_first_available([self.doctor.id], self.day)
+        self.assertEqual(found['date'], next_working_day(self.day).isoformat())
+
+        self.assertEqual(client.delete(f"/api/doctor/leave/{response.json()['id']}/").status_code, 204)
+        self.assertEqual(self.free_count(self.day), 15)
+
+    def test_holiday_closes_every_doctor(self):
+        other = self.create_doctor('holiday_doctor')
+        self.book(time(9, 0))
+        holiday = Holiday.objects.create(name="Founders' Day", start_date=self.day, end_date=self.day)
+
+        for doctor in (self.doctor, other):
+            self.assertEqual(get_available_slots(doctor, self.day), [])
+        self.assertEqual(self.free_count(self.day), 0)
+        self.assertNotIn(other, doctors_with_free_slots(self.day))
+        self.assertEqual(find_first_available([self.doctor.id, other.id], self.day)['date'],
+                         next_working_day(self.day).isoformat())
+        client = APIClient()
+        client.force_authenticate(self.patient_user)
+        self.assertEqual([h['name'] for h in client.get('/api/holidays/').json()], ["Founders' Day"])
+
+        holiday.delete()
+        self.assertEqual(len(get_available_slots(other, self.day)), 16)
+        self.assertEqual(self.free_count(self.day), 15)
+
+
+class WaitlistTests(SlotTestCase):
+    """A cancelled slot goes to the first waiter: booked outright, or held as an offer."""
+
+    def setUp(self):
+        super().setUp()
+        self.appointment = self.book(time(11, 0))
+        self.client = APIClient()
+
+    def join(self, patient_user, **fields):
+        self.client.force_authenticate(patient_user)
+        response = self.client.post('/api/waitlist/', {
+            'start_date': self.day.isoformat(), 'end_date': self.day.isoformat(), **fields
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return WaitlistEntry.objects.get(pk=response.json()['id'])
+
+    def cancel(self):
+        self.client.force_authenticate(self.patient_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/appointment/{self.appointment.id}/cancel/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_cancelled_slot_is_auto_booked(self):
+        first, first_user = self.create_patient('waiter_one')
+        second, second_user = self.create_patient('waiter_two')
+        entry = self.join(first_user, doctor_id=self.doctor.id)
+        self.join(second_user, specialization='general')
+
+        self.cancel()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'assigned')
+        self.assertEqual((entry.appointment.patient, str(entry.appointment.slot)), (first, '11:00:00'))
+        self.assertEqual(WaitlistEntry.objects.filter(status='waiting').count(), 1)
+        self.assertNotIn('11:00', get_available_slots(self.doctor, self.day))
+
+    def test_declined_offer_passes_to_next_waiter(self):
+        first, first_user = self.create_patient('waiter_one')
+        second, second_user = self.create_patient('waiter_two')
+        offer = self.join(first_user, doctor_id=self.doctor.id, auto_book=False)
+        after = self.join(second_user, doctor_id=self.doctor.id)
+
+        self.cancel()
+        offer.refresh_from_db()
+        self.assertEqual((offer.status, str(offer.offered_slot)), ('offered', '11:00:00'))
+        self.assertIn('11:00', get_available_slots(self.doctor, self.day, patient=first))
+        self.assertNotIn('11:00', get_available_slots(self.doctor, self.day, patient=second))
+
+        self.client.force_authenticate(first_user)
+        self.assertEqual(self.client.delete(f'/api/waitlist/{offer.id}/').status_code, 204)
+        after.refresh_from_db()
+        self.assertEqual((after.status, after.appointment.patient), ('assigned', second))
+
+
+class HeatmapTests(SlotTestCase):
+    """The vectorized heatmap counts the same open slots as get_available_slots."""
+
+    def test_matches_slot_lists(self):
+        cardiology = self.create_doctor('heatmap_cardiologist', specialization='Cardiology')
+        evening = self.create_doctor('heatmap_evening')
+        DoctorSchedule.objects.create(doctor=evening, weekday=self.day.weekday(), start_time=time(15, 0),
+                                      end_time=time(20, 0), slot_duration=20)
+        DoctorLeave.objects.create(doctor=cardiology, start_date=self.day + timedelta(days=1),
+                                   end_date=self.day + timedelta(days=2))
+        self.book(time(9, 0))
+        self.book(time(14, 30))
+        Appointment.objects.create(doctor=evening, patient=self.patient, date=self.day, slot=time(15, 20))
+        Appointment.objects.create(doctor=cardiology, patient=self.patient, date=self.day, slot=time(10, 0))
+
+        staff = User.objects.create_user(username='heatmap_staff', password='heatmap-pass-123', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        response = client.get('/api/slots/heatmap/', {'start': self.day.isoformat(), 'days': 7})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        groups = {'Cardiology': [cardiology], 'General': [self.doctor, evening]}
+        self.assertEqual([g['specialization'] for g in data['specializations']], sorted(groups))
+        for group in data['specializations']:
+            doctors = groups[group['specialization']]
+            free = [[get_available_slots(doctor, date.fromisoformat(day)) for doctor in doctors]
+                    for day in data['days']]
+            with self.subTest(specialization=group['specialization']):
+                self.assertEqual(group['open'], [sum(map(len, lists)) for lists in free])
+                self.assertEqual(group['capacity'], [
+                    sum(len(generate_daily_slots(date.fromisoformat(day), doctor)) for doctor in doctors)
+                    for day in data['days']
+                ])
+                self.assertEqual(group['open_by_slot'], [
+                    sum(label in slots for lists in free for slots in lists) for label in data['slots']
+                ])
+
+
+class SlotCacheTests(SlotTestCase):
+    """Cached slot lists are dropped once a booking, cancellation or hold commits."""
+
+    def cached(self):
+        return get_cached_available_slots(self.doctor, self.day)
+
+    def test_booking_and_cancellation_invalidate(self):
+        hits = slot_cache_stats['hits']
+        self.assertIn('10:00', self.cached())
+        with self.assertNumQueries(0):
+            self.assertIn('10:00', self.cached())
+        self.assertEqual(slot_cache_stats['hits'], hits + 1)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            appointment = self.book(time(10, 0))
+        # Until the booking commits, readers keep the cached list
+        self.assertIn('10:00', self.cached())
+        for callback in callbacks:
+            callback()
+        self.assertNotIn('10:00', self.cached())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'cancelled'
+            appointment.save()
+        self.assertIn('10:00', self.cached())
+        self.assertEqual(self.cached(), get_available_slots(self.doctor, self.day))
+
+    def test_hold_invalidates(self):
+        rival, _ = self.create_patient('cache_rival')
+        self.assertIn('10:00', get_cached_available_slots(self.doctor, self.day, patient=rival))
+        with self.captureOnCommitCallbacks(execute=True):
+            hold_slot(self.patient, self.doctor, self.day, '10:00')
+        self.assertNotIn('10:00', get_cached_available_slots(self.doctor, self.day, patient=rival))
+        self.assertIn('10:00', get_cached_available_slots(self.doctor, self.day, patient=self.patient))
+
+    def test_rebuild_invalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(time(10, 0))
+        self.assertNotIn('10:00', self.cached())
+        # A write that skips signals leaves the table and the cache behind
+        Appointment.objects.filter(doctor=self.doctor).update(status='cancelled')
+        self.assertNotIn('10:00', self.cached())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_availability', stdout=StringIO())
+        self.assertIn('10:00', self.cached())
+
+
+class DoctorDashboardQueryTests(TestCase):
+    """The doctor dashboard must not issue queries per appointment."""
+
+    # Profile lookup, Doctor lookup and the single appointments query
+    DASHBOARD_QUERIES = 3
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='dash_doctor', password='dash-pass-123')
+        doctor_user.profile.role = 'doctor'
+        doctor_user.profile.save()
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='General')
+
+        patient_user = User.objects.create_user(
+            username='dash_patient', password='dash-pass-123', first_name='Pat', last_name='Smith'
+        )
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+
+        self.doctor_user_id = doctor_user.pk
+        self.client = APIClient()
+        self.days_used = 0
+
+    def add_history(self, visits):
+        """Create completed past visits with one visit note each."""
+        first = date.today() - timedelta(days=self.days_used + visits)
+        self.days_used += visits
+        appointments = Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=first + timedelta(days=i),
+                        slot=time(9, 0), status='completed')
+            for i in range(visits)
+        ])
+        VisitNote.objects.bulk_create([
+            VisitNote(appointment=appt, patient=self.patient, doctor=self.doctor, notes=f"Rx {appt.pk}")
+            for appt in appointments
+        ])
+        return appointments
+
+    def login(self):
+        # A fresh user instance per request, as token auth would load, so the profile isn't cached
+        self.client.force_authenticate(User.objects.get(pk=self.doctor_user_id))
+
+    def dashboard_queries(self):
+        self.login()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/doctor/dashboard/')
+            data = read_json(response)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), data
+
+    def test_query_count_is_independent_of_history(self):
+        self.add_history(3)
+        small, _ = self.dashboard_queries()
+
+        self.add_history(300)
+        self.login()
+        with self.assertNumQueries(self.DASHBOARD_QUERIES):
+            response = self.client.get('/api/doctor/dashboard/')
+            past = read_json(response)['past']
+
+        self.assertEqual(small, self.DASHBOARD_QUERIES)
+        # Only the default 90-day window is returned, newest first
+        self.assertEqual(len(past), 90)
+        self.assertEqual(past[0]['date'], (date.today() - timedelta(days=1)).isoformat())
+
+    def test_past_next_continues_before_the_window(self):
+        self.add_history(120)
+        _, data = self.dashboard_queries()
+
+        self.login()
+        older = self.client.get(data['past_next'] + '&page_size=100').json()
+        self.assertEqual(len(older['results']), 30)
+        self.assertEqual(older['results'][0]['date'], (date.today() - timedelta(days=91)).isoformat())
+        self.assertIsNone(older['next'])
+
+    def test_rows_carry_patient_name_and_latest_note(self):
+        with_notes, without_note = self.add_history(2)
+        VisitNote.objects.create(appointment=with_notes, patient=self.patient, doctor=self.doctor, notes="Follow-up Rx")
+        VisitNote.objects.filter(appointment=without_note).delete()
+        Appointment.objects.filter(pk=without_note.pk).update(prescription="Legacy Rx")
+
+        _, data = self.dashboard_queries()
+        rows = {row['id']: row for row in data['past']}
+
+        self.assertEqual(rows[with_notes.pk]['prescription'], "Follow-up Rx")
+        self.assertEqual(rows[without_note.pk]['prescription'], "Legacy Rx")
+        self.assertEqual(rows[with_notes.pk]['patient_name'], "Pat Smith")
+        self.assertEqual(rows[with_notes.pk]['time'], "09:00")
+
+
+class AppointmentKeysetPaginationTests(TestCase):
+    """/api/appointments/ pages by (date, slot, id) with constant cost per page."""
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='page_doctor', password='page-pass-123')
+        doctor_user.profile.role = 'doctor'
+        doctor_user.profile.save()
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='General')
+
+        patient_user = User.objects.create_user(username='page_patient', password='page-pass-123')
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+        self.patient_user_id = patient_user.pk
+        self.client = APIClient()
+
+        # Two slots on each of 40 days, plus a cancelled row sharing a slot to exercise the id tie-break
+        first = date.today() - timedelta(days=40)
+        rows = [
+            Appointment(doctor=self.doctor, patient=self.patient, date=first + timedelta(days=i),
+                        slot=slot, status='completed')
+            for i in range(40) for slot in (time(9, 0), time(9, 30))
+        ]
+        rows.append(Appointment(doctor=self.doctor, patient=self.patient, date=first, slot=time(9, 0), status='cancelled'))
+        Appointment.objects.bulk_create(rows)
+
+    def fetch(self, url, params=None):
+        self.client.force_authenticate(User.objects.get(pk=self.patient_user_id))
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_cover_every_row_once_in_order(self):
+        seen = []
+        page = self.fetch('/api/appointments/', {'page_size': 7})
+        while True:
+            seen.extend(page['results'])
+            if not page['next']:
+                break
+            page = self.fetch(page['next'])
+
+        keys = [(row['date'], row['slot'], row['id']) for row in seen]
+        self.assertEqual(len(keys), 81)
+        self.assertEqual(len(set(keys)), 81)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_page_query_count_is_independent_of_page_size(self):
+        VisitNote.objects.bulk_create([
+            VisitNote(appointment=appt, patient=self.patient, doctor=self.doctor, notes=f"Rx {appt.pk}")
+            for appt in Appointment.objects.all()
+        ])
+        counts = []
+        for size in (5, 50):
+            self.client.force_authenticate(User.objects.get(pk=self.patient_user_id))
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get('/api/appointments/', {'page_size': size}).json()
+            counts.append(len(queries))
+            self.assertEqual(len(page['results']), size)
+
+        self.assertEqual(counts[0], counts[1])
+        newest = page['results'][0]
+        self.assertEqual(newest['prescription'], f"Rx {newest['id']}")
+        self.assertEqual(len(newest['visit_notes']), 1)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_authenticate(User.objects.get(pk=self.patient_user_id))
+        self.assertEqual(self.client.get('/api/appointments/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+class PatientDashboardQueryTests(TestCase):
+    """The patient dashboard reads appointments, notes and documents once each."""
+
+    # Profile, Patient, appointments, visit notes, documents, and older prescriptions (appointments and notes)
+    DASHBOARD_QUERIES = 7
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='pd_doctor', password='dash-pass-123', first_name='Ann')
+        doctor_user.profile.role = 'doctor'
+        doctor_user.profile.save()
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='General')
+
+        patient_user = User.objects.create_user(username='pd_patient', password='dash-pass-123')
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+        self.patient_user_id = patient_user.pk
+        self.client = APIClient()
+
+    def add_history(self, visits):
+        """Past visits, each with a visit note and an uploaded document."""
+        first = date.today() - timedelta(days=visits)
+        appointments = Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=first + timedelta(days=i),
+                        slot=time(10, 0), status='completed', prescription=f"Legacy {i}" if i % 2 else "")
+            for i in range(visits)
+        ])
+        VisitNote.objects.bulk_create([
+            VisitNote(appointment=appt, patient=self.patient, doctor=self.doctor, notes=f"Rx {appt.pk}")
+            for appt in appointments
+        ])
+        Document.objects.bulk_create([
+            Document(patient=self.patient, appointment=appt, file=f"documents/report_{appt.pk}.pdf", doc_type='lab')
+            for appt in appointments
+        ])
+
+    def test_query_count_is_bounded(self):
+        self.add_history(50)
+        self.client.force_authenticate(User.objects.get(pk=self.patient_user_id))
+
+        with self.assertNumQueries(self.DASHBOARD_QUERIES):
+            response = self.client.get('/api/patient/dashboard/')
+
+        data = response.json()
+        self.assertEqual(len(data['past']), 50)
+        self.assertEqual(len(data['documents']), 50)
+        # 50 visit notes plus the 25 appointments with a legacy prescription
+        self.assertEqual(len(data['prescriptions']), 75)
+        self.assertEqual(data['past'][0]['doctor_name'], 'Ann')
+        self.assertEqual(data['documents'][0]['doctor_name'], 'Ann')
+
+    def test_prescriptions_outlive_the_past_window(self):
+        old = Appointment.objects.create(doctor=self.doctor, patient=self.patient, slot=time(10, 0),
+                                         date=date.today() - timedelta(days=200), status='completed',
+                                         prescription="Old course")
+        VisitNote.objects.create(appointment=old, patient=self.patient, doctor=self.doctor, notes="Old note")
+        self.client.force_authenticate(User.objects.get(pk=self.patient_user_id))
+
+        data = self.client.get('/api/patient/dashboard/').json()
+        self.assertEqual(data['past'], [])
+        self.assertEqual(sorted(entry['content'] for entry in data['prescriptions']), ["Old course", "Old note"])
+
+
+class DoctorStatsQueryTests(TestCase):
+    """Doctor and patient statistics come from annotations, not a COUNT per row."""
+
+    def setUp(self):
+        patient_user = User.objects.create_user(username='stats_patient', password='stats-pass-123')
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+        other_user = User.objects.create_user(username='stats_other', password='stats-pass-123')
+        self.other_patient = Patient.objects.create(profile=other_user.profile)
+        self.client = APIClient()
+        self.client.force_authenticate(patient_user)
+        self.doctors = 0
+
+    def add_doctors(self, count):
+        today = date.today()
+        for _ in range(count):
+            user = User.objects.create_user(username=f'stats_doctor_{self.doctors}', password='stats-pass-123')
+            self.doctors += 1
+            doctor = Doctor.objects.create(profile=user.profile, specialization='Cardiology')
+            Appointment.objects.bulk_create([
+                Appointment(doctor=doctor, patient=self.patient, date=today, slot=time(9, 0)),
+                Appointment(doctor=doctor, patient=self.patient, date=today - timedelta(days=1),
+                            slot=time(9, 0), status='completed'),
+                Appointment(doctor=doctor, patient=self.other_patient, date=today + timedelta(days=1), slot=time(9, 0)),
+            ])
+
+    def test_query_count_is_independent_of_doctor_count(self):
+        counts = []
+        for extra in (2, 10):
+            self.add_doctors(extra)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/doctors/by-specialization/', {'specialization': 'cardio'})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        data = response.json()
+        self.assertEqual(len(data), 12)
+        self.assertEqual(
+            {(d['total_appointments'], d['today_appointments'], d['total_patients']) for d in data}, {(3, 1, 2)}
+        )
+
+    def test_patient_annotations_match_per_row_queries(self):
+        self.add_doctors(2)
+        Document.objects.create(patient=self.patient, file='documents/a.pdf', doc_type='lab')
+
+        plain = PatientStatsSerializer(Patient.objects.get(pk=self.patient.pk)).data
+        annotated = PatientStatsSerializer(
+            PatientStatsSerializer.setup_eager_loading(Patient.objects.filter(pk=self.patient.pk)), many=True
+        ).data[0]
+        self.assertEqual(plain, annotated)
+        self.assertEqual((annotated['total_appointments'], annotated['total_documents']), (4, 1))
+        self.assertEqual(annotated['last_appointment']['status'], 'completed')
+
+
+class DocumentMetadataTests(TestCase):
+    """Size, MIME type and checksum are stored at upload and backfilled for older files."""
+
+    PDF = b'%PDF-1.4\n' + b'0' * 5000
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        user = User.objects.create_user(username='meta_patient', password='meta-pass-123')
+        self.patient = Patient.objects.create(profile=user.profile)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_upload_records_metadata(self):
+        upload = SimpleUploadedFile('scan.bin', self.PDF, content_type='application/octet-stream')
+        response = self.client.post('/api/documents/upload/', {'document': upload, 'doc_type': 'lab'}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+        document = Document.objects.get()
+        self.assertEqual(document.file_size, len(self.PDF))
+        self.assertEqual(document.content_type, 'application/pdf')
+        self.assertEqual(document.checksum, hashlib.sha256(self.PDF).hexdigest())
+        self.assertEqual(response.json()['document']['file_size'], len(self.PDF))
+
+    def test_backfill_command(self):
+        document = Document(patient=self.patient, doc_type='lab')
+        document.file.save('old.pdf', ContentFile(self.PDF))
+        Document.objects.create(patient=self.patient, file='documents/gone.pdf', doc_type='lab')
+
+        call_command('backfill_document_metadata', stdout=StringIO(), stderr=StringIO())
+
+        document.refresh_from_db()
+        self.assertEqual((document.file_size, document.content_type), (len(self.PDF), 'application/pdf'))
+        self.assertEqual(Document.objects.filter(file_size__isnull=True).count(), 1)
+
+
+class FastRowsTests(TestCase):
+    """The values() read path renders the same JSON bytes as the serializers."""
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='rows_doctor', password='rows-pass-123',
+                                               first_name='Rhea', last_name='Ng')
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='Neurology')
+        self.patient_user = User.objects.create_user(username='rows_patient', password='rows-pass-123')
+        self.patient = Patient.objects.create(profile=self.patient_user.profile)
+
+        today = date.today()
+        past = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=today - timedelta(days=3),
+                                          slot=time(14, 30), status='completed', prescription="Legacy")
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=today, slot=time(9, 0))
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=today + timedelta(days=2),
+                                   slot=time(10, 0), status='cancelled')
+        VisitNote.objects.create(appointment=past, patient=self.patient, doctor=self.doctor, notes="Rest",
+                                 prescription='prescriptions/rx one.pdf')
+        VisitNote.objects.create(appointment=past, patient=self.patient, doctor=self.doctor, notes="")
+        VisitNote.objects.create(patient=self.patient, doctor=self.doctor, notes="Walk-in")
+        Document.objects.create(patient=self.patient, appointment=past, file='documents/lab.pdf', doc_type='lab',
+                                file_size=10, content_type='application/pdf', checksum='ab')
+        Document.objects.create(patient=self.patient, file='documents/scan', doc_type='scan', description="Knee")
+
+        self.request = APIRequestFactory().get('/api/appointments/')
+        self.request.user = self.patient_user
+
+    def assertSameJSON(self, fast, serializer):
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(serializer.data))
+
+    def test_appointments(self):
+        appointments = Appointment.objects.order_by('-date', '-slot', '-id')
+        for request in (self.request, None):
+            self.assertSameJSON(
+                appointment_rows(appointment_values(appointments), request),
+                AppointmentSerializer(appointments, many=True, context={'request': request}),
+            )
+
+    def test_visit_notes(self):
+        notes = VisitNote.objects.order_by('id')
+        self.assertSameJSON(visit_note_rows(notes, self.request),
+                            VisitNoteSerializer(notes, many=True, context={'request': self.request}))
+
+    def test_documents(self):
+        documents = Document.objects.order_by('id')
+        for request in (self.request, None):
+            self.assertSameJSON(
+                document_rows(documents, request, include_file_size=False),
+                DocumentSerializer(documents, many=True, context={'request': request, 'include_file_size': False}),
+            )
+
+    def test_sparse_fieldsets_match_serializers(self):
+        appointments = Appointment.objects.order_by('-date', '-slot', '-id')
+        fields = AppointmentSerializer.selected_fields(fields='id,doctor_name,prescription,can_cancel')
+        self.assertSameJSON(
+            appointment_rows(appointment_values(appointments, fields), self.request, fields),
+            AppointmentSerializer(appointments, many=True, fields=fields, context={'request': self.request}),
+        )
+
+        documents = Document.objects.order_by('id')
+        fields = DocumentSerializer.selected_fields(exclude=['appointment_info', 'file_size'])
+        self.assertSameJSON(
+            document_rows(documents, self.request, fields=fields),
+            DocumentSerializer(documents, many=True, fields=fields, context={'request': self.request}),
+        )
+
+
+class SparseFieldsetTests(TestCase):
+    """?fields= / ?exclude= trim the output and the queries behind it."""
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='sparse_doctor', password='sparse-pass-123')
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='Dermatology')
+        patient_user = User.objects.create_user(username='sparse_patient', password='sparse-pass-123')
+        patient_user.profile.role = 'patient'
+        patient_user.profile.save()
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+        appointments = Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=date.today() - timedelta(days=i),
+                        slot=time(9, 0), status='completed')
+            for i in range(1, 6)
+        ])
+        VisitNote.objects.bulk_create([
+            VisitNote(appointment=appt, patient=self.patient, doctor=self.doctor, notes="Rx") for appt in appointments
+        ])
+        self.patient_user_id = patient_user.pk
+        self.client = APIClient()
+
+    def get(self, url, params):
+        self.client.force_authenticate(User.objects.get(pk=self.patient_user_id))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            data = read_json(response)
+        self.assertEqual(response.status_code, 200)
+        return data, [query['sql'] for query in queries]
+
+    def test_appointment_fields_skip_notes_and_joins(self):
+        full, full_queries = self.get('/api/appointments/', {'page_size': 2})
+        sparse, sparse_queries = self.get('/api/appointments/', {'page_size': 2, 'fields': 'id,date,slot,status'})
+
+        self.assertEqual([list(row) for row in sparse['results']], [['id', 'date', 'slot', 'status']] * 2)
+        self.assertEqual([row['id'] for row in sparse['results']], [row['id'] for row in full['results']])
+        self.assertEqual(sparse['next_cursor'], full['next_cursor'])
+        self.assertEqual(len(sparse_queries), len(full_queries) - 1)
+        self.assertFalse(any('app_visitnote' in sql for sql in sparse_queries))
+
+        excluded, _ = self.get('/api/appointments/', {'exclude': 'visit_notes,prescription_file'})
+        self.assertNotIn('visit_notes', excluded['results'][0])
+        self.assertEqual(excluded['results'][0]['prescription'], "Rx")
+
+    def test_doctor_fields_skip_statistics(self):
+        data, queries = self.get('/api/doctors/by-specialization/', {'specialization': 'derm', 'fields': 'id,specialization'})
+        self.assertEqual(data, [{'id': self.doctor.id, 'specialization': 'Dermatology'}])
+        self.assertFalse(any('COUNT(' in sql for sql in queries))
+
+        data, _ = self.get('/api/doctors/by-specialization/', {'specialization': 'derm', 'fields': 'name,total_patients'})
+        self.assertEqual(data, [{'name': 'sparse_doctor', 'total_patients': 1}])
+
+
+class RendererTests(TestCase):
+    """The fast and streaming renderers produce the stock renderer's JSON."""
+
+    def test_fast_renderer_matches_stock_renderer(self):
+        data = {
+            'when': timezone.now(), 'day': date(2025, 1, 15), 'slot': time(14, 30),
+            'text': "caf\u00e9 \u2028", 'nested': [{'id': 1, 'ok': True, 'none': None}], 'ratio': 0.5,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_streamed_arrays_match_rendered_lists(self):
+        rows = [{'id': i, 'day': date(2025, 1, 1) + timedelta(days=i)} for i in range(1201)]
+        renderer = StreamingJSONRenderer()
+
+        chunks = list(renderer.stream(iter(rows)))
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(b''.join(chunks), JSONRenderer().render(rows))
+
+        body = {'name': 'x', 'rows': iter(rows), 'empty': iter(()), 'tail': 1}
+        expected = {'name': 'x', 'rows': rows, 'empty': [], 'tail': 1}
+        self.assertEqual(b''.join(renderer.stream(body)), JSONRenderer().render(expected))
+
+    def test_user_list_is_streamed(self):
+        user = User.objects.create_user(username='stream_user', password='stream-pass-123', first_name='Sam')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.get('/api/users/')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual([row['full_name'] for row in read_json(response)], ['Sam'])
+
+
+class ConditionalGetTests(TestCase):
+    """Dashboards and lists answer If-None-Match from the user's change version."""
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='etag_doctor', password='etag-pass-123')
+        doctor_user.profile.role = 'doctor'
+        doctor_user.profile.save()
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='General')
+
+        patient_user = User.objects.create_user(username='etag_patient', password='etag-pass-123')
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment = Appointment.objects.create(
+                doctor=self.doctor, patient=self.patient, date=date.today() - timedelta(days=1),
+                slot=time(9, 0), status='completed'
+            )
+        self.doctor_user_id = doctor_user.pk
+        self.patient_user_id = patient_user.pk
+        self.client = APIClient()
+
+    def get(self, user_id, url, etag=None):
+        self.client.force_authenticate(User.objects.get(pk=user_id))
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        response = self.client.get(url, **headers)
+        if response.status_code == 200:
+            read_json(response)
+        return response
+
+    def test_unchanged_dashboard_is_not_rebuilt(self):
+        first = self.get(self.patient_user_id, '/api/patient/dashboard/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('private', first['Cache-Control'])
+
+        self.client.force_authenticate(User.objects.get(pk=self.patient_user_id))
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/patient/dashboard/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+
+    def test_writes_change_both_sides_etags(self):
+        patient_etag = self.get(self.patient_user_id, '/api/my-prescriptions/')['ETag']
+        doctor_etag = self.get(self.doctor_user_id, '/api/doctor/dashboard/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            VisitNote.objects.create(appointment=self.appointment, patient=self.patient, doctor=self.doctor, notes="Rx")
+
+        patient_response = self.get(self.patient_user_id, '/api/my-prescriptions/', patient_etag)
+        doctor_response = self.get(self.doctor_user_id, '/api/doctor/dashboard/', doctor_etag)
+        self.assertEqual(patient_response.status_code, 200)
+        self.assertEqual(doctor_response.status_code, 200)
+        self.assertEqual(read_json(doctor_response)['past'][0]['prescription'], "Rx")
+
+    def test_document_upload_changes_treating_doctor_etag(self):
+        etag = self.get(self.doctor_user_id, '/api/documents/')['ETag']
+        self.assertEqual(self.get(self.doctor_user_id, '/api/documents/', etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.create(patient=self.patient, file="documents/scan.pdf", doc_type='scan')
+
+        self.assertEqual(self.get(self.doctor_user_id, '/api/documents/', etag).status_code, 200)
+
+    def test_errors_carry_no_validators(self):
+        forbidden = self.get(self.patient_user_id, '/api/doctor/dashboard/')
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertFalse(forbidden.has_header('ETag'))
+        self.assertFalse(forbidden.has_header('Last-Modified'))
+
+        etag = self.get(self.patient_user_id, '/api/patient/dashboard/')['ETag']
+        self.assertEqual(self.get(self.patient_user_id, '/api/patient/dashboard/', etag).status_code, 304)
+
+
+class ChangesFeedTests(TestCase):
+    """/api/changes/ returns only what changed since the cursor."""
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='sync_doctor', password='sync-pass-123')
+        doctor_user.profile.role = 'doctor'
+        doctor_user.profile.save()
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='General')
+
+        patient_user = User.objects.create_user(username='sync_patient', password='sync-pass-123')
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+        self.appointments = Appointment.objects.bulk_create([
+            Appointment(doctor=self.doctor, patient=self.patient, date=date.today() - timedelta(days=i),
+                        slot=time(9, 0), status='completed')
+            for i in range(1, 4)
+        ])
+        # Settled history: last touched an hour ago
+        hour_ago = timezone.now() - timedelta(hours=1)
+        for offset, appt in enumerate(self.appointments):
+            Appointment.objects.filter(pk=appt.pk).update(updated_at=hour_ago + timedelta(seconds=offset))
+        self.doctor_user_id = doctor_user.pk
+        self.client = APIClient()
+
+    def sync(self, since=None, user_id=None):
+        self.client.force_authenticate(User.objects.get(pk=user_id or self.doctor_user_id))
+        response = self.client.get('/api/changes/', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_second_sync_returns_only_changed_rows(self):
+        first = self.sync()
+        self.assertEqual(len(first['appointments']), 3)
+        self.assertFalse(first['has_more'])
+
+        changed = Appointment.objects.get(pk=self.appointments[0].pk)
+        changed.status = 'cancelled'
+        changed.save()
+        VisitNote.objects.create(appointment=changed, patient=self.patient, doctor=self.doctor, notes="Called off")
+
+        second = self.sync(first['cursor'])
+        self.assertEqual([row['id'] for row in second['appointments']], [changed.pk])
+        self.assertEqual(second['appointments'][0]['status'], 'cancelled')
+        self.assertEqual(len(second['visit_notes']), 1)
+
+    def test_full_page_resumes_after_its_last_row(self):
+        querysets = change_querysets(doctor=self.doctor)
+        rows, position, has_more = collect_changes(querysets, page_size=2)
+        self.assertTrue(has_more)
+        last = rows['appointments'][-1]
+        self.assertEqual(position, (last.updated_at, {'appointments': last.pk}))
+
+        rows, _, has_more = collect_changes(change_querysets(doctor=self.doctor), position, page_size=2)
+        self.assertFalse(has_more)
+        self.assertEqual([appt.pk for appt in rows['appointments']], [self.appointments[2].pk])
+
+    def test_rows_sharing_a_timestamp_are_paged_through(self):
+        # More rows with one updated_at than fit on a page, as a queryset.update() leaves them
+        Appointment.objects.filter(doctor=self.doctor).update(updated_at=timezone.now() - timedelta(hours=1))
+        seen, cursor = [], None
+        for _ in range(4):
+            since = decode_since(cursor) if cursor else None
+            rows, position, has_more = collect_changes(change_querysets(doctor=self.doctor), since, page_size=2)
+            seen += [appt.pk for appt in rows['appointments']]
+            cursor = encode_since(position)
+            if not has_more:
+                break
+        else:
+            self.fail("sync kept returning has_more")
+        self.assertEqual(seen, [appt.pk for appt in self.appointments])
+
+        # A later change is still picked up after the tie
+        Appointment.objects.filter(pk=self.appointments[0].pk).update(updated_at=timezone.now())
+        self.assertEqual([row['id'] for row in self.sync(cursor)['appointments']], [self.appointments[0].pk])
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(User.objects.get(pk=self.doctor_user_id))
+        self.assertEqual(self.client.get('/api/changes/', {'since': '%%%'}).status_code, 400)
+
+    def test_deletions_are_synced(self):
+        first = self.sync()
+        self.assertEqual(first['deleted'], {'appointments': [], 'visit_notes': [], 'documents': []})
+
+        deleted = self.appointments[0]
+        Appointment.objects.get(pk=deleted.pk).delete()
+        second = self.sync(first['cursor'])
+        self.assertEqual(second['deleted']['appointments'], [deleted.pk])
+        self.assertNotIn(deleted.pk, [row['id'] for row in second['appointments']])
+
+    def test_documents_follow_the_care_team(self):
+        document = Document.objects.create(patient=self.patient, file='documents/old_scan.pdf', doc_type='lab')
+        Document.objects.filter(pk=document.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        other_user = User.objects.create_user(username='sync_other', password='sync-pass-123')
+        other_user.profile.role = 'doctor'
+        other_user.profile.save()
+        other = Doctor.objects.create(profile=other_user.profile, specialization='General')
+        cursor = self.sync(user_id=other_user.pk)['cursor']
+
+        # A first appointment shares the patient's older documents with the new doctor
+        moved = Appointment.objects.create(doctor=other, patient=self.patient, date=date.today(), slot=time(11, 0))
+        joined = self.sync(cursor, user_id=other_user.pk)
+        self.assertEqual([row['id'] for row in joined['documents']], [document.pk])
+
+        # Moving their only appointment away removes it and the documents again
+        moved.doctor = self.doctor
+        moved.save()
+        left = self.sync(joined['cursor'], user_id=other_user.pk)
+        self.assertEqual(left['deleted']['appointments'], [moved.pk])
+        self.assertEqual(left['deleted']['documents'], [document.pk])
+
+
+class AppointmentEventTests(TestCase):
+    """Appointment changes are recorded for /api/events/ and replayed after Last-Event-ID."""
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(username='event_doctor', password='event-pass-123')
+        doctor_user.profile.role = 'doctor'
+        doctor_user.profile.save()
+        self.doctor = Doctor.objects.create(profile=doctor_user.profile, specialization='General')
+        patient_user = User.objects.create_user(username='event_patient', password='event-pass-123')
+        self.patient = Patient.objects.create(profile=patient_user.profile)
+        self.token = Token.objects.create(user=doctor_user).key
+
+    def test_lifecycle_is_recorded(self):
+        appointment = Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, date=date.today() + timedelta(days=1), slot=time(9, 0)
+        )
+        appointment.slot = time(9, 30)
+        appointment.save()
+        appointment.status = 'cancelled'
+        appointment.save()
+        appointment.prescription = "Nothing to push"
+        appointment.save()
+
+        kinds = list(AppointmentEvent.objects.values_list('kind', flat=True))
+        self.assertEqual(kinds, ['created', 'rescheduled', 'cancelled'])
+
+    def test_stream_replays_missed_events(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/events/').status_code, 401)
+
+        opening = client.get('/api/events/', HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assertEqual(opening['Content-Type'], 'text/event-stream')
+        self.assertIn('id: 0', opening.content.decode())
+
+        Appointment.objects.create(
+            doctor=self.doctor, patient=self.patient, date=date.today() + timedelta(days=1), slot=time(9, 0)
+        )
+        replay = client.get('/api/events/', HTTP_AUTHORIZATION=f'Token {self.token}', HTTP_LAST_EVENT_ID='0')
+        self.assertIn('event: appointment.created', replay.content.decode())
+
+        caught_up = AppointmentEvent.objects.latest('id').id
+        replay = client.get('/api/events/', HTTP_AUTHORIZATION=f'Token {self.token}', HTTP_LAST_EVENT_ID=str(caught_up))
+        self.assertNotIn('event: appointment.created', replay.content.decode())
+
+    def test_stream_url_takes_a_single_use_ticket(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/events/ticket/').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        ticket = client.post('/api/events/ticket/').json()['ticket']
+        client.credentials()
+
+        self.assertEqual(client.get('/api/events/', {'token': self.token}).status_code, 401)
+        self.assertEqual(client.get('/api/events/', {'ticket': ticket})['Content-Type'], 'text/event-stream')
+        self.assertEqual(client.get('/api/events/', {'ticket': ticket}).status_code, 401)
+
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        expired = client.post('/api/events/ticket/').json()['ticket']
+        client.credentials()
+        StreamTicket.objects.filter(key=expired).update(expires_at=timezone.now())
+        self.assertEqual(client.get('/api/events/', {'ticket': expired}).status_code, 401)
+
+    def test_import_records_events(self):
+        day = next_working_day()
+        rows = [{'doctor_id': self.doctor.id, 'patient_id': self.patient.id, 'date': str(day), 'slot': slot}
+                for slot in ('09:00', '09:30')]
+        report = import_appointments(rows)
+
+        created = {entry['id'] for entry in report if entry['status'] == 'created'}
+        self.assertEqual(len(created), 2)
+        events = AppointmentEvent.objects.filter(kind='created')
+        self.assertEqual(set(events.values_list('appointment_id', flat=True)), created)
+
+    def test_import_fallback_records_events(self):
+        day = next_working_day()
+        taken = Appointment.objects.create(doctor=self.doctor, patient=self.patient, date=day, slot=time(10, 0))
+        rows = [{'doctor_id': self.doctor.id, 'patient_id': self.patient.id, 'date': str(day), 'slot': slot}
+                for slot in ('10:00', '10:30')]
+        # Miss the existing booking while validating, as if it was made concurrently
+        with mock.patch('app.booking.get_booked_masks', return_value={}):
+            report = import_appointments(rows)
+
+        self.assertEqual([entry['status'] for entry in report], ['error', 'created'])
+        events = AppointmentEvent.objects.exclude(appointment_id=taken.id)
+        self.assertEqual(list(events.values_list('appointment_id', 'kind')), [(report[1]['id'], 'created')])
@@ -14,6 +14,9 @@ urlpatterns = [
     # =======================
     path("doctor/dashboard/", views.DoctorDashboardView.as_view(), name="doctor-dashboard"),
     path("patient/dashboard/", views.PatientDashboardView.as_view(), name="patient-dashboard"),
+    path("changes/", views.ChangesView.as_view(), name="changes"),
+    path("events/", views.appointment_event_stream, name="appointment-events"),
+    path("events/ticket/", views.EventStreamTicketView.as_view(), name="appointment-events-ticket"),
 
     # =======================
     # Appointment Management
@@ -32,6 +35,9 @@ urlpatterns = [
     # =======================
     # Doctor Patient Management
     # =======================
+    path('doctor/schedule/', views.DoctorScheduleView.as_view(), name='doctor-schedule'),
+    path('doctor/leave/', views.DoctorLeaveView.as_view(), name='doctor-leave'),
+    path('doctor/leave/<int:pk>/', views.DoctorLeaveView.as_view(), name='doctor-leave-detail'),
     path('doctor/patient/<str:username>/', views.DoctorPatientDetailView.as_view(), name='doctor-patient-detail'),
     path('save-prescription/', views.SavePrescriptionView.as_view(), name='save-prescription'),
     path('patient-history-summary/', views.PatientHistorySummaryView.as_view(), name='patient-history-summary'),
@@ -54,8 +60,17 @@ urlpatterns = [
     # =======================
     # Slots & Appointments API
     # =======================
+    path("holidays/", views.HolidayListView.as_view(), name="holiday-list"),
     path("slots/", views.AvailableSlotsView.as_view(), name="available-slots"),
+    path("slots/cache-stats/", views.SlotCacheStatsView.as_view(), name="slot-cache-stats"),
+    path("slots/grid/", views.AvailabilityGridView.as_view(), name="availability-grid"),
+    path("slots/heatmap/", views.AvailabilityHeatmapView.as_view(), name="availability-heatmap"),
+    path("slots/next/", views.NextAvailableSlotView.as_view(), name="next-available-slot"),
+    path("slots/hold/", views.SlotHoldView.as_view(), name="slot-hold"),
+    path("waitlist/", views.WaitlistView.as_view(), name="waitlist"),
+    path("waitlist/<int:pk>/", views.WaitlistView.as_view(), name="waitlist-detail"),
     path("appointments/", views.AppointmentListCreateView.as_view(), name="appointment-list-create"),
+    path("appointments/bulk/", views.BulkAppointmentImportView.as_view(), name="appointment-bulk-import"),
     path("appointments/<int:pk>/", views.AppointmentDetailView.as_view(), name="appointment-detail"),
 
     # =======================
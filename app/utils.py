@@ -1,8 +1,17 @@
 # app/utils.py
+from bisect import bisect_right
 from datetime import datetime, time, timedelta, date
-from .models import Appointment
+from functools import lru_cache
+from time import monotonic, time as epoch_seconds, time_ns
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .models import (
+    Appointment, Doctor, DoctorDayAvailability, DoctorLeave, DoctorSchedule, Holiday, SlotHold
+)
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
-from typing import List, Optional
+from typing import Dict, List, Optional
 import pytz
 
 # Working hours configuration
@@ -12,17 +21,100 @@ LUNCH_START = time(hour=13, minute=0)  # 1:00 PM
 LUNCH_END = time(hour=14, minute=0)    # 2:00 PM
 SLOT_DURATION_MINUTES = 30
 
-# Holiday dates (can be configured)
+# Fixed holiday dates on top of the Holiday table (can be configured)
 HOLIDAYS = [
     # Add holiday dates here as date objects
     # date(2025, 1, 1),  # New Year
     # date(2025, 12, 25), # Christmas
 ]
 
+# Holiday and leave ranges are cached in-process like compiled schedules:
+# signals invalidate on change, the TTL bounds staleness in other processes.
+CALENDAR_CACHE_SECONDS = 300
+
 class SlotError(Exception):
     """Custom exception for invalid slot operations."""
     pass
 
+# -------------------------
+# HOLIDAYS & LEAVE
+# -------------------------
+
+class DateRanges:
+    """
+    Inclusive date ranges merged into sorted, non-overlapping runs so point and
+    range lookups are a binary search instead of a scan.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, ranges=()):
+        starts, ends = [], []
+        for start, end in sorted(ranges):
+            if ends and start <= ends[-1] + timedelta(days=1):
+                # Overlapping or adjacent: extend the previous run
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self.starts = starts
+        self.ends = ends
+
+    def __bool__(self) -> bool:
+        return bool(self.starts)
+
+    def _run_at(self, check_date: date) -> int:
+        """Index of the run covering the date, or -1."""
+        i = bisect_right(self.starts, check_date) - 1
+        return i if i >= 0 and check_date <= self.ends[i] else -1
+
+    def covers(self, check_date: date) -> bool:
+        """True if the date falls inside one of the ranges."""
+        return self._run_at(check_date) >= 0
+
+    def next_clear(self, check_date: date) -> date:
+        """First date on or after check_date that is outside every range."""
+        i = self._run_at(check_date)
+        return check_date if i < 0 else self.ends[i] + timedelta(days=1)
+
+    def overlapping(self, start_date: date, end_date: date) -> list:
+        """Runs intersecting [start_date, end_date], clipped to it."""
+        i = max(bisect_right(self.starts, start_date) - 1, 0)
+        runs = []
+        while i < len(self.starts) and self.starts[i] <= end_date:
+            if self.ends[i] >= start_date:
+                runs.append((max(self.starts[i], start_date), min(self.ends[i], end_date)))
+            i += 1
+        return runs
+
+_holiday_index = None  # (loaded_at, DateRanges)
+
+def get_holiday_index() -> DateRanges:
+    """Hospital holidays (HOLIDAYS plus the Holiday table), loaded with one query and cached."""
+    global _holiday_index
+    now = monotonic()
+    if _holiday_index is None or now - _holiday_index[0] > CALENDAR_CACHE_SECONDS:
+        ranges = [(day, day) for day in HOLIDAYS]
+        ranges.extend(Holiday.objects.values_list('start_date', 'end_date'))
+        _holiday_index = (now, DateRanges(ranges))
+    return _holiday_index[1]
+
+def invalidate_holidays() -> None:
+    """Forget the cached holiday index so the next lookup reloads it."""
+    global _holiday_index
+    _holiday_index = None
+
+def is_holiday(check_date: date) -> bool:
+    """
+    Check if the given date is a hospital holiday
+    
+    Args:
+        check_date: Date to check
+        
+    Returns:
+        bool: True if holiday, False otherwise
+    """
+    return get_holiday_index().covers(check_date)
+
 def is_working_day(check_date: date) -> bool:
     """
     Check if the given date is a working day (not weekend or holiday)
@@ -38,17 +130,274 @@ def is_working_day(check_date: date) -> bool:
         return False
     
     # Check if holiday
-    if check_date in HOLIDAYS:
+    if is_holiday(check_date):
         return False
     
     return True
 
-def generate_daily_slots(check_date: Optional[date] = None) -> List[str]:
+# Most slots one day can have: a day's free slots are stored as a bitmask in
+# DoctorDayAvailability.free_mask, a signed 64-bit integer
+MAX_DAY_SLOTS = 63
+
+class SlotTemplate:
+    """
+    Precomputed slot layout for one working-day configuration.
+
+    Slots are stored as integer minute offsets from midnight and addressed
+    by bit position, so availability for a doctor/day is a single int mask:
+    bit ``i`` set means ``minutes[i]`` is free.
+    """
+
+    __slots__ = ('minutes', 'labels', 'bit_of', 'full_mask')
+
+    def __init__(self, minutes):
+        self.minutes = tuple(minutes)
+        self.labels = tuple(f"{m // 60:02d}:{m % 60:02d}" for m in self.minutes)
+        self.bit_of = {m: i for i, m in enumerate(self.minutes)}
+        self.full_mask = (1 << len(self.minutes)) - 1
+
+    def mask_for(self, slot_values) -> int:
+        """
+        Build a mask from slot values (time objects or "HH:MM" strings).
+        Values that are not part of the template are ignored.
+        """
+        mask = 0
+        bit_of = self.bit_of
+        for value in slot_values:
+            bit = bit_of.get(slot_to_minutes(value))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def mask_after(self, minute: int) -> int:
+        """Mask of slots that start strictly after the given minute offset."""
+        first = bisect_right(self.minutes, minute)
+        return self.full_mask & ~((1 << first) - 1)
+
+    def labels_for(self, mask: int) -> List[str]:
+        """Convert a mask back to "HH:MM" labels in chronological order."""
+        labels = self.labels
+        return [labels[i] for i in range(len(labels)) if mask >> i & 1]
+
+def slot_to_minutes(value) -> Optional[int]:
+    """
+    Convert a slot value to its minute offset from midnight
+    
+    Args:
+        value: time object or "HH:MM" / "HH:MM:SS" string
+        
+    Returns:
+        int: Minutes since midnight, or None if the value can't be parsed
+    """
+    if hasattr(value, 'hour'):
+        return value.hour * 60 + value.minute
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except (ValueError, AttributeError):
+        return None
+
+@lru_cache(maxsize=None)
+def get_slot_template(start: time = WORK_START, end: time = WORK_END,
+                      lunch_start: time = LUNCH_START, lunch_end: time = LUNCH_END,
+                      duration: int = SLOT_DURATION_MINUTES) -> SlotTemplate:
+    """
+    Get the (cached) slot template for a working-hours configuration
+    
+    Args:
+        start, end: Working hours
+        lunch_start, lunch_end: Break excluded from the day
+        duration: Slot length in minutes
+        
+    Returns:
+        SlotTemplate: Template shared by every caller with the same configuration
+    """
+    start_min, end_min = slot_to_minutes(start), slot_to_minutes(end)
+    lunch_start_min, lunch_end_min = slot_to_minutes(lunch_start), slot_to_minutes(lunch_end)
+    minutes = [
+        m for m in range(start_min, end_min, duration)
+        if not (lunch_start_min <= m < lunch_end_min)
+    ]
+    return SlotTemplate(minutes)
+
+def current_minute() -> int:
+    """Minute offset of the current time, used to drop past slots for today."""
+    return slot_to_minutes(timezone.now().time())
+
+# -------------------------
+# PER-DOCTOR SCHEDULES
+# -------------------------
+
+# Compiled weekly schedules: doctor_id -> (loaded_at, seven templates Mon..Sun with None = day off,
+# DateRanges of the doctor's leave).
+# Signals drop a doctor's entry as soon as their schedule changes in this process;
+# the TTL bounds how long other worker processes can serve the old one.
+SCHEDULE_CACHE_SECONDS = 300
+NO_BREAK = time(0, 0)
+_schedule_cache = {}
+
+def default_week() -> tuple:
+    """The hospital-wide week used for doctors without a DoctorSchedule."""
+    template = get_slot_template()
+    return tuple(template if weekday < 5 else None for weekday in range(7))
+
+def compile_schedule(entries) -> tuple:
+    """
+    Compile DoctorSchedule rows into one slot template per weekday
+    
+    Args:
+        entries: DoctorSchedule instances of one doctor
+        
+    Returns:
+        tuple: Seven SlotTemplates (Monday first); None for days off
+    """
+    week = [None] * 7
+    for entry in entries:
+        week[entry.weekday] = get_slot_template(
+            entry.start_time, entry.end_time,
+            entry.break_start or NO_BREAK, entry.break_end or NO_BREAK,
+            entry.slot_duration
+        )
+    return tuple(week)
+
+def load_schedules(doctor_ids) -> None:
     """
-    Generate working slots for a given date, excluding lunch break
+    Make sure compiled schedules and leave for these doctors are cached
+    (two queries for all misses)
+    
+    Args:
+        doctor_ids: Iterable of doctor ids
+    """
+    now = monotonic()
+    stale = [
+        doctor_id for doctor_id in set(doctor_ids)
+        if doctor_id not in _schedule_cache or now - _schedule_cache[doctor_id][0] > SCHEDULE_CACHE_SECONDS
+    ]
+    if not stale:
+        return
+    
+    entries, leave = {}, {}
+    for entry in DoctorSchedule.objects.filter(doctor_id__in=stale):
+        entries.setdefault(entry.doctor_id, []).append(entry)
+    for doctor_id, start, end in DoctorLeave.objects.filter(doctor_id__in=stale).values_list(
+        'doctor_id', 'start_date', 'end_date'
+    ):
+        leave.setdefault(doctor_id, []).append((start, end))
+    for doctor_id in stale:
+        week = compile_schedule(entries[doctor_id]) if doctor_id in entries else default_week()
+        _schedule_cache[doctor_id] = (now, week, DateRanges(leave.get(doctor_id, ())))
+
+def invalidate_schedule(doctor_id: int) -> None:
+    """Forget a doctor's compiled schedule and leave so the next lookup reloads them."""
+    _schedule_cache.pop(doctor_id, None)
+
+def _cached_schedule(doctor_id: int) -> tuple:
+    """The (loaded_at, week, leave) cache entry for a doctor, loading it if missing or expired."""
+    cached = _schedule_cache.get(doctor_id)
+    if cached is None or monotonic() - cached[0] > SCHEDULE_CACHE_SECONDS:
+        load_schedules([doctor_id])
+        cached = _schedule_cache[doctor_id]
+    return cached
+
+def is_on_leave(doctor, check_date: date) -> bool:
+    """
+    Check if a doctor is on leave on a date
+    
+    Args:
+        doctor: Doctor instance or id
+        check_date: Date to check
+        
+    Returns:
+        bool: True if a DoctorLeave range covers the date
+    """
+    return _cached_schedule(getattr(doctor, 'pk', doctor))[2].covers(check_date)
+
+def get_doctor_week(doctor) -> tuple:
+    """
+    Get a doctor's compiled week and leave, for callers that lay out many days at once
+    
+    Args:
+        doctor: Doctor instance or id
+        
+    Returns:
+        tuple: (seven SlotTemplates Monday first with None for days off, DateRanges of leave)
+    """
+    _, week, leave = _cached_schedule(getattr(doctor, 'pk', doctor))
+    return week, leave
+
+def next_day_in(doctor, check_date: date) -> date:
+    """
+    First date on or after check_date that is neither a hospital holiday nor
+    inside the doctor's leave, skipping whole ranges at a time
+    
+    Args:
+        doctor: Doctor instance or id; None checks hospital holidays only
+        check_date: Date to start from
+        
+    Returns:
+        date: The first such date
+    """
+    holidays = get_holiday_index()
+    leave = _cached_schedule(getattr(doctor, 'pk', doctor))[2] if doctor is not None else DateRanges()
+    while True:
+        clear = leave.next_clear(holidays.next_clear(check_date))
+        if clear == check_date:
+            return clear
+        check_date = clear
+
+def get_doctor_template(doctor, check_date: date) -> Optional[SlotTemplate]:
+    """
+    Get the slot template a doctor works on a date
+    
+    Args:
+        doctor: Doctor instance or id; None gives the hospital-wide default day
+        check_date: Date to check
+        
+    Returns:
+        SlotTemplate: The day's template, or None if the doctor doesn't work that day
+            (weekly day off, hospital holiday or leave)
+    """
+    if is_holiday(check_date):
+        return None
+    doctor_id = getattr(doctor, 'pk', doctor)
+    if doctor_id is None:
+        return get_slot_template() if check_date.weekday() < 5 else None
+    
+    _, week, leave = _cached_schedule(doctor_id)
+    if leave and leave.covers(check_date):
+        return None
+    return week[check_date.weekday()]
+
+def fold_slot_masks(rows) -> Dict[tuple, int]:
+    """
+    Fold (doctor_id, date, slot) rows into masks of each doctor's template for that day
+    
+    Args:
+        rows: Iterable of (doctor_id, date, slot) tuples
+        
+    Returns:
+        Dict[tuple, int]: Mask keyed by (doctor_id, date); slots outside the template are ignored
+    """
+    masks = {}
+    for doctor_id, day, slot in rows:
+        template = get_doctor_template(doctor_id, day)
+        bit = template.bit_of.get(slot_to_minutes(slot)) if template else None
+        if bit is not None:
+            key = (doctor_id, day)
+            masks[key] = masks.get(key, 0) | (1 << bit)
+    return masks
+
+# -------------------------
+# AVAILABILITY ENGINE
+# -------------------------
+
+def generate_daily_slots(check_date: Optional[date] = None, doctor=None) -> List[str]:
+    """
+    Generate working slots for a given date, excluding breaks
     
     Args:
         check_date: Date to generate slots for (defaults to today)
+        doctor: Doctor instance or id whose schedule applies (defaults to hospital hours)
         
     Returns:
         List[str]: List of time slots in "HH:MM" format
@@ -56,24 +405,29 @@ def generate_daily_slots(check_date: Optional[date] = None) -> List[str]:
     if check_date is None:
         check_date = date.today()
     
-    # Check if it's a working day
-    if not is_working_day(check_date):
-        return []
-    
-    slots = []
-    current = datetime.combine(check_date, WORK_START)
-    end = datetime.combine(check_date, WORK_END)
+    template = get_doctor_template(doctor, check_date)
+    return list(template.labels) if template else []
+
+def get_booked_mask(doctor, check_date: date) -> int:
+    """
+    Get the booked slots for a doctor on a date as a template mask
     
-    while current < end:
-        slot_time = current.time()
-        
-        # Skip lunch break
-        if not (LUNCH_START <= slot_time < LUNCH_END):
-            slots.append(slot_time.strftime("%H:%M"))
+    Args:
+        doctor: Doctor instance or id
+        check_date: Date to check
         
-        current += timedelta(minutes=SLOT_DURATION_MINUTES)
-    
-    return slots
+    Returns:
+        int: Mask with a bit set for every booked slot
+    """
+    template = get_doctor_template(doctor, check_date)
+    if template is None:
+        return 0
+    # Only consider appointments that are NOT cancelled
+    slots = Appointment.objects.filter(
+        doctor=doctor,
+        date=check_date
+    ).exclude(status='cancelled').values_list('slot', flat=True)
+    return template.mask_for(slots)
 
 def get_booked_slots(doctor, check_date: date) -> List[str]:
     """
@@ -87,54 +441,393 @@ def get_booked_slots(doctor, check_date: date) -> List[str]:
         List[str]: List of booked time slots in "HH:MM" format
     """
     # Only consider appointments that are NOT cancelled
-    appointments = Appointment.objects.filter(
+    slots = Appointment.objects.filter(
         doctor=doctor,
         date=check_date
-    ).exclude(status='cancelled')
+    ).exclude(status='cancelled').values_list('slot', flat=True)
+    
+    return [slot.strftime("%H:%M") if hasattr(slot, 'strftime') else str(slot) for slot in slots]
+
+def get_held_masks(doctor_ids, start_date: date, end_date: date, patient=None) -> Dict[tuple, int]:
+    """
+    Get unexpired slot holds for many doctors over a date range in one query
+    
+    Args:
+        doctor_ids: Iterable of doctor ids
+        start_date: First date (inclusive)
+        end_date: Last date (inclusive)
+        patient: Patient whose own holds should not count as taken
+        
+    Returns:
+        Dict[tuple, int]: Held mask keyed by (doctor_id, date); days without holds are absent
+    """
+    doctor_ids = list(doctor_ids)
+    load_schedules(doctor_ids)
+    holds = SlotHold.objects.filter(
+        doctor_id__in=doctor_ids,
+        date__range=(start_date, end_date),
+        expires_at__gt=timezone.now()
+    )
+    if patient is not None:
+        holds = holds.exclude(patient=patient)
+    return fold_slot_masks(holds.values_list('doctor_id', 'date', 'slot'))
+
+def get_available_mask(doctor, check_date: date, booked_mask: Optional[int] = None,
+                       held_mask: Optional[int] = None, patient=None) -> int:
+    """
+    Get available slots for a doctor on a date as a mask of their template for that day
+    
+    Args:
+        doctor: Doctor instance or id
+        check_date: Date to check
+        booked_mask: Already-known booked mask; when omitted the materialized
+            DoctorDayAvailability row is read instead of the appointments
+        held_mask: Already-known mask of slots held by other patients
+        patient: Patient asking; their own holds stay available to them
+        
+    Returns:
+        int: Mask with a bit set for every free slot
+    """
+    template = get_doctor_template(doctor, check_date)
+    if template is None:
+        return 0
+    
+    if booked_mask is None:
+        # Single indexed row read; without a row the appointments are read instead
+        free_mask = DoctorDayAvailability.objects.filter(
+            doctor=doctor, date=check_date
+        ).values_list('free_mask', flat=True).first()
+        if free_mask is None:
+            free_mask = template.full_mask & ~get_booked_mask(doctor, check_date)
+        available = free_mask
+    else:
+        available = template.full_mask & ~booked_mask
     
-    booked_slots = []
-    for appointment in appointments:
-        if hasattr(appointment.slot, 'strftime'):
-            booked_slots.append(appointment.slot.strftime("%H:%M"))
-        else:
-            booked_slots.append(str(appointment.slot))
+    # Slots held by other patients are not offered
+    if held_mask is None:
+        doctor_id = getattr(doctor, 'pk', doctor)
+        held_mask = get_held_masks([doctor_id], check_date, check_date, patient).get((doctor_id, check_date), 0)
+    available &= ~held_mask
     
-    return booked_slots
+    # If checking today, also filter out past slots
+    if check_date == date.today():
+        available &= template.mask_after(current_minute())
+    
+    return available
 
-def get_available_slots(doctor, check_date: date) -> List[str]:
+def get_available_slots(doctor, check_date: date, patient=None) -> List[str]:
     """
     Get available time slots for a doctor on a specific date
     
     Args:
         doctor: Doctor instance
         check_date: Date to check
+        patient: Patient asking; their own holds stay available to them
         
     Returns:
         List[str]: List of available time slots in "HH:MM" format
     """
-    # Generate all possible slots for the date
-    all_slots = generate_daily_slots(check_date)
+    template = get_doctor_template(doctor, check_date)
+    if template is None:
+        return []
+    return template.labels_for(get_available_mask(doctor, check_date, patient=patient))
+
+# -------------------------
+# SLOT CACHE
+# -------------------------
+
+# Per doctor/day availability for /api/slots/, kept in the "slots" cache. Each
+# doctor/day has a version key; entries live under the current version, and
+# invalidation bumps it after commit, so a reader that raced a write can only
+# store its stale entry under a version nobody will read again.
+SLOT_CACHE_ALIAS = 'slots'
+SLOT_CACHE_SECONDS = getattr(settings, 'SLOT_CACHE_SECONDS', 3600)
+
+# Counters of this process, reported by /api/slots/cache-stats/
+slot_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+def _slot_version_key(doctor_id: int, check_date: date) -> str:
+    return f"slots:{doctor_id}:{check_date.isoformat()}"
+
+def _slot_entry_timeout(check_date: date) -> int:
+    """Seconds until the end of the entry's day, capped at SLOT_CACHE_SECONDS."""
+    end_of_day = timezone.make_aware(datetime.combine(check_date + timedelta(days=1), time.min))
+    return max(1, min(SLOT_CACHE_SECONDS, int((end_of_day - timezone.now()).total_seconds())))
+
+def load_day_slots(doctor_id: int, check_date: date) -> tuple:
+    """
+    Read what the slot cache stores for a doctor/day (two indexed queries, three without a materialized row)
     
-    # Get booked slots
-    booked_slots = get_booked_slots(doctor, check_date)
+    Returns:
+        tuple: (free mask, ((patient_id, slot minute, expiry epoch), ...))
+    """
+    free_mask = DoctorDayAvailability.objects.filter(
+        doctor_id=doctor_id, date=check_date
+    ).values_list('free_mask', flat=True).first()
+    if free_mask is None:
+        free_mask = compute_day_availability(doctor_id, get_booked_mask(doctor_id, check_date), check_date)[0]
+    holds = tuple(
+        (patient_id, slot_to_minutes(slot), expires_at.timestamp())
+        for patient_id, slot, expires_at in SlotHold.objects.filter(
+            doctor_id=doctor_id, date=check_date, expires_at__gt=timezone.now()
+        ).values_list('patient_id', 'slot', 'expires_at')
+    )
+    return free_mask, holds
+
+def get_cached_available_slots(doctor, check_date: date, patient=None) -> List[str]:
+    """
+    get_available_slots() served from the slot cache
     
-    # Return slots that are not booked
-    available = [slot for slot in all_slots if slot not in booked_slots]
+    Holds and today's past slots are applied when reading, so an entry stays
+    valid as holds expire and the day goes by; only bookings and hold changes
+    invalidate it.
     
-    # If checking today, also filter out past slots
+    Args:
+        doctor: Doctor instance or id
+        check_date: Date to check
+        patient: Patient asking; their own holds stay available to them
+        
+    Returns:
+        List[str]: List of available time slots in "HH:MM" format
+    """
+    template = get_doctor_template(doctor, check_date)
+    if template is None:
+        return []
+    
+    cache = caches[SLOT_CACHE_ALIAS]
+    doctor_id = getattr(doctor, 'pk', doctor)
+    version_key = _slot_version_key(doctor_id, check_date)
+    version = cache.get(version_key)
+    entry = cache.get(f"{version_key}:{version}") if version is not None else None
+    
+    if entry is None:
+        slot_cache_stats['misses'] += 1
+        if version is None:
+            # A fresh, never reused version in case the old key was evicted
+            cache.add(version_key, time_ns(), None)
+            version = cache.get(version_key)
+        entry = load_day_slots(doctor_id, check_date)
+        cache.set(f"{version_key}:{version}", entry, _slot_entry_timeout(check_date))
+    else:
+        slot_cache_stats['hits'] += 1
+    
+    available, holds = entry
+    patient_id = getattr(patient, 'pk', patient)
+    now = epoch_seconds()
+    for holder_id, minute, expires in holds:
+        bit = template.bit_of.get(minute)
+        if expires > now and holder_id != patient_id and bit is not None:
+            available &= ~(1 << bit)
     if check_date == date.today():
-        current_time = timezone.now().time()
-        available = [slot for slot in available if datetime.strptime(slot, "%H:%M").time() > current_time]
+        available &= template.mask_after(current_minute())
+    return template.labels_for(available)
+
+def invalidate_day_slots(doctor_id: int, check_date) -> None:
+    """
+    Drop the cached slots of a doctor/day once the current transaction commits
     
-    return available
+    Args:
+        doctor_id: Doctor id
+        check_date: Date (or "YYYY-MM-DD" string)
+    """
+    version_key = _slot_version_key(doctor_id, as_date(check_date))
+    
+    def bump():
+        slot_cache_stats['invalidations'] += 1
+        try:
+            caches[SLOT_CACHE_ALIAS].incr(version_key)
+        except ValueError:
+            pass  # nothing cached for this day
+    transaction.on_commit(bump)
 
-def validate_slot(slot_str: str, check_date: date) -> time:
+def get_booked_masks(doctor_ids, start_date: date, end_date: date) -> Dict[tuple, int]:
+    """
+    Get booked masks for many doctors over a date range in one query
+    
+    Args:
+        doctor_ids: Iterable of doctor ids
+        start_date: First date (inclusive)
+        end_date: Last date (inclusive)
+        
+    Returns:
+        Dict[tuple, int]: Booked mask keyed by (doctor_id, date); days without bookings are absent
+    """
+    doctor_ids = list(doctor_ids)
+    load_schedules(doctor_ids)
+    rows = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        date__range=(start_date, end_date)
+    ).exclude(status='cancelled').values_list('doctor_id', 'date', 'slot')
+    return fold_slot_masks(rows)
+
+def get_availability_grid(doctor_ids, start_date: date, end_date: date, patient=None) -> tuple:
+    """
+    Get free slots for a doctor x day grid
+    
+    Doctors may work different hours, so every row is aligned to the union of
+    all slot times in the grid.
+    
+    Args:
+        doctor_ids: Iterable of doctor ids
+        start_date: First date (inclusive)
+        end_date: Last date (inclusive)
+        patient: Patient asking; their own holds stay available to them
+        
+    Returns:
+        tuple: ("HH:MM" column labels, {doctor_id: one "1"=free/"0"=not bookable string per day})
+    """
+    doctor_ids = list(doctor_ids)
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    booked = get_booked_masks(doctor_ids, start_date, end_date)
+    held = get_held_masks(doctor_ids, start_date, end_date, patient)
+    
+    cells, columns = {}, set()
+    for doctor_id in doctor_ids:
+        row = []
+        for day in days:
+            template = get_doctor_template(doctor_id, day)
+            if template is None:
+                row.append((None, 0))
+                continue
+            columns.update(template.minutes)
+            row.append((template, get_available_mask(
+                doctor_id, day, booked_mask=booked.get((doctor_id, day), 0), held_mask=held.get((doctor_id, day), 0)
+            )))
+        cells[doctor_id] = row
+    
+    columns = sorted(columns)
+    position = {minute: i for i, minute in enumerate(columns)}
+    grid = {}
+    for doctor_id, row in cells.items():
+        strings = []
+        for template, mask in row:
+            chars = ['0'] * len(columns)
+            if template is not None:
+                for bit, minute in enumerate(template.minutes):
+                    if mask >> bit & 1:
+                        chars[position[minute]] = '1'
+            strings.append(''.join(chars))
+        grid[doctor_id] = strings
+    
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in columns], grid
+
+def as_date(value) -> date:
+    """Accept a date or a "YYYY-MM-DD" string (as assigned by some views before save)."""
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    return value
+
+def compute_day_availability(doctor_id: int, booked_mask: int, check_date: date) -> tuple:
+    """
+    Free mask and free count to materialize for a doctor/day
+    
+    Args:
+        doctor_id: Doctor id
+        booked_mask: Booked slots as a mask of the doctor's template for the day
+        check_date: Date the mask belongs to
+        
+    Returns:
+        tuple: (free_mask, free_count); days off have nothing free
+    """
+    template = get_doctor_template(doctor_id, check_date)
+    if template is None:
+        return 0, 0
+    free_mask = template.full_mask & ~booked_mask
+    return free_mask, bin(free_mask).count('1')
+
+def refresh_day_availability(doctor_id: int, check_date, create: bool = True) -> None:
+    """
+    Recompute the materialized availability row for one doctor/day from its appointments
+    
+    The row is locked before the appointments are read, so concurrent refreshes
+    of the same day run one after the other and the last one sees every
+    committed booking instead of overwriting it with an older mask.
+    
+    Args:
+        doctor_id: Doctor id
+        check_date: Date to refresh
+        create: Insert the row if missing; deletes pass False so a cascading
+            doctor delete can't re-create rows for the doctor being removed
+    """
+    check_date = as_date(check_date)
+    with transaction.atomic():
+        if create:
+            # Placeholder values, overwritten below; get_or_create handles a concurrent insert
+            DoctorDayAvailability.objects.get_or_create(
+                doctor_id=doctor_id, date=check_date, defaults={'free_mask': 0, 'free_count': 0}
+            )
+        row = DoctorDayAvailability.objects.select_for_update().filter(doctor_id=doctor_id, date=check_date).first()
+        if row is None:
+            return
+        row.free_mask, row.free_count = compute_day_availability(
+            doctor_id, get_booked_mask(doctor_id, check_date), check_date
+        )
+        row.save(update_fields=['free_mask', 'free_count', 'updated_at'])
+
+def refresh_availability_bulk(days) -> None:
+    """
+    Recompute materialized availability for many doctor/days after writes that
+    skip signals (bulk_create, queryset.update) or a schedule change
+    
+    Args:
+        days: Iterable of (doctor_id, date) pairs
+    """
+    days = set(days)
+    if not days:
+        return
+    dates = [day for _, day in days]
+    doctor_ids = {doctor_id for doctor_id, _ in days}
+    with transaction.atomic():
+        # Lock the existing rows first, as refresh_day_availability does, so a concurrent refresh can't interleave
+        list(DoctorDayAvailability.objects.select_for_update().filter(
+            doctor_id__in=doctor_ids, date__range=(min(dates), max(dates))
+        ).order_by('doctor_id', 'date').values_list('id', flat=True))
+        booked = get_booked_masks(doctor_ids, min(dates), max(dates))
+        rows = []
+        for doctor_id, day in days:
+            free_mask, free_count = compute_day_availability(doctor_id, booked.get((doctor_id, day), 0), day)
+            rows.append(DoctorDayAvailability(doctor_id=doctor_id, date=day, free_mask=free_mask,
+                                              free_count=free_count, updated_at=timezone.now()))
+        DoctorDayAvailability.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['doctor', 'date'],
+            update_fields=['free_mask', 'free_count', 'updated_at'],
+        )
+    for doctor_id, day in days:
+        invalidate_day_slots(doctor_id, day)
+
+def doctors_with_free_slots(check_date: date):
+    """
+    Doctors that work on a date and still have at least one free slot
+    
+    Args:
+        check_date: Date to check
+        
+    Returns:
+        QuerySet: Doctor queryset (empty on holidays); doctors on leave or not
+            accepting appointments are left out
+    """
+    if is_holiday(check_date):
+        return Doctor.objects.none()
+    weekday = check_date.weekday()
+    works = Exists(DoctorSchedule.objects.filter(doctor=OuterRef('pk'), weekday=weekday))
+    if weekday < 5:
+        # Doctors without a schedule work the default Monday-Friday week
+        works = works | ~Exists(DoctorSchedule.objects.filter(doctor=OuterRef('pk')))
+    # Doctors without a row have no bookings that day, so only full days are excluded
+    full_days = DoctorDayAvailability.objects.filter(date=check_date, free_count=0).values('doctor_id')
+    on_leave = DoctorLeave.objects.filter(start_date__lte=check_date, end_date__gte=check_date).values('doctor_id')
+    return Doctor.objects.filter(works, available=True).exclude(id__in=full_days).exclude(id__in=on_leave)
+
+def validate_slot(slot_str: str, check_date: date, doctor=None) -> time:
     """
     Validate if a slot is valid for the given date
     
     Args:
         slot_str: Time slot in "HH:MM" format
         check_date: Date to validate against
+        doctor: Doctor instance or id whose schedule applies (defaults to hospital hours)
         
     Returns:
         time: Validated time object
@@ -148,13 +841,14 @@ def validate_slot(slot_str: str, check_date: date) -> time:
         raise SlotError("Invalid time format. Use HH:MM format.")
     
     # Check if it's a working day
-    if not is_working_day(check_date):
+    template = get_doctor_template(doctor, check_date)
+    if template is None:
+        if doctor is not None and not is_holiday(check_date) and is_on_leave(doctor, check_date):
+            raise SlotError("Doctor is on leave on the selected date.")
         raise SlotError("Selected date is not a working day.")
     
-    # Get all valid slots for the date
-    valid_slots = generate_daily_slots(check_date)
-    
-    if slot_str not in valid_slots:
+    # Check the slot against the day template
+    if slot_to_minutes(slot_time) not in template.bit_of:
         raise SlotError("Slot is not within working hours or is during lunch break.")
     
     # If it's today, check if the slot is not in the past
@@ -189,7 +883,7 @@ def get_working_hours() -> dict:
         'slot_duration': SLOT_DURATION_MINUTES
     }
 
-def is_slot_available(doctor, check_date: date, slot_str: str) -> bool:
+def is_slot_available(doctor, check_date: date, slot_str: str, patient=None) -> bool:
     """
     Check if a specific slot is available for a doctor
     
@@ -197,45 +891,99 @@ def is_slot_available(doctor, check_date: date, slot_str: str) -> bool:
         doctor: Doctor instance
         check_date: Date to check
         slot_str: Time slot in "HH:MM" format
+        patient: Patient asking; their own holds stay available to them
         
     Returns:
         bool: True if slot is available, False otherwise
     """
     try:
-        validate_slot(slot_str, check_date)
-        available_slots = get_available_slots(doctor, check_date)
-        return slot_str in available_slots
+        slot_time = validate_slot(slot_str, check_date, doctor)
     except SlotError:
         return False
+    
+    bit = get_doctor_template(doctor, check_date).bit_of[slot_to_minutes(slot_time)]
+    return bool(get_available_mask(doctor, check_date, patient=patient) >> bit & 1)
 
-def get_next_available_slot(doctor, start_date: Optional[date] = None, days_ahead: int = 30) -> Optional[dict]:
+def find_first_available(doctor_ids, start_date: Optional[date] = None, days_ahead: int = 30,
+                         patient=None) -> Optional[dict]:
     """
-    Find the next available slot for a doctor starting from a given date
+    Find the earliest free slot among several doctors
+    
+    All bookings in the horizon are loaded with one range query and the
+    calendar is then walked in memory, so the cost doesn't grow with the
+    number of fully booked days.
     
     Args:
-        doctor: Doctor instance
+        doctor_ids: Iterable of doctor ids, in tie-break order
         start_date: Date to start searching from (defaults to today)
         days_ahead: How many days ahead to search
+        patient: Patient asking; their own holds stay available to them
         
     Returns:
-        dict: Next available slot info or None if no slots found
+        dict: Slot info including 'doctor_id', or None if no slots found
     """
     if start_date is None:
         start_date = date.today()
+    doctor_ids = list(doctor_ids)
+    if not doctor_ids or days_ahead <= 0:
+        return None
+    
+    end_date = start_date + timedelta(days=days_ahead - 1)
+    booked = get_booked_masks(doctor_ids, start_date, end_date)
+    held = get_held_masks(doctor_ids, start_date, end_date, patient)
     
-    for i in range(days_ahead):
-        check_date = start_date + timedelta(days=i)
-        available_slots = get_available_slots(doctor, check_date)
+    # Holiday (and, for a single doctor, leave) runs are jumped over in one lookup
+    skip_for = doctor_ids[0] if len(doctor_ids) == 1 else None
+    check_date = start_date - timedelta(days=1)
+    while True:
+        check_date = next_day_in(skip_for, check_date + timedelta(days=1))
+        if check_date > end_date:
+            break
         
-        if available_slots:
+        best = None  # (minute, doctor_id)
+        for doctor_id in doctor_ids:
+            template = get_doctor_template(doctor_id, check_date)
+            if template is None:
+                continue
+            mask = get_available_mask(doctor_id, check_date, booked_mask=booked.get((doctor_id, check_date), 0),
+                                      held_mask=held.get((doctor_id, check_date), 0))
+            if mask:
+                # Lowest set bit = earliest free slot of the doctor's day
+                minute = template.minutes[(mask & -mask).bit_length() - 1]
+                if best is None or minute < best[0]:
+                    best = (minute, doctor_id)
+        
+        if best is not None:
+            slot = f"{best[0] // 60:02d}:{best[0] % 60:02d}"
             return {
+                'doctor_id': best[1],
                 'date': check_date.strftime("%Y-%m-%d"),
-                'slot': available_slots[0],
-                'datetime': f"{check_date.strftime('%Y-%m-%d')} {available_slots}"
+                'slot': slot,
+                'datetime': f"{check_date.strftime('%Y-%m-%d')} {slot}"
             }
     
     return None
 
+def get_next_available_slot(doctor, start_date: Optional[date] = None, days_ahead: int = 30,
+                            patient=None) -> Optional[dict]:
+    """
+    Find the next available slot for a doctor starting from a given date
+    
+    Args:
+        doctor: Doctor instance or id
+        start_date: Date to start searching from (defaults to today)
+        days_ahead: How many days ahead to search
+        patient: Patient asking; their own holds stay available to them
+        
+    Returns:
+        dict: Next available slot info or None if no slots found
+    """
+    doctor_id = getattr(doctor, 'pk', doctor)
+    result = find_first_available([doctor_id], start_date, days_ahead, patient)
+    if result:
+        del result['doctor_id']
+    return result
+
 def format_appointment_datetime(appointment_date: date, slot_time: str) -> str:
     """
     Format appointment date and time for display
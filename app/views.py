@@ -7,10 +7,11 @@ from rest_framework import status, permissions, generics, filters
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
-from .models import User, Appointment, Document, Doctor, Patient, VisitNote, Profile
+from .models import User, Appointment, Document, Doctor, Patient, VisitNote, Profile, DoctorSchedule, DoctorLeave, Holiday, WaitlistEntry
 from .serializers import (
     AppointmentSerializer, DoctorSerializer, DocumentSerializer, 
-    UserSerializer, ProfileSerializer, PatientSerializer, VisitNoteSerializer
+    UserSerializer, ProfileSerializer, PatientSerializer, VisitNoteSerializer,
+    DoctorScheduleSerializer, DoctorLeaveSerializer, HolidaySerializer, WaitlistEntrySerializer
 )
 from django.contrib.auth import get_user_model
 from datetime import datetime, time, timedelta, date
@@ -22,7 +23,39 @@ import os
 from dotenv import load_dotenv
 from .prompts import DOCTOR_SYSTEM_PROMPT, PATIENT_SYSTEM_PROMPT, HISTORY_SUMMARY_INSTRUCTION
 from .ai_groq import chat_with_groq
+from .utils import (
+    get_availability_grid, find_first_available,
+    doctors_with_free_slots, SlotError, get_cached_available_slots, slot_cache_stats, SLOT_CACHE_ALIAS
+)
+from .heatmap import specialization_heatmap, HEATMAP_MAX_DAYS
+from .dashboards import (
+    load_patient_records, load_prescription_records, appointment_buckets, prescription_entries, past_window_start,
+    older_than_cursor
+)
+from .pagination import KeysetPagination
+from .changes import conditional_on_changes
+from .sync import change_querysets, collect_changes, encode_since, decode_since
+from .documents import track_upload_metadata, uploaded_file_metadata
+from .rows import appointment_values, appointment_rows, iter_document_rows
+from .renderers import StreamingJSONResponse
+from .events import (
+    hub, events_after, latest_event_id, format_sse, issue_stream_ticket, redeem_stream_ticket,
+    EVENT_HEARTBEAT_SECONDS, EVENT_RETRY_MS, STREAM_TICKET_SECONDS
+)
+from .booking import (
+    book_appointment, hold_slot, release_hold, SlotConflict, read_appointment_rows, import_appointments
+)
 from django.db import IntegrityError
+from django.db.models import Case, OuterRef, Q, Subquery, TextField, Value, When
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+import asyncio
+from itertools import chain
+from django.utils.decorators import method_decorator
+from rest_framework.utils.urls import replace_query_param
 
 load_dotenv()
 
@@ -38,6 +71,12 @@ class IsPatient(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.profile.role == "patient"
 
+def current_patient(request):
+    """The Patient row for the requesting user, or None for doctors and other roles"""
+    if request.user.profile.role != "patient":
+        return None
+    return Patient.objects.filter(profile=request.user.profile).first()
+
 # -----------------------------
 # Pagination
 # -----------------------------
@@ -47,6 +86,11 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = "page_size"
     max_page_size = 100
 
+def older_appointments_link(request, since):
+    """URL of the first /api/appointments/ page before a dashboard's past window"""
+    url = request.build_absolute_uri(reverse("appointment-list-create"))
+    return replace_query_param(url, KeysetPagination.cursor_query_param, older_than_cursor(since))
+
 # ---------------------------
 # AUTHENTICATION
 # ---------------------------
@@ -189,120 +233,150 @@ class LoginView(APIView):
 class DoctorDashboardView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(conditional_on_changes("doctor-dashboard", daily=True))
     def get(self, request):
         if request.user.profile.role != "doctor":
             return Response({"error": "Only doctors can access"}, status=403)
 
         today = date.today()
+        since = past_window_start(request.query_params.get("past_days"), today)
 
         try:
             doctor = Doctor.objects.get(profile=request.user.profile)
         except Doctor.DoesNotExist:
             return Response({"error": "Doctor profile not found"}, status=404)
 
-        appointments = Appointment.objects.filter(doctor=doctor).order_by("date", "slot")
-
-        today_appts, upcoming, past = [], [], []
-
-        for appt in appointments:
-            patient_name = appt.patient.profile.user.get_full_name() or appt.patient.profile.user.username
-            slot_time = appt.slot if isinstance(appt.slot, str) else appt.slot.strftime("%H:%M")
-
-            # Get prescription from visit note or appointment
-            prescription = ""
-            try:
-                visit_note = VisitNote.objects.filter(appointment=appt).first()
-                if visit_note and visit_note.notes:
-                    prescription = visit_note.notes
-                elif appt.prescription:
-                    prescription = appt.prescription
-            except:
-                pass
-
-            item = {
-                "id": appt.id,
-                "date": appt.date.strftime("%Y-%m-%d"),
-                "time": slot_time,
-                "patient_name": patient_name,
-                "status": appt.status,
-                "prescription": prescription
+        # One query for today, the future and the past window: patient names via joins and the
+        # prescription as the latest non-empty visit note, else the appointment's own. Rows come
+        # today and upcoming first (oldest first), then the past newest first, so the past list
+        # can be streamed straight from the cursor.
+        latest_note = VisitNote.objects.filter(
+            appointment=OuterRef("pk")
+        ).exclude(notes="").order_by("-visit_date", "-id").values("notes")[:1]
+        past_row = Q(date__lt=today)
+        appointments = Appointment.objects.filter(doctor=doctor, date__gte=since).annotate(
+            prescription_text=Coalesce(Subquery(latest_note), "prescription", Value(""), output_field=TextField()),
+            is_past=Case(When(past_row, then=Value(1)), default=Value(0)),
+        ).order_by(
+            "is_past",
+            *(Case(When(~past_row, then=field)).asc() for field in ("date", "slot", "id")),
+            "-date", "-slot", "-id",
+        ).values(
+            "id", "date", "slot", "status", "prescription_text",
+            "patient__profile__user__first_name",
+            "patient__profile__user__last_name",
+            "patient__profile__user__username",
+        )
+
+        def item(appt):
+            full_name = f'{appt["patient__profile__user__first_name"]} {appt["patient__profile__user__last_name"]}'.strip()
+            return {
+                "id": appt["id"],
+                "date": appt["date"].strftime("%Y-%m-%d"),
+                "time": appt["slot"].strftime("%H:%M"),
+                "patient_name": full_name or appt["patient__profile__user__username"],
+                "status": appt["status"],
+                "prescription": appt["prescription_text"]
             }
 
-            if appt.date == today:
-                today_appts.append(item)
-            elif appt.date > today:
-                upcoming.append(item)
+        rows = appointments.iterator(chunk_size=500)
+        today_appts, upcoming, first_past = [], [], None
+        for appt in rows:
+            if appt["date"] == today:
+                today_appts.append(item(appt))
+            elif appt["date"] > today:
+                upcoming.append(item(appt))
             else:
-                past.append(item)
+                first_past = appt
+                break
+        past = map(item, chain([first_past], rows)) if first_past is not None else iter(())
 
-        return Response({
+        return StreamingJSONResponse({
             "doctor_name": request.user.get_full_name() or request.user.username,
             "specialization": doctor.specialization,
             "today": today_appts,
             "upcoming": upcoming,
-            "past": past
-        })
+            "past": past,
+            "past_since": since.isoformat(),
+            "past_next": older_appointments_link(request, since)
+        }, request=request)
 
 class PatientDashboardView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(conditional_on_changes("patient-dashboard", daily=True))
     def get(self, request):
         if request.user.profile.role != "patient":
             return Response({"error": "Only patients can access"}, status=403)
 
-        today = date.today()
-        
         try:
             patient = Patient.objects.get(profile=request.user.profile)
         except Patient.DoesNotExist:
             return Response({"error": "Patient profile not found"}, status=404)
 
-        appointments = Appointment.objects.filter(patient=patient).order_by("date", "slot")
-        
-        today_appts, upcoming, past = [], [], []
-
-        for appt in appointments:
-            doctor_name = appt.doctor.profile.user.get_full_name() or appt.doctor.profile.user.username
-            slot_time = appt.slot if isinstance(appt.slot, str) else appt.slot.strftime("%H:%M")
-            
-            # Get prescription from visit note or appointment
-            prescription = ""
-            try:
-                visit_note = VisitNote.objects.filter(appointment=appt).first()
-                if visit_note and visit_note.notes:
-                    prescription = visit_note.notes
-                elif appt.prescription:
-                    prescription = appt.prescription
-            except:
-                pass
-
-            item = {
-                "id": appt.id,
-                "date": appt.date.strftime("%Y-%m-%d"),
-                "time": slot_time,
-                "doctor_name": doctor_name,
-                "specialization": appt.doctor.specialization,
-                "status": appt.status,
-                "prescription": prescription
-            }
-
-            if appt.date == today:
-                today_appts.append(item)
-            elif appt.date > today:
-                upcoming.append(item)
-            else:
-                past.append(item)
-
-        # Get documents
-        documents = Document.objects.filter(patient=patient).order_by('-uploaded_at')
-        documents_data = DocumentSerializer(documents, many=True, context={'request': request}).data
+        # Appointments, notes and documents are read once; every section is derived from them
+        since = past_window_start(request.query_params.get("past_days"))
+        appointments, notes, documents = load_patient_records(patient, since=since)
+        today_appts, upcoming, past = appointment_buckets(appointments, notes)
+        # The window only limits "past"; prescriptions cover the whole history
+        older_appointments, older_notes = load_prescription_records(patient, before=since)
+        documents_data = DocumentSerializer(
+            documents, many=True, context={'request': request, 'include_file_size': False}
+        ).data
 
         return Response({
             "patient_name": request.user.get_full_name() or request.user.username,
             "today": today_appts,
             "upcoming": upcoming,
             "past": past,
-            "documents": documents_data
+            "past_since": since.isoformat(),
+            "past_next": older_appointments_link(request, since),
+            "documents": documents_data,
+            "prescriptions": prescription_entries(older_appointments + appointments, older_notes + notes)
+        })
+
+class ChangesView(APIView):
+    """Appointments, visit notes and documents changed or deleted since a cursor, for incremental dashboard sync"""
+    permission_classes = [IsAuthenticated]
+
+    @method_decorator(conditional_on_changes("changes"))
+    def get(self, request):
+        since = request.query_params.get("since")
+        try:
+            since = decode_since(since) if since else None
+        except ValueError:
+            return Response({"error": "Invalid since cursor"}, status=400)
+
+        role = request.user.profile.role
+        if role == "doctor":
+            doctor = Doctor.objects.filter(profile=request.user.profile).first()
+            if doctor is None:
+                return Response({"error": "Doctor profile not found"}, status=404)
+            querysets = change_querysets(doctor=doctor)
+        elif role == "patient":
+            patient = current_patient(request)
+            if patient is None:
+                return Response({"error": "Patient profile not found"}, status=404)
+            querysets = change_querysets(patient=patient)
+        else:
+            return Response({"error": "Invalid user role"}, status=403)
+
+        querysets["appointments"] = AppointmentSerializer.setup_eager_loading(querysets["appointments"])
+        if since is None:
+            # A first sync has nothing to remove
+            del querysets["deleted"]
+        rows, position, has_more = collect_changes(querysets, since)
+        deleted = {"appointments": [], "visit_notes": [], "documents": []}
+        for record in rows.get("deleted", []):
+            deleted[record.kind].append(record.object_id)
+        context = {"request": request}
+        return Response({
+            "cursor": encode_since(position),
+            "has_more": has_more,
+            "appointments": AppointmentSerializer(rows["appointments"], many=True, context=context).data,
+            "visit_notes": VisitNoteSerializer(rows["visit_notes"], many=True, context=context).data,
+            "documents": DocumentSerializer(rows["documents"], many=True, context=context).data,
+            "deleted": deleted,
         })
 
 # ---------------------------
@@ -318,8 +392,10 @@ class UserListCreateView(APIView):
             queryset = User.objects.filter(profile__role=role)
         else:
             queryset = User.objects.all()
-        serializer = UserSerializer(queryset, many=True)
-        return Response(serializer.data)
+        # Streamed row by row; the full list is never held in memory
+        serializer = UserSerializer()
+        users = map(serializer.to_representation, queryset.iterator(chunk_size=2000))
+        return StreamingJSONResponse(users, request=request)
 
     def post(self, request):
         serializer = UserSerializer(data=request.data)
@@ -353,21 +429,39 @@ class UserDetailView(APIView):
 # DOCTOR SEARCH
 # ---------------------------
 
-class DoctorListView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+def filter_doctors(params):
+    """Doctor queryset filtered by the ?specialization= / ?available= / ?doctor_ids= / ?free_on= query params"""
+    specialization = params.get("specialization")
+    available = params.get("available")
+    doctor_ids = params.get("doctor_ids")
+    free_on = params.get("free_on")
 
-    def get(self, request):
-        specialization = request.query_params.get("specialization")
-        available = request.query_params.get("available")
+    queryset = Doctor.objects.select_related("profile__user").all()
 
-        queryset = Doctor.objects.select_related("profile__user").all()
+    if specialization:
+        queryset = queryset.filter(specialization__icontains=specialization)
 
-        if specialization:
-            queryset = queryset.filter(specialization__icontains=specialization)
+    if available:
+        available_bool = available.lower() == "true"
+        queryset = queryset.filter(available=available_bool)
 
-        if available:
-            available_bool = available.lower() == "true"
-            queryset = queryset.filter(available=available_bool)
+    if doctor_ids:
+        queryset = queryset.filter(id__in=[i for i in doctor_ids.split(",") if i.strip().isdigit()])
+
+    if free_on:
+        try:
+            free_date = datetime.strptime(free_on, "%Y-%m-%d").date()
+        except ValueError:
+            return queryset.none()
+        queryset = queryset.filter(id__in=doctors_with_free_slots(free_date).values("id"))
+
+    return queryset
+
+class DoctorListView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        queryset = filter_doctors(request.query_params)
 
         doctors = []
         for doc in queryset:
@@ -385,11 +479,88 @@ class DoctorListView(APIView):
 def get_doctors_by_specialization(request):
     specialization = request.GET.get('specialization')
     if specialization:
-        doctors = Doctor.objects.filter(specialization__icontains=specialization)
-        serializer = DoctorSerializer(doctors, many=True)
+        fields = DoctorSerializer.selected_fields(request)
+        doctors = DoctorSerializer.setup_eager_loading(
+            Doctor.objects.filter(specialization__icontains=specialization), fields
+        )
+        serializer = DoctorSerializer(doctors, many=True, fields=fields)
         return Response(serializer.data)
     return Response([])
 
+class DoctorScheduleView(APIView):
+    """
+    GET the requesting doctor's weekly schedule; PUT a list of weekday entries to
+    replace it (an empty list restores the default Monday-Friday hours).
+    """
+    permission_classes = [IsDoctor]
+
+    def get(self, request):
+        doctor = get_object_or_404(Doctor, profile=request.user.profile)
+        serializer = DoctorScheduleSerializer(doctor.schedules.all(), many=True)
+        return Response({"custom": bool(serializer.data), "schedule": serializer.data})
+
+    def put(self, request):
+        doctor = get_object_or_404(Doctor, profile=request.user.profile)
+        entries = request.data if isinstance(request.data, list) else request.data.get("schedule", [])
+
+        serializer = DoctorScheduleSerializer(data=entries, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        weekdays = [entry["weekday"] for entry in serializer.validated_data]
+        if len(weekdays) != len(set(weekdays)):
+            return Response({"error": "Each weekday can only appear once"}, status=400)
+
+        with transaction.atomic():
+            doctor.schedules.all().delete()
+            for entry in serializer.validated_data:
+                DoctorSchedule.objects.create(doctor=doctor, **entry)
+
+        return Response({
+            "custom": bool(weekdays),
+            "schedule": DoctorScheduleSerializer(doctor.schedules.all(), many=True).data
+        })
+
+class DoctorLeaveView(APIView):
+    """
+    GET the requesting doctor's current and upcoming leave; POST a
+    {start_date, end_date, reason} range to add one; DELETE /<pk>/ to cancel it.
+    Existing appointments inside a new leave are kept and reported back so
+    they can be rescheduled.
+    """
+    permission_classes = [IsDoctor]
+
+    def get(self, request):
+        doctor = get_object_or_404(Doctor, profile=request.user.profile)
+        leaves = doctor.leaves.filter(end_date__gte=date.today())
+        return Response(DoctorLeaveSerializer(leaves, many=True).data)
+
+    def post(self, request):
+        doctor = get_object_or_404(Doctor, profile=request.user.profile)
+        serializer = DoctorLeaveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        leave = serializer.save(doctor=doctor)
+        affected = Appointment.objects.filter(
+            doctor=doctor, date__range=(leave.start_date, leave.end_date)
+        ).exclude(status__in=["cancelled", "completed"]).values_list("id", flat=True)
+        return Response({**serializer.data, "affected_appointments": list(affected)}, status=201)
+
+    def delete(self, request, pk=None):
+        doctor = get_object_or_404(Doctor, profile=request.user.profile)
+        leave = get_object_or_404(DoctorLeave, pk=pk, doctor=doctor)
+        leave.delete()
+        return Response(status=204)
+
+class HolidayListView(APIView):
+    """Upcoming hospital holidays (managed in the admin)."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        holidays = Holiday.objects.filter(end_date__gte=date.today())
+        return Response(HolidaySerializer(holidays, many=True).data)
+
 # ---------------------------
 # DOCUMENT MANAGEMENT
 # ---------------------------
@@ -406,6 +577,8 @@ class DocumentUploadView(APIView):
         except Patient.DoesNotExist:
             return Response({"error": "Patient profile not found"}, status=404)
 
+        # Size, type and checksum are taken from the body as it is parsed
+        track_upload_metadata(request._request)
         document_file = request.FILES.get("document")
         if not document_file:
             return Response({"error": "No document provided"}, status=400)
@@ -427,7 +600,8 @@ class DocumentUploadView(APIView):
                 file=document_file,
                 doc_type=doc_type,
                 description=description,
-                appointment=appointment
+                appointment=appointment,
+                **uploaded_file_metadata(request._request, "document", document_file)
             )
 
             serializer = DocumentSerializer(document, context={'request': request})
@@ -439,6 +613,7 @@ class DocumentUploadView(APIView):
         except Exception as e:
             return Response({"error": f"Upload failed: {str(e)}"}, status=500)
 
+    @method_decorator(conditional_on_changes("documents"))
     def get(self, request):
         """Get all documents for the current user"""
         if request.user.profile.role == "patient":
@@ -458,12 +633,13 @@ class DocumentUploadView(APIView):
         else:
             return Response({"error": "Invalid user role"}, status=403)
 
-        serializer = DocumentSerializer(documents, many=True, context={'request': request})
-        return Response(serializer.data)
+        fields = DocumentSerializer.selected_fields(request)
+        return StreamingJSONResponse(iter_document_rows(documents, request, fields=fields), request=request)
 
 class PatientDocumentsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(conditional_on_changes("patient-documents"))
     def get(self, request, patient_id=None):
         """Get documents for a specific patient"""
         
@@ -491,11 +667,12 @@ class PatientDocumentsView(APIView):
         else:
             return Response({"error": "Invalid user role"}, status=403)
 
-        serializer = DocumentSerializer(documents, many=True, context={'request': request})
-        return Response(serializer.data)
+        fields = DocumentSerializer.selected_fields(request)
+        return StreamingJSONResponse(iter_document_rows(documents, request, fields=fields), request=request)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_on_changes("patient-documents-by-username")
 def get_patient_documents(request, username):
     """Get all documents for a specific patient by username"""
     if request.user.profile.role != "doctor":
@@ -510,25 +687,29 @@ def get_patient_documents(request, username):
         if not appointments.exists():
             return Response({"error": "You haven't treated this patient"}, status=403)
 
-        documents = Document.objects.filter(patient=patient).order_by('-uploaded_at')
-        
-        document_list = []
-        for doc in documents:
-            document_list.append({
+        documents = Document.objects.filter(patient=patient).select_related(
+            'appointment__doctor__profile__user'
+        ).order_by('-uploaded_at')
+
+        def document_item(doc):
+            return {
                 "id": doc.id,
                 "file_url": doc.file.url if doc.file else None,
                 "file_name": doc.file.name.split('/')[-1] if doc.file else None,
+                "file_size": doc.file_size,
+                "content_type": doc.content_type or None,
+                "checksum": doc.checksum or None,
                 "doc_type": doc.get_doc_type_display(),
                 "description": doc.description or "",
                 "uploaded_at": doc.uploaded_at.strftime("%Y-%m-%d %H:%M"),
                 "appointment_id": doc.appointment.id if doc.appointment else None,
                 "doctor_name": doc.appointment.doctor.profile.user.get_full_name() if doc.appointment else None
-            })
+            }
 
-        return Response({
+        return StreamingJSONResponse({
             "patient_name": patient.profile.user.get_full_name() or patient.profile.user.username,
-            "documents": document_list
-        })
+            "documents": map(document_item, documents.iterator(chunk_size=2000))
+        }, request=request)
 
     except User.DoesNotExist:
         return Response({"error": "Patient not found"}, status=404)
@@ -537,38 +718,6 @@ def get_patient_documents(request, username):
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
-# ---------------------------
-# SLOT UTILS
-# ---------------------------
-
-def generate_daily_slots():
-    slots = []
-    start = time(10, 0)
-    end = time(18, 0)
-    current = datetime.combine(datetime.today(), start)
-    end_dt = datetime.combine(datetime.today(), end)
-    lunch_start = time(13, 0)
-    lunch_end = time(14, 0)
-
-    while current < end_dt:
-        slot_time = current.time()
-        if not (lunch_start <= slot_time < lunch_end):
-            slots.append(slot_time.strftime("%H:%M"))
-        current += timedelta(minutes=30)
-    return slots
-
-def get_booked_slots(doctor, date):
-    appointments = Appointment.objects.filter(
-        doctor=doctor,
-        date=date
-    ).exclude(status='cancelled')
-    return [a.slot.strftime("%H:%M") if hasattr(a.slot, 'strftime') else str(a.slot) for a in appointments]
-
-def get_available_slots(doctor, date):
-    all_slots = generate_daily_slots()
-    booked = get_booked_slots(doctor, date)
-    return [s for s in all_slots if s not in booked]
-
 # ---------------------------
 # APPOINTMENT CRUD
 # ---------------------------
@@ -590,24 +739,246 @@ class AvailableSlotsView(APIView):
         except ValueError:
             return Response({"error": "Invalid date"}, status=400)
 
-        available = get_available_slots(doctor, date)
+        if not doctor.available:
+            return Response([])
+
+        available = get_cached_available_slots(doctor, date, patient=current_patient(request))
         return Response(available)
 
+class SlotCacheStatsView(APIView):
+    """Hit/miss/invalidation counters of the slot cache in the worker serving the request (staff only)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        lookups = slot_cache_stats["hits"] + slot_cache_stats["misses"]
+        return Response({
+            **slot_cache_stats,
+            "hit_rate": round(slot_cache_stats["hits"] / lookups, 4) if lookups else None,
+            "backend": settings.CACHES[SLOT_CACHE_ALIAS]["BACKEND"],
+            "pid": os.getpid(),
+        })
+
+class SlotHoldView(APIView):
+    """
+    POST {doctor_id, date, slot} reserves a slot for SLOT_HOLD_TTL_SECONDS while the
+    patient completes the booking; DELETE with the same fields releases it.
+    """
+    permission_classes = [IsPatient]
+
+    def parse(self, request):
+        doctor_id = request.data.get("doctor_id")
+        date_str = request.data.get("date")
+        slot_str = request.data.get("slot")
+        if not all([doctor_id, date_str, slot_str]):
+            raise SlotError("doctor_id, date and slot are required")
+        try:
+            hold_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        except ValueError:
+            raise SlotError("Invalid date format. Use YYYY-MM-DD")
+        doctor = get_object_or_404(Doctor, id=doctor_id)
+        return doctor, hold_date, slot_str
+
+    def post(self, request):
+        patient = current_patient(request)
+        if patient is None:
+            return Response({"error": "Patient profile not found"}, status=404)
+        try:
+            doctor, hold_date, slot_str = self.parse(request)
+            hold = hold_slot(patient, doctor, hold_date, slot_str)
+        except SlotConflict as e:
+            return Response({"error": str(e), "available_slots": e.available_slots}, status=409)
+        except SlotError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({
+            "doctor_id": doctor.id,
+            "date": hold_date.strftime("%Y-%m-%d"),
+            "slot": hold.slot.strftime("%H:%M"),
+            "expires_at": hold.expires_at
+        }, status=201)
+
+    def delete(self, request):
+        patient = current_patient(request)
+        if patient is None:
+            return Response({"error": "Patient profile not found"}, status=404)
+        try:
+            doctor, hold_date, slot_str = self.parse(request)
+        except SlotError as e:
+            return Response({"error": str(e)}, status=400)
+        release_hold(patient, doctor, hold_date, slot_str)
+        return Response(status=204)
+
+class AvailabilityGridView(APIView):
+    """
+    Free slots for many doctors over a date range, e.g.
+    /api/slots/grid/?specialization=Cardiology&start=2025-01-06&days=14
+    or ?doctor_ids=1,2,3&start=...&end=...
+
+    Each doctor gets one string per day, aligned with "slots": "1" = free, "0" = taken
+    or outside that doctor's hours. Doctors not accepting appointments are left out.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_days = 31
+
+    def get(self, request):
+        if not request.query_params.get("specialization") and not request.query_params.get("doctor_ids"):
+            return Response({"error": "specialization or doctor_ids required"}, status=400)
+
+        try:
+            start = datetime.strptime(request.query_params.get("start", ""), "%Y-%m-%d").date() \
+                if request.query_params.get("start") else date.today()
+            if request.query_params.get("end"):
+                end = datetime.strptime(request.query_params["end"], "%Y-%m-%d").date()
+            else:
+                end = start + timedelta(days=int(request.query_params.get("days", 7)) - 1)
+        except ValueError:
+            return Response({"error": "Invalid date range"}, status=400)
+
+        if end < start:
+            return Response({"error": "end must not be before start"}, status=400)
+        if (end - start).days + 1 > self.max_days:
+            return Response({"error": f"Date range is limited to {self.max_days} days"}, status=400)
+
+        # Doctors not accepting appointments have nothing bookable, like in doctors_with_free_slots()
+        doctors = list(filter_doctors(request.query_params).filter(available=True))
+        slots, grid = get_availability_grid([doc.id for doc in doctors], start, end, patient=current_patient(request))
+
+        return Response({
+            "start": start.strftime("%Y-%m-%d"),
+            "end": end.strftime("%Y-%m-%d"),
+            "slots": slots,
+            "doctors": [
+                {
+                    "id": doc.id,
+                    "name": doc.profile.user.get_full_name() or doc.profile.user.username,
+                    "specialization": doc.specialization,
+                    "availability": grid[doc.id],
+                }
+                for doc in doctors
+            ]
+        })
+
+class AvailabilityHeatmapView(APIView):
+    """
+    Staff capacity heatmap: open vs total slots per specialization per day, e.g.
+    /api/slots/heatmap/?start=2025-01-06&days=90 (optionally &specialization=Cardiology).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            start = datetime.strptime(request.query_params["start"], "%Y-%m-%d").date() \
+                if request.query_params.get("start") else date.today()
+            days = int(request.query_params.get("days", HEATMAP_MAX_DAYS))
+        except ValueError:
+            return Response({"error": "Invalid start or days"}, status=400)
+
+        if days < 1 or days > HEATMAP_MAX_DAYS:
+            return Response({"error": f"days must be between 1 and {HEATMAP_MAX_DAYS}"}, status=400)
+
+        return Response(specialization_heatmap(start, days, request.query_params.get("specialization")))
+
+class NextAvailableSlotView(APIView):
+    """
+    Earliest free slot for one doctor (?doctor_id=) or across every doctor
+    of a specialization (?specialization=), searching ?days= ahead from ?start=.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_days = 90
+
+    def get(self, request):
+        doctor_id = request.query_params.get("doctor_id")
+        specialization = request.query_params.get("specialization")
+
+        if not doctor_id and not specialization:
+            return Response({"error": "doctor_id or specialization required"}, status=400)
+
+        try:
+            start = datetime.strptime(request.query_params["start"], "%Y-%m-%d").date() \
+                if request.query_params.get("start") else date.today()
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            return Response({"error": "Invalid start or days"}, status=400)
+
+        if start < date.today():
+            start = date.today()
+        days = max(1, min(days, self.max_days))
+
+        if doctor_id:
+            doctors = [get_object_or_404(Doctor.objects.select_related("profile__user"), id=doctor_id)]
+            if not doctors[0].available:
+                return Response({"error": "Doctor is not accepting appointments"}, status=404)
+        else:
+            doctors = list(filter_doctors({"specialization": specialization, "available": "true"}).order_by("id"))
+
+        result = find_first_available([doc.id for doc in doctors], start, days, patient=current_patient(request))
+        if result is None:
+            return Response({"error": f"No available slots in the next {days} days"}, status=404)
+
+        doctor = next(doc for doc in doctors if doc.id == result["doctor_id"])
+        result["doctor_name"] = doctor.profile.user.get_full_name() or doctor.profile.user.username
+        result["specialization"] = doctor.specialization
+        return Response(result)
+
+class WaitlistView(APIView):
+    """
+    Patients join a waitlist for a doctor (doctor_id) or any doctor of a
+    specialization over a date window instead of polling /api/slots/. A slot
+    freed by a cancellation goes to the first waiter: booked outright when
+    auto_book is set, otherwise held for them as an offer to confirm by booking
+    it. GET lists the patient's entries, DELETE /<pk>/ leaves the waitlist.
+    """
+    permission_classes = [IsPatient]
+
+    def get(self, request):
+        patient = get_object_or_404(Patient, profile=request.user.profile)
+        entries = patient.waitlist_entries.order_by("-created_at")
+        return Response(WaitlistEntrySerializer(entries, many=True).data)
+
+    def post(self, request):
+        patient = get_object_or_404(Patient, profile=request.user.profile)
+        serializer = WaitlistEntrySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        doctor = serializer.validated_data.get("doctor")
+        if doctor is not None and not doctor.available:
+            return Response({"error": "Doctor is not accepting appointments"}, status=400)
+
+        entry = serializer.save(patient=patient)
+        return Response(WaitlistEntrySerializer(entry).data, status=201)
+
+    def delete(self, request, pk=None):
+        patient = get_object_or_404(Patient, profile=request.user.profile)
+        entry = get_object_or_404(WaitlistEntry, pk=pk, patient=patient)
+        if entry.status not in ("waiting", "offered"):
+            return Response({"error": f"Waitlist entry is already {entry.status}"}, status=400)
+
+        if entry.status == "offered":
+            # Declines the offer: frees the held slot and passes it on to the next waiter
+            release_hold(patient, entry.offered_doctor, entry.offered_date, entry.offered_slot.strftime("%H:%M"))
+        WaitlistEntry.objects.filter(pk=entry.pk).update(status="cancelled")
+        return Response(status=204)
+
 class AppointmentListCreateView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         if request.user.profile.role == "doctor":
             doctor = Doctor.objects.get(profile=request.user.profile)
-            appts = Appointment.objects.filter(doctor=doctor).order_by("-date", "-slot")
+            appts = Appointment.objects.filter(doctor=doctor)
         elif request.user.profile.role == "patient":
             patient = Patient.objects.get(profile=request.user.profile)
-            appts = Appointment.objects.filter(patient=patient).order_by("-date", "-slot")
+            appts = Appointment.objects.filter(patient=patient)
         else:
-            appts = Appointment.objects.all().order_by("-date", "-slot")
+            appts = Appointment.objects.all()
 
-        serializer = AppointmentSerializer(appts, many=True, context={'request': request})
-        return Response(serializer.data)
+        # Newest first, one keyset page at a time; follow "next" for older appointments
+        paginator = KeysetPagination()
+        # ?fields= / ?exclude= pick the output fields; the rest are neither selected nor computed
+        fields = AppointmentSerializer.selected_fields(request)
+        page = paginator.paginate_queryset(appointment_values(appts, fields), request, view=self)
+        return paginator.get_paginated_response(appointment_rows(page, request, fields))
 
     def post(self, request):
         if request.user.profile.role != "patient":
@@ -645,51 +1016,74 @@ class AppointmentListCreateView(APIView):
         if appointment_date < date.today():
             return Response({"error": "Cannot book appointments in the past"}, status=400)
 
-        available_slots = get_available_slots(doctor_obj, appointment_date)
-        if slot_str not in available_slots:
+        allow_alternate = str(request.data.get("allow_alternate", "")).lower() in ("1", "true", "yes")
+
+        try:
+            appointment = book_appointment(
+                patient_obj, doctor_obj, appointment_date, slot_str,
+                allow_alternate=allow_alternate
+            )
+        except SlotConflict as e:
+            return Response({
+                "error": str(e),
+                "available_slots": e.available_slots,
+                "requested_slot": slot_str
+            }, status=409)
+        except SlotError as e:
             return Response({
-                "error": "Slot not available",
-                "available_slots": available_slots,
+                "error": f"Slot not available: {e}",
                 "requested_slot": slot_str
             }, status=400)
 
-        existing_booking = Appointment.objects.filter(
-            doctor=doctor_obj,
-            date=appointment_date,
-            slot=slot_str,
-            status__in=['booked', 'confirmed']
-        ).exclude(status='cancelled').first()
+        appointment = AppointmentSerializer.setup_eager_loading(Appointment.objects).get(pk=appointment.pk)
+        serializer = AppointmentSerializer(appointment, context={'request': request})
+        return Response({
+            "message": "Appointment booked successfully",
+            "appointment": serializer.data
+        }, status=201)
 
-        if existing_booking:
-            return Response({
-                "error": "Slot is already booked by another patient",
-                "available_slots": available_slots
-            }, status=400)
+class BulkAppointmentImportView(APIView):
+    """
+    Staff-only bulk import. Accepts a JSON list (or {"appointments": [...]}) in the body,
+    or a .csv/.json upload in "file". Rows need doctor_id, patient_id, date, slot and may
+    carry a status. ?dry_run=true validates without writing.
+    """
+    permission_classes = [permissions.IsAdminUser]
 
+    def post(self, request):
+        upload = request.FILES.get("file")
         try:
-            appointment = Appointment.objects.create(
-                doctor=doctor_obj,
-                patient=patient_obj,
-                date=appointment_date,
-                slot=slot_str,
-                status="booked"
-            )
+            if upload:
+                fmt = upload.name.rsplit(".", 1)[-1].lower()
+                rows = read_appointment_rows(upload.read(), fmt)
+            elif isinstance(request.data, list):
+                rows = request.data
+            else:
+                rows = request.data.get("appointments")
+                if not isinstance(rows, list):
+                    return Response({"error": "Provide a list of appointments or a CSV/JSON file"}, status=400)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({"error": f"Could not read import: {e}"}, status=400)
 
-            serializer = AppointmentSerializer(appointment, context={'request': request})
-            return Response({
-                "message": "Appointment booked successfully",
-                "appointment": serializer.data
-            }, status=201)
+        dry_run = request.query_params.get("dry_run", "").lower() == "true"
+        report = import_appointments(rows, dry_run=dry_run)
+        errors = [r for r in report if r["status"] == "error"]
 
-        except Exception as e:
-            return Response({"error": f"Failed to create appointment: {str(e)}"}, status=500)
+        return Response({
+            "total": len(report),
+            "created": sum(1 for r in report if r["status"] == "created"),
+            "valid": sum(1 for r in report if r["status"] == "valid"),
+            "failed": len(errors),
+            "dry_run": dry_run,
+            "results": report
+        }, status=200)
 
 class AppointmentDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
         try:
-            appointment = Appointment.objects.get(pk=pk)
+            appointment = AppointmentSerializer.setup_eager_loading(Appointment.objects).get(pk=pk)
             
             # Check if user has permission to view this appointment
             if (request.user.profile.role == "patient" and appointment.patient.profile.user != request.user) or \
@@ -758,6 +1152,7 @@ class AppointmentDetailView(APIView):
                     return Response({"error": "Doctor not found"}, status=404)
 
             appointment.save()
+            appointment = AppointmentSerializer.setup_eager_loading(Appointment.objects).get(pk=appointment.pk)
             serializer = AppointmentSerializer(appointment, context={'request': request})
             return Response({
                 "message": "Appointment updated successfully",
@@ -847,6 +1242,7 @@ def update_appointment(request, pk):
                 return Response({"error": "Doctor not found"}, status=404)
 
         appointment.save()
+        appointment = AppointmentSerializer.setup_eager_loading(Appointment.objects).get(pk=appointment.pk)
         serializer = AppointmentSerializer(appointment, context={'request': request})
         return Response({
             "message": "Appointment updated successfully",
@@ -1001,6 +1397,105 @@ class SavePrescriptionView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
+# ---------------------------
+# PUSH EVENTS
+# ---------------------------
+
+async def stream_user(request):
+    """
+    (user, ('doctor'|'patient', id)) for an event stream request, or (None, None).
+    EventSource can't set headers, so browsers pass a single-use ?ticket= from
+    /api/events/ticket/ instead; the API token itself is only read from the header.
+    """
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Token "):
+        token = await Token.objects.select_related("user__profile").filter(key=header[len("Token "):].strip()).afirst()
+        user = token.user if token is not None else None
+    elif request.GET.get("ticket"):
+        user = await redeem_stream_ticket(request.GET["ticket"])
+    else:
+        user = None
+    if user is None or not user.is_active:
+        return None, None
+
+    role = user.profile.role
+    model = Doctor if role == "doctor" else Patient
+    member_id = await model.objects.filter(profile=user.profile).values_list("id", flat=True).afirst()
+    if member_id is None:
+        return None, None
+    return user, (role, member_id)
+
+class EventStreamTicketView(APIView):
+    """A single-use ticket for opening /api/events/?ticket=... with EventSource"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        ticket = issue_stream_ticket(request.user)
+        return Response({"ticket": ticket.key, "expires_in": STREAM_TICKET_SECONDS}, status=201)
+
+async def stream_backlog(last_event_id, member):
+    """
+    Opening messages of an event stream and the ids they replayed: the retry
+    delay, then the events missed since Last-Event-ID, or for a new stream an
+    id-only message telling EventSource where it starts.
+    """
+    messages = [f"retry: {EVENT_RETRY_MS}\n\n"]
+    if last_event_id is None:
+        messages.append(f"id: {await sync_to_async(latest_event_id)()}\n\n")
+        return messages, set()
+    missed = await sync_to_async(events_after)(last_event_id, **member)
+    messages.extend(format_sse(event) for event in missed)
+    return messages, {event["id"] for event in missed}
+
+async def appointment_event_stream(request):
+    """
+    Server-sent events for the requesting doctor's or patient's appointments
+    (appointment.created / cancelled / completed / rescheduled).
+
+    Under ASGI the connection stays open and is fed by the worker's EventHub.
+    Under WSGI it sends the missed events and closes, and EventSource
+    reconnects after the retry delay, which degrades to polling.
+    """
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    user, key = await stream_user(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+
+    role, member_id = key
+    member = {"doctor_id": member_id} if role == "doctor" else {"patient_id": member_id}
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID") or request.GET["last_event_id"])
+    except (KeyError, ValueError):
+        last_event_id = None
+
+    if not isinstance(request, ASGIRequest):
+        messages, _ = await stream_backlog(last_event_id, member)
+        return HttpResponse("".join(messages), content_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    async def stream():
+        # Subscribe before reading the backlog so nothing falls between the two
+        queue = hub.subscribe(key)
+        try:
+            messages, replayed = await stream_backlog(last_event_id, member)
+            for message in messages:
+                yield message
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["id"] not in replayed:
+                    yield format_sse(event)
+        finally:
+            hub.unsubscribe(key, queue)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 # ---------------------------
 # AI FEATURES
 # ---------------------------
@@ -1194,6 +1689,7 @@ class ChatbotView(APIView):
 class PatientPrescriptionsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(conditional_on_changes("prescriptions"))
     def get(self, request):
         """Get all prescriptions for the current patient"""
         if request.user.profile.role != "patient":
@@ -1201,56 +1697,8 @@ class PatientPrescriptionsView(APIView):
 
         try:
             patient = Patient.objects.get(profile=request.user.profile)
-            
-            # Get all appointments with prescriptions
-            appointments = Appointment.objects.filter(
-                patient=patient
-            ).exclude(prescription__isnull=True).exclude(prescription__exact='')
-            
-            # Get all visit notes with prescriptions
-            visit_notes = VisitNote.objects.filter(patient=patient)
-            
-            prescriptions = []
-            
-            # Add appointment prescriptions
-            for apt in appointments:
-                if apt.prescription:
-                    prescriptions.append({
-                        'id': f'apt_{apt.id}',
-                        'type': 'prescription',
-                        'content': apt.prescription,
-                        'date': apt.date,
-                        'doctor_name': apt.doctor.profile.user.get_full_name() or apt.doctor.profile.user.username,
-                        'appointment_id': apt.id,
-                        'created_at': apt.created_at
-                    })
-            
-            # Add visit note prescriptions
-            for note in visit_notes:
-                if note.notes:
-                    prescriptions.append({
-                        'id': f'note_{note.id}',
-                        'type': 'visit_note',
-                        'content': note.notes,
-                        'date': note.appointment.date if note.appointment else None,
-                        'doctor_name': note.doctor.profile.user.get_full_name() or note.doctor.profile.user.username,
-                        'appointment_id': note.appointment.id if note.appointment else None,
-                        'created_at': note.visit_date
-                    })
-                    
-                if note.prescription:  # File prescription
-                    prescriptions.append({
-                        'id': f'file_{note.id}',
-                        'type': 'prescription_file',
-                        'file_url': note.prescription.url if note.prescription else None,
-                        'date': note.appointment.date if note.appointment else None,
-                        'doctor_name': note.doctor.profile.user.get_full_name() or note.doctor.profile.user.username,
-                        'appointment_id': note.appointment.id if note.appointment else None,
-                        'created_at': note.visit_date
-                    })
-            
-            # Sort by date (newest first)
-            prescriptions.sort(key=lambda x: x['created_at'], reverse=True)
+            appointments, notes, _ = load_patient_records(patient, with_documents=False)
+            prescriptions = prescription_entries(appointments, notes)
             
             return Response({
                 'prescriptions': prescriptions,
@@ -1261,72 +1709,3 @@ class PatientPrescriptionsView(APIView):
             return Response({"error": "Patient profile not found"}, status=404)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
-
-# Update the existing PatientDashboardView to include prescriptions
-class PatientDashboardView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def get(self, request):
-        if request.user.profile.role != "patient":
-            return Response({"error": "Only patients can access"}, status=403)
-
-        today = date.today()
-        
-        try:
-            patient = Patient.objects.get(profile=request.user.profile)
-        except Patient.DoesNotExist:
-            return Response({"error": "Patient profile not found"}, status=404)
-
-        appointments = Appointment.objects.filter(patient=patient).order_by("date", "slot")
-        
-        today_appts, upcoming, past = [], [], []
-
-        for appt in appointments:
-            doctor_name = appt.doctor.profile.user.get_full_name() or appt.doctor.profile.user.username
-            slot_time = appt.slot if isinstance(appt.slot, str) else appt.slot.strftime("%H:%M")
-            
-            # Get prescription from visit note or appointment
-            prescription = ""
-            try:
-                visit_note = VisitNote.objects.filter(appointment=appt).first()
-                if visit_note and visit_note.notes:
-                    prescription = visit_note.notes
-                elif appt.prescription:
-                    prescription = appt.prescription
-            except:
-                pass
-
-            item = {
-                "id": appt.id,
-                "date": appt.date.strftime("%Y-%m-%d"),
-                "time": slot_time,
-                "doctor_name": doctor_name,
-                "specialization": appt.doctor.specialization,
-                "status": appt.status,
-                "prescription": prescription
-            }
-
-            if appt.date == today:
-                today_appts.append(item)
-            elif appt.date > today:
-                upcoming.append(item)
-            else:
-                past.append(item)
-
-        # Get documents
-        documents = Document.objects.filter(patient=patient).order_by('-uploaded_at')
-        documents_data = DocumentSerializer(documents, many=True, context={'request': request}).data
-
-        # Get prescriptions separately
-        prescriptions_view = PatientPrescriptionsView()
-        prescriptions_response = prescriptions_view.get(request)
-        prescriptions_data = prescriptions_response.data.get('prescriptions', []) if prescriptions_response.status_code == 200 else []
-
-        return Response({
-            "patient_name": request.user.get_full_name() or request.user.username,
-            "today": today_appts,
-            "upcoming": upcoming,
-            "past": past,
-            "documents": documents_data,
-            "prescriptions": prescriptions_data  # Add prescriptions to response
-        })
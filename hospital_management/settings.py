@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
+from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -89,6 +91,35 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# "slots" holds per doctor/day availability for /api/slots/. The file backend is
+# shared by every worker process on the host, so signal invalidation reaches all
+# of them; point SLOT_CACHE_BACKEND at Redis/Memcached when running on several hosts.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "slots": {
+        "BACKEND": config("SLOT_CACHE_BACKEND", default="django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": config(
+            "SLOT_CACHE_LOCATION", default=os.path.join(tempfile.gettempdir(), "hospital_management_slots")
+        ),
+        "TIMEOUT": 3600,
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    },
+    "changes": {
+        "BACKEND": config("CHANGE_CACHE_BACKEND", default="django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": config(
+            "CHANGE_CACHE_LOCATION", default=os.path.join(tempfile.gettempdir(), "hospital_management_changes")
+        ),
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -137,11 +168,24 @@ from decouple import config
 GROQ_API_KEY = config("GROQ_API_KEY", default="")
 GROQ_MODEL = config("GROQ_MODEL", default="llama3-70b-8192")
 
+# Seconds a slot stays reserved while a patient completes a booking
+SLOT_HOLD_TTL_SECONDS = config("SLOT_HOLD_TTL_SECONDS", default=300, cast=int)
+
+# Seconds a waitlisted patient has to confirm a freed slot offered to them
+WAITLIST_OFFER_TTL_SECONDS = config("WAITLIST_OFFER_TTL_SECONDS", default=900, cast=int)
+
+# Upper bound on how long a cached slot list lives (entries also expire at the end of their day)
+SLOT_CACHE_SECONDS = config("SLOT_CACHE_SECONDS", default=3600, cast=int)
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ]
 }